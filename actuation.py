@@ -0,0 +1,165 @@
+import math
+import time
+import threading
+from startup import lazy_import
+from metrics import Histogram
+
+# Proportional steering: instead of picking left/right/straight once per vision frame, the vision
+# loop sets a steering command in [-1, 1] (negative left, positive right) and a thread turns it
+# into key pulses at a fixed rate, PWM on A/D. Every [steering] period_ms the steering key is held
+# for |command| of the period and W for the rest of it, the same keys left()/right()/straight()
+# press, so a command of 1 steers like right() and 0 drives like straight(). The steering then
+# has the thread's resolution whatever the vision FPS.
+
+
+def steering_command(m1, m2, config):
+    """
+    The steering command for a pair of lane slopes, in [-1, 1], negative steers left.
+
+    Each lane's lean from vertical (degrees, positive when it runs off to the right towards the
+    horizon) is averaged and divided by [steering] full_scale_degrees. Lanes leaning the same way
+    give the same sign as decide(); a lean within the deadband is 0. Without a lane pair (a slope
+    of 0) the command is 0, like straight().
+    """
+    if m1 == 0 or m2 == 0:
+        return 0.0
+    # Image y grows downwards, so a lane running up and to the right has a negative slope
+    lean = (math.degrees(math.atan(-1 / m1)) + math.degrees(math.atan(-1 / m2))) / 2
+    command = max(-1.0, min(1.0, lean / config.steering_full_scale))
+    if abs(command) < config.steering_deadband:
+        return 0.0
+    return command
+
+
+def sleep_until(deadline, spin):
+    """
+    Waits for time.perf_counter() to reach deadline: sleeps until spin seconds before it, then
+    spins the rest. time.sleep alone can wake up a millisecond or more late (more on older
+    Windows Pythons), the spin makes up for that. The spin calls time.sleep(0), which lets other
+    threads take the GIL, so the vision thread isn't held up for a whole switch interval.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while time.perf_counter() < deadline:
+        time.sleep(0)
+
+
+class PwmSteering:
+    """
+    Turns a steering command into timed A/D and W key presses on its own thread, see the top of
+    this module. Call set() from the vision loop, close() when done.
+
+    The thread ticks at [steering] rate_hz with sleep_until; key changes happen on the ticks, so
+    pulse lengths are whole ticks. Pulses shorter than min_pulse_ms would be missed by a game that
+    reads the keyboard once per rendered frame, so the on time of a period below it is carried over
+    and added to the next period until it is long enough; the average duty stays the command.
+    When set() hasn't been called for timeout_ms (the vision loop stalled) all keys are released.
+
+    Function Args:
+    - config: The PipelineConfig to take the [steering] timing from, read once here.
+    - press, release: Called with a directkeys key code, directkeys.PressKey/ReleaseKey by default.
+    - registry: A metrics.MetricsRegistry to export the tick lateness histogram in.
+    """
+
+    def __init__(self, config, press=None, release=None, registry=None):
+        keys = lazy_import("directkeys")
+        self.throttle, self.left, self.right = keys.W, keys.A, keys.D
+        self.press = press or keys.PressKey
+        self.release = release or keys.ReleaseKey
+        self.tick = 1 / config.steering_rate
+        self.ticks_per_period = max(int(round(config.steering_period_ms / 1000 * config.steering_rate)), 1)
+        self.min_pulse_ticks = int(math.ceil(config.steering_min_pulse_ms / 1000 * config.steering_rate - 1e-9))
+        self.spin = config.steering_spin_ms / 1000
+        self.timeout = config.steering_timeout_ms / 1000
+        help = "How late the actuation thread's ticks were"
+        self.lateness = (registry.histogram("actuation_lateness_seconds", help) if registry is not None
+                         else Histogram("actuation_lateness_seconds", help))
+        self._since = self.lateness.snapshot()
+        # (command, perf_counter time it was set), replaced as a whole so the thread never sees half an update
+        self.target = (0.0, None)
+        self.held = frozenset()
+        self.carry = 0.0
+        self.carry_key = None
+        self.missed_ticks = 0
+        self.pulses = 0
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="actuation", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def set(self, command):
+        # Called by the vision loop, takes effect from the next PWM period
+        self.target = (max(-1.0, min(1.0, float(command))), time.perf_counter())
+
+    def _hold(self, keys):
+        # Presses and releases only what changed, so a steady state sends no key events at all
+        for key in self.held - keys:
+            self.release(key)
+        for key in keys - self.held:
+            self.press(key)
+        self.held = keys
+
+    def _period(self, now):
+        """
+        Plans the next PWM period from the latest command.
+        Returns the keys for the on ticks, the keys for the rest of the period and the on ticks.
+        """
+        command, updated = self.target
+        if updated is None or now - updated > self.timeout:
+            self.carry = 0.0
+            return frozenset(), frozenset(), 0
+        cruise = frozenset({self.throttle})
+        if command == 0:
+            self.carry = 0.0
+            return cruise, cruise, 0
+        key = self.right if command > 0 else self.left
+        if key != self.carry_key:
+            # On time carried over for the other key doesn't count for this one
+            self.carry = 0.0
+            self.carry_key = key
+        wanted = abs(command) * self.ticks_per_period + self.carry
+        on = min(int(wanted + 0.5), self.ticks_per_period)
+        if on < self.min_pulse_ticks:
+            on = 0
+        self.carry = min(wanted - on, max(self.min_pulse_ticks, 1))
+        return frozenset({key}), cruise, on
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        index = 0
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            self.lateness.observe((now - next_tick) * 1000)
+            if index == 0:
+                steer, cruise, on = self._period(now)
+                if on:
+                    self.pulses += 1
+            self._hold(steer if index < on else cruise)
+            index = (index + 1) % self.ticks_per_period
+            next_tick += self.tick
+            behind = time.perf_counter() - next_tick
+            if behind > 0:
+                # Fell behind (e.g. the OS didn't schedule the thread), skip the lost ticks instead of rushing them
+                lost = int(behind / self.tick) + 1
+                self.missed_ticks += lost
+                next_tick += lost * self.tick
+            sleep_until(next_tick, self.spin)
+        self._hold(frozenset())
+
+    def summary(self):
+        # Tick lateness since the last summary, for the once-a-second console line
+        p50 = self.lateness.quantile(0.5, self._since)
+        p99 = self.lateness.quantile(0.99, self._since)
+        self._since = self.lateness.snapshot()
+        return f"actuation late p50 {p50:.2f} ms, p99 {p99:.2f} ms, missed ticks {self.missed_ticks}"
+
+    def close(self):
+        # Stops the thread, which releases every key it holds
+        self._stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        else:
+            self._hold(frozenset())
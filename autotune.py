@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import hashlib
+import platform
+import argparse
+import cv2
+import numpy as np
+
+# Tuning results, one entry per machine fingerprint, so a shared folder works across PCs
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opencv_profile.json")
+
+
+def machine_fingerprint():
+    """
+    Identifies this machine and OpenCV build. A new CPU, core count or OpenCV version gets a fresh calibration.
+    """
+    info = {
+        "node": platform.node(),
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "opencv": cv2.__version__,
+    }
+    digest = hashlib.sha1(json.dumps(info, sort_keys=True).encode()).hexdigest()[:16]
+    return digest, info
+
+
+def candidate_settings():
+    """
+    Returns the (threads, optimized) pairs worth trying on this machine.
+    threads=0 runs OpenCV sequentially and -1 is OpenCV's own default.
+    """
+    cpus = os.cpu_count() or 1
+    threads = sorted(n for n in {0, 2, 4, cpus // 2, cpus} if n != 1 and n <= cpus) + [-1]
+    return [(n, optimized) for n in threads for optimized in (True, False)]
+
+
+def apply_settings(threads, optimized):
+    cv2.setUseOptimized(optimized)
+    cv2.setNumThreads(threads)
+
+
+def time_stages(frame, stages, repeat=20):
+    """
+    Times each pipeline stage on one frame and returns {stage name: median ms}.
+
+    Function Args:
+    - frame: A captured frame to benchmark on.
+    - stages: (name, function) pairs where each function takes the previous stage's output.
+    - repeat: Timed runs per stage, after one untimed run.
+    """
+    timings = {}
+    data = frame
+    for name, stage in stages:
+        result = stage(data)
+        runs = np.empty(repeat)
+        for i in range(repeat):
+            start = time.perf_counter()
+            stage(data)
+            runs[i] = (time.perf_counter() - start) * 1000
+        timings[name] = float(np.median(runs))
+        data = result
+    return timings
+
+
+def tune(frame, stages, repeat=20):
+    """
+    Benchmarks the pipeline under every candidate setting and returns the fastest as a profile dict.
+    """
+    default_threads, default_optimized = cv2.getNumThreads(), cv2.useOptimized()
+    results = []
+    for threads, optimized in candidate_settings():
+        apply_settings(threads, optimized)
+        timings = time_stages(frame, stages, repeat)
+        results.append({"threads": threads, "optimized": optimized,
+                        "total_ms": sum(timings.values()), "stages_ms": timings})
+    apply_settings(default_threads, default_optimized)
+
+    best = min(results, key=lambda r: r["total_ms"])
+    default = next(r for r in results if r["threads"] == -1 and r["optimized"])
+    return {
+        "threads": best["threads"],
+        "optimized": best["optimized"],
+        "total_ms": best["total_ms"],
+        "default_ms": default["total_ms"],
+        "frame_shape": list(frame.shape),
+        "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+
+
+def load_profiles(path=PROFILE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_profile(profile, path=PROFILE_PATH):
+    fingerprint, info = machine_fingerprint()
+    profiles = load_profiles(path)
+    profiles[fingerprint] = dict(profile, machine=info)
+    with open(path, "w") as f:
+        json.dump(profiles, f, indent=2)
+
+
+def load_or_tune(frame, stages, path=PROFILE_PATH, retune=False, repeat=20):
+    """
+    Applies this machine's cached OpenCV settings, calibrating and caching them first if there are none.
+
+    Function Args:
+    - frame: Sample frame for the calibration, ideally a real capture.
+    - stages: The pipeline stages to benchmark, e.g. main.pipeline_stages().
+    - path: Profile file shared by all machines, keyed by machine fingerprint.
+    - retune: Ignore the cached profile and calibrate again.
+    Returns:
+    - The profile dict that was applied.
+    """
+    fingerprint, _ = machine_fingerprint()
+    profile = None if retune else load_profiles(path).get(fingerprint)
+    if profile is None or list(frame.shape) != profile.get("frame_shape"):
+        print("Calibrating OpenCV threading for this machine...")
+        profile = tune(frame, stages, repeat)
+        save_profile(profile, path)
+    apply_settings(profile["threads"], profile["optimized"])
+    return profile
+
+
+def main():
+    from main import pipeline_stages
+    from dataset import synthetic_frame
+
+    parser = argparse.ArgumentParser(description="Calibrate OpenCV threading settings for this machine.")
+    parser.add_argument("--retune", action="store_true", help="Ignore the cached profile")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per stage and setting")
+    parser.add_argument("--frame", help="Screenshot to calibrate on (default: synthetic 800x600 frame)")
+    args = parser.parse_args()
+
+    frame = cv2.imread(args.frame, cv2.IMREAD_UNCHANGED) if args.frame else synthetic_frame()
+    profile = load_or_tune(frame, pipeline_stages(), retune=args.retune, repeat=args.repeat)
+
+    print(f"{'threads':>8} {'optimized':>10} {'total ms':>9}")
+    for r in sorted(profile["results"], key=lambda r: r["total_ms"]):
+        print(f"{r['threads']:>8} {str(r['optimized']):>10} {r['total_ms']:9.3f}")
+    print(f"Using {profile['threads']} threads, optimized={profile['optimized']} "
+          f"({profile['total_ms']:.3f} ms vs {profile['default_ms']:.3f} ms with OpenCV defaults)")
+
+
+if __name__ == "__main__":
+    main()
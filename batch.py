@@ -0,0 +1,98 @@
+import os
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import cv2
+from main import process_img, CONFIG
+from dataset import iter_frames
+
+# The pool already spreads frames over the cores, and a strip edge detector is one set of
+# buffers that can't be shared between threads, so batches always use the plain edge path.
+BATCH_CONFIG = CONFIG.updated({"strips": {"threads": 0}})
+
+
+def _process_frame(frame, draw=False, images=True):
+    # Draw on a copy so the caller's frames are never modified by the overlays
+    if draw:
+        frame = frame.copy()
+    processed, original, m1, m2 = process_img(frame, draw=draw, config=BATCH_CONFIG)
+    if not images:
+        return None, None, m1, m2
+    return processed, original, m1, m2
+
+
+def _init_worker():
+    # Every worker process already owns a core, so OpenCV's own thread pool would only oversubscribe
+    cv2.setNumThreads(1)
+
+
+def iter_process_frames(frames, workers=None, processes=False, draw=False, images=True, max_in_flight=None):
+    """
+    Runs process_img over many frames in parallel and yields the results in input order.
+
+    Function Args:
+    - frames: A stack of frames (N, H, W, C) or any iterable of frames.
+    - workers: Number of pool workers. Defaults to the number of CPU cores.
+    - processes: Use a process pool instead of a thread pool. Threads are enough for the OpenCV
+      stages since they release the GIL; processes also parallelise the Python lane grouping.
+    - draw: Draw the lane overlays (on a copy of each frame, the input is left untouched).
+    - images: Return the processed/original images. Turn off to only get slopes back, which
+      saves copying two images per frame between processes.
+    - max_in_flight: Frames submitted ahead of the one being returned. Defaults to 2x workers,
+      which keeps the pool busy without reading a whole recording into memory.
+    Returns:
+    - An iterator of (processed_img, original_img, m1, m2) tuples, one per input frame.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    pending = deque()
+    try:
+        for frame in frames:
+            pending.append(executor.submit(_process_frame, frame, draw, images))
+            # Hand back the oldest result once the window is full, this keeps the output ordered
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Drop queued work if the caller stops iterating early
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def process_frames(frames, workers=None, processes=False, draw=False, images=True):
+    """
+    Same as iter_process_frames but collects every result into a list.
+    """
+    return list(iter_process_frames(frames, workers=workers, processes=processes, draw=draw, images=images))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the lane pipeline over a recording using all cores.")
+    parser.add_argument("recording", help="Folder of screenshots, .npy stack or .npz file")
+    parser.add_argument("--workers", type=int, default=None, help="Pool size (default: CPU count)")
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    frame_count = 0
+    print("frame,m1,m2")
+    for _, _, m1, m2 in iter_process_frames(iter_frames(args.recording), workers=args.workers,
+                                            processes=args.processes, images=False):
+        print(f"{frame_count},{m1},{m2}")
+        frame_count += 1
+
+    elapsed_time = time.time() - start_time
+    print(f"Processed {frame_count} frames in {elapsed_time:.2f}s ({frame_count/elapsed_time:.2f} FPS)")
+
+
+if __name__ == "__main__":
+    main()
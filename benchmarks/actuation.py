@@ -0,0 +1,107 @@
+"""
+Timing of the PWM steering thread (actuation.py) for a few spin_ms settings: how late its ticks
+are, how close the key-down time comes to the commanded duty and how much CPU the thread uses.
+
+No keys are pressed, key events are recorded with their times instead. With --load the main
+thread runs process_img on a synthetic frame meanwhile, like the vision loop would, to show how
+the two share the GIL.
+
+Run from the repository root:
+    python -m benchmarks.actuation --spin 0 0.5 1 2 --load
+"""
+import io
+import time
+import argparse
+from contextlib import redirect_stdout
+from main import process_img, CONFIG
+from dataset import synthetic_frame
+from actuation import PwmSteering
+
+
+class KeyLog:
+    # Stands in for directkeys.PressKey/ReleaseKey, keeps (time, key, down) for every event
+    def __init__(self):
+        self.events = []
+
+    def press(self, key):
+        self.events.append((time.perf_counter(), key, True))
+
+    def release(self, key):
+        self.events.append((time.perf_counter(), key, False))
+
+    def held_time(self, key, start, end):
+        # Seconds the key was down between start and end
+        total, down_at = 0.0, None
+        for at, event_key, down in self.events:
+            if event_key != key:
+                continue
+            if down:
+                down_at = at
+            elif down_at is not None:
+                total += max(min(at, end) - max(down_at, start), 0)
+                down_at = None
+        if down_at is not None:
+            total += max(end - max(down_at, start), 0)
+        return total
+
+
+class TimedSteering(PwmSteering):
+    # Also measures the CPU time its thread uses
+    def _run(self):
+        start = time.thread_time()
+        super()._run()
+        self.cpu_seconds = time.thread_time() - start
+
+
+def run(config, commands, seconds, load):
+    """
+    Runs the thread for seconds per command. Returns the stopped PwmSteering (its lateness
+    histogram and missed ticks), the measured duty per command and the thread's CPU share.
+    """
+    log = KeyLog()
+    steering = TimedSteering(config, press=log.press, release=log.release)
+    frame = synthetic_frame()
+    duties = []
+    started = time.perf_counter()
+    steering.start()
+    with redirect_stdout(io.StringIO()):
+        for command in commands:
+            key = steering.right if command > 0 else steering.left
+            # Skip the first period, the command takes effect at the next period start
+            begin = time.perf_counter() + config.steering_period_ms / 1000
+            end = begin + seconds
+            while time.perf_counter() < end:
+                steering.set(command)
+                if load:
+                    process_img(frame.copy(), config=config)
+                else:
+                    time.sleep(0.01)
+            duties.append(log.held_time(key, begin, end) / seconds)
+    steering.close()
+    return steering, duties, steering.cpu_seconds / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spin", type=float, nargs="+", default=[0, 0.5, 1, 2], help="spin_ms values to compare")
+    parser.add_argument("--rate", type=int, help="rate_hz instead of the configured one")
+    parser.add_argument("--commands", type=float, nargs="+", default=[0.1, 0.3, 0.5, 0.9], help="Steering commands to hold")
+    parser.add_argument("--seconds", type=float, default=2.0, help="How long every command is held")
+    parser.add_argument("--load", action="store_true", help="Run process_img on the main thread meanwhile")
+    args = parser.parse_args()
+
+    base = CONFIG.updated({"steering": {"rate_hz": args.rate}}) if args.rate else CONFIG
+    print(f"{base.steering_rate} Hz, {base.steering_period_ms:g} ms period, {base.steering_min_pulse_ms:g} ms "
+          f"minimum pulse, {'process_img on the main thread' if args.load else 'idle main thread'}")
+    print(f"{'spin ms':>7} {'late p50':>8} {'late p99':>8} {'late max':>8} {'missed':>6} {'cpu':>5}  "
+          + " ".join(f"{f'duty {c:g}':>9}" for c in args.commands))
+    for spin in args.spin:
+        config = base.updated({"steering": {"spin_ms": spin}})
+        steering, duties, cpu = run(config, args.commands, args.seconds, args.load)
+        lateness = steering.lateness
+        print(f"{spin:7.1f} {lateness.quantile(0.5):8.3f} {lateness.quantile(0.99):8.3f} {lateness.quantile(1.0):8.3f} "
+              f"{steering.missed_ticks:6d} {cpu:5.0%}  " + " ".join(f"{duty:9.3f}" for duty in duties))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Screen capture backends compared on grab latency, replacing the scripts in
+`archieve/Screen Capture Benchmark`.
+
+Every backend grabs the same screen region into a BGR(A) NumPy array, the way the bot would use
+it. mss is timed both with one instance kept open for every grab (reuse, what capture.py does)
+and with a new instance per grab (recreate, what main.capture_screen_region and the archived
+scripts do). Runs are a fixed number of frames or a fixed duration, after a warm-up, for every
+region size given.
+
+On Linux without a display, --virtual-display starts Xvfb for the run, so the benchmark also
+works on a headless machine (the screen is then blank, the grab costs are the same).
+
+Run from the repository root:
+    python -m benchmarks.capture --sizes 800x600 800x640 1920x1080 --frames 500
+    python -m benchmarks.capture --duration 10 --backends mss --virtual-display
+"""
+import os
+import time
+import shutil
+import argparse
+import importlib
+import subprocess
+import cv2
+import numpy as np
+from capture import Region, MultiRegionCapture
+from benchmarks.common import summarize
+
+
+def mss_grabber(reuse):
+    mss = importlib.import_module("mss")
+    if not reuse:
+        def grab(x, y, width, height):
+            with mss.mss() as sct:
+                return np.array(sct.grab({"top": y, "left": x, "width": width, "height": height}))
+        return grab, None
+    sct = mss.mss()
+
+    def grab(x, y, width, height):
+        return np.asarray(sct.grab({"top": y, "left": x, "width": width, "height": height}))
+    return grab, sct.close
+
+
+def regions_grabber(reuse):
+    # The bot's own MultiRegionCapture, built once per size (mss stays open inside it)
+    captures = {}
+
+    def grab(x, y, width, height):
+        capture = captures.get((x, y, width, height))
+        if capture is None:
+            capture = captures[(x, y, width, height)] = MultiRegionCapture([Region("road", x, y, width, height)])
+        return capture.grab()["road"]
+
+    def close():
+        for capture in captures.values():
+            capture.close()
+    return grab, close
+
+
+def pyautogui_grabber(reuse):
+    pyautogui = importlib.import_module("pyautogui")
+
+    def grab(x, y, width, height):
+        # pyautogui returns RGB, the pipeline expects BGR
+        return cv2.cvtColor(np.asarray(pyautogui.screenshot(region=(x, y, width, height))), cv2.COLOR_RGB2BGR)
+    return grab, None
+
+
+def pil_grabber(reuse):
+    image_grab = importlib.import_module("PIL.ImageGrab")
+
+    def grab(x, y, width, height):
+        return cv2.cvtColor(np.asarray(image_grab.grab(bbox=(x, y, x + width, y + height))), cv2.COLOR_RGB2BGR)
+    return grab, None
+
+
+# name: (function returning (grab, close), whether reuse/recreate makes a difference)
+BACKENDS = {
+    "mss": (mss_grabber, True),
+    "regions": (regions_grabber, False),
+    "pyautogui": (pyautogui_grabber, False),
+    "pil": (pil_grabber, False),
+}
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def start_virtual_display(width, height):
+    """
+    Starts Xvfb on a free display and points DISPLAY at it. Returns the process, None when a
+    display is already there.
+    """
+    if os.environ.get("DISPLAY"):
+        return None
+    if shutil.which("Xvfb") is None:
+        raise SystemExit("--virtual-display needs Xvfb (e.g. apt install xvfb)")
+    read_fd, write_fd = os.pipe()
+    # Xvfb picks a free display number and writes it to -displayfd once it accepts connections
+    process = subprocess.Popen(["Xvfb", "-displayfd", str(write_fd), "-screen", "0", f"{width}x{height}x24",
+                                "-nolisten", "tcp"], pass_fds=[write_fd], stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        display = f.readline().strip()
+    if not display:
+        process.kill()
+        raise SystemExit("Xvfb failed to start")
+    os.environ["DISPLAY"] = f":{display}"
+    print(f"Started Xvfb on :{display} ({width}x{height})")
+    return process
+
+
+def run(grab, region, frames=None, duration=None, warmup=20):
+    """
+    Grabs the region warmup times, then frames times or for duration seconds.
+    Returns the grab times in ms.
+    """
+    for _ in range(warmup):
+        grab(*region)
+    timings = []
+    start = time.perf_counter()
+    while True:
+        before = time.perf_counter()
+        grab(*region)
+        after = time.perf_counter()
+        timings.append((after - before) * 1000)
+        if frames is not None and len(timings) >= frames:
+            break
+        if duration is not None and after - start >= duration:
+            break
+    return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--sizes", nargs="+", default=["800x600"], help="Region sizes, WIDTHxHEIGHT")
+    parser.add_argument("--origin", default="0,40", help="Top left corner of the region, x,y (main.py uses 0,40)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--frames", type=int, help="Grabs per run (default 300)")
+    mode.add_argument("--duration", type=float, help="Seconds per run instead of a number of grabs")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed grabs before every run")
+    parser.add_argument("--grabber", choices=("reuse", "recreate", "both"), default="both",
+                        help="Keep one grabber open or create one per grab (mss only)")
+    parser.add_argument("--virtual-display", action="store_true",
+                        help="Start Xvfb when there is no display (Linux), sized to fit the largest region")
+    args = parser.parse_args()
+
+    frames = args.frames if args.frames or args.duration else 300
+    x, y = (int(value) for value in args.origin.split(","))
+    sizes = [parse_size(size) for size in args.sizes]
+    xvfb = None
+    if args.virtual_display:
+        xvfb = start_virtual_display(max(w for w, _ in sizes) + x, max(h for _, h in sizes) + y)
+    modes = {"reuse": [True], "recreate": [False], "both": [True, False]}[args.grabber]
+
+    print(f"{'backend':<10} {'grabber':<9} {'size':>10} {'grabs':>6} {'fps':>8} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7}")
+    try:
+        for name in args.backends:
+            factory, reusable = BACKENDS[name]
+            for reuse in modes if reusable else [True]:
+                try:
+                    grab, close = factory(reuse)
+                except Exception as e:
+                    # Not installed, or no display it can talk to
+                    print(f"{name:<10} skipped: {e}")
+                    break
+                try:
+                    for width, height in sizes:
+                        timings = run(grab, (x, y, width, height), frames, args.duration, args.warmup)
+                        stats = summarize(timings)
+                        grabber = ("reuse" if reuse else "recreate") if reusable else "-"
+                        print(f"{name:<10} {grabber:<9} {f'{width}x{height}':>10} {len(timings):6d} "
+                              f"{1000 / timings.mean():8.1f} {stats['p50']:7.2f} {stats['p95']:7.2f} "
+                              f"{stats['p99']:7.2f} {timings.max():7.2f}")
+                except Exception as e:
+                    # e.g. a region outside the screen
+                    print(f"{name:<10} failed: {e}")
+                finally:
+                    if close is not None:
+                        close()
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+
+
+if __name__ == "__main__":
+    main()
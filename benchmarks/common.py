@@ -0,0 +1,59 @@
+import time
+import numpy as np
+
+
+def time_call(function, repeat=50, warmup=5):
+    """
+    Calls function() warmup + repeat times and returns the timed runs in milliseconds.
+    """
+    for _ in range(warmup):
+        function()
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings[i] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def summarize(timings):
+    """
+    Returns the median, p95 and p99 of a set of timings as a dict.
+    """
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {"p50": p50, "p95": p95, "p99": p99}
+
+
+def scale_vertices(vertices, width, height, base=(800, 600)):
+    """
+    Scales ROI vertices tuned for the 800x600 capture to another resolution.
+    """
+    scale = np.array([width / base[0], height / base[1]])
+    return np.round(vertices * scale).astype(np.int32)
+
+
+def bootstrap_ratio(baseline, current, resamples=2000, confidence=0.95, seed=0):
+    """
+    How much slower the current timings are than the baseline ones: the ratio of their medians,
+    with a bootstrap confidence interval.
+
+    Both are lists of rounds (runs of timings taken one after the other). The rounds are
+    resampled with replacement and then the timings within them, so the interval also covers
+    the drift between rounds, not just the spread of single timings.
+
+    Returns:
+    - (ratio, low, high), e.g. (1.2, 1.15, 1.26) for a run that is 20% slower.
+    """
+    rng = np.random.default_rng(seed)
+
+    def medians(rounds):
+        rounds = np.asarray(rounds, np.float64)
+        count, size = rounds.shape
+        picked = rng.integers(0, count, (resamples, count, 1))
+        samples = rounds[picked, rng.integers(0, size, (resamples, count, size))]
+        return np.median(samples.reshape(resamples, -1), axis=1)
+
+    ratios = medians(current) / medians(baseline)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(ratios, [tail, 100 - tail])
+    return float(np.median(current) / np.median(baseline)), float(low), float(high)
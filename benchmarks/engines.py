@@ -0,0 +1,124 @@
+"""
+Line detection engines compared on latency and accuracy over a recording.
+
+Every engine gets the same masked edge images the pipeline feeds into line detection.
+With ground-truth lane masks the accuracy is how much of the detected segments lies on a
+lane marking; without masks it is how often the steering decision matches the Hough engine.
+The bird's-eye lane finder is listed too, it replaces both line detection and draw_lanes
+so its latency covers the whole lane search.
+
+Run from the repository root:
+    python -m benchmarks.engines recording/ --masks recording_masks/
+"""
+import io
+import argparse
+import itertools
+from contextlib import redirect_stdout
+import cv2
+import numpy as np
+from main import edge_image, find_lanes, decide, CONFIG
+from line_detectors import ENGINES, available_engines
+from dataset import iter_frames, synthetic_frame
+from benchmarks.common import time_call, summarize
+
+# Segment pixels within this many pixels of a lane marking count as on the lane
+LANE_TOLERANCE = 3
+
+
+def segment_precision(segments, lane_mask):
+    # Share of the rasterised segment pixels that fall on (or right next to) a lane marking
+    if segments is None:
+        return None
+    drawn = np.zeros(lane_mask.shape, np.uint8)
+    for x1, y1, x2, y2 in segments.reshape(-1, 4).tolist():
+        cv2.line(drawn, (x1, y1), (x2, y2), 1, 1)
+    total = int(drawn.sum())
+    return float((drawn & lane_mask).sum()) / total if total else None
+
+
+def run_engine(config, edge_images, lane_masks, repeat):
+    detector = config.derived(edge_images[0].shape).line_detector
+    # Latency of the line detection stage alone, cycling through the recording
+    frames = itertools.cycle(edge_images)
+    timings = time_call(lambda: detector(next(frames), config), repeat)
+
+    decisions, precisions, segment_counts = [], [], []
+    for i, edges in enumerate(edge_images):
+        segments = detector(edges, config)
+        segment_counts.append(0 if segments is None else len(segments))
+        # draw_lanes reports frames without two lanes on stdout, keep the table readable
+        with redirect_stdout(io.StringIO()):
+            lanes = find_lanes(segments, config)
+        decisions.append(decide(lanes[2], lanes[3]) if lanes else None)
+        if lane_masks is not None:
+            precisions.append(segment_precision(segments, lane_masks[i]))
+    return timings, decisions, precisions, segment_counts
+
+
+def run_birdseye(config, edge_images, lane_masks, repeat):
+    finder = config.derived(edge_images[0].shape).birdseye
+    frames = itertools.cycle(edge_images)
+    timings = time_call(lambda: finder(next(frames)), repeat)
+
+    decisions, precisions = [], []
+    for i, edges in enumerate(edge_images):
+        lanes = finder(edges)
+        decisions.append(decide(lanes[0].slope, lanes[1].slope) if lanes else None)
+        if lane_masks is not None:
+            # The fitted curves as a chain of short segments
+            segments = None
+            if lanes:
+                segments = np.vstack([np.hstack([lane.points[:-1], lane.points[1:]]) for lane in lanes[:2]])
+            precisions.append(segment_precision(segments, lane_masks[i]))
+    # No segments, the lanes are fitted straight from the edge pixels
+    return timings, decisions, precisions, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", nargs="?", help="Folder of screenshots, .npy stack or .npz file "
+                        "(a synthetic frame is used when omitted)")
+    parser.add_argument("--masks", help="Ground-truth lane masks in the same format and order as the frames")
+    parser.add_argument("--engines", nargs="+", default=available_engines(), choices=list(ENGINES))
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    frames = list(iter_frames(args.recording)) if args.recording else [synthetic_frame()]
+    edge_images = [edge_image(frame) for frame in frames]
+    lane_masks = None
+    if args.masks:
+        kernel = np.ones((2 * LANE_TOLERANCE + 1, 2 * LANE_TOLERANCE + 1), np.uint8)
+        lane_masks = [cv2.dilate((mask.reshape(mask.shape[0], mask.shape[1], -1) > 0).any(axis=2).view(np.uint8), kernel)
+                      for mask in iter_frames(args.masks)]
+
+    print(f"{len(frames)} frames, OpenCV {cv2.__version__}")
+    print(f"{'engine':<10} {'p50 ms':>7} {'p95 ms':>7} {'segments':>9} {'lanes found':>12} "
+          f"{'same as hough':>14}" + (f" {'on lane':>8}" if lane_masks else ""))
+
+    reference = None
+    for name in ["hough"] + [name for name in args.engines if name != "hough"] + ["birdseye"]:
+        if name == "birdseye":
+            config = CONFIG.updated({"birdseye": {"enabled": True}})
+            timings, decisions, precisions, segment_counts = run_birdseye(config, edge_images, lane_masks, args.repeat)
+        else:
+            config = CONFIG.updated({"lines": {"engine": name}})
+            timings, decisions, precisions, segment_counts = run_engine(config, edge_images, lane_masks, args.repeat)
+        if reference is None:
+            reference = decisions
+        stats = summarize(timings)
+        found = np.mean([d is not None for d in decisions])
+        agreement = np.mean([d == r for d, r in zip(decisions, reference)])
+        segments = f"{np.mean(segment_counts):9.1f}" if segment_counts is not None else f"{'-':>9}"
+        row = f"{name:<10} {stats['p50']:7.2f} {stats['p95']:7.2f} {segments} {found:12.0%} {agreement:14.0%}"
+        if lane_masks:
+            scored = [p for p in precisions if p is not None]
+            row += f" {np.mean(scored):8.0%}" if scored else f" {'-':>8}"
+        print(row)
+
+    missing = [name for name in ENGINES if name not in available_engines()]
+    if missing:
+        print(f"Not available in this OpenCV build: {', '.join(missing)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Smoothing filters ([edges] filter) compared on latency and lane accuracy over a recording,
+replacing the single-image scripts in `archieve/edge and blur experiment`.
+
+Every filter runs both before Canny (on the gray image) and after it (on the edges, the original
+pipeline). The filter column is the filter stage alone; the frame column is all of process_img,
+since a filter that leaves fewer stray edges also makes line detection cheaper. With ground-truth
+lane masks the accuracy is how much of the detected segments lies on a lane marking; without
+masks it is how often the steering decision matches the configured filter's.
+
+Run from the repository root:
+    python -m benchmarks.filters recording/ --masks recording_masks/
+"""
+import io
+import argparse
+from contextlib import redirect_stdout
+import cv2
+import numpy as np
+from main import process_img, edge_image, detect_lines, find_lanes, decide, CONFIG
+from filters import POSITIONS, available_filters
+from buffers import BufferArena
+from dataset import iter_frames, synthetic_frame
+from benchmarks.common import summarize
+from benchmarks.engines import segment_precision, LANE_TOLERANCE
+
+
+def accuracy(config, frames, lane_masks):
+    # Decision, lanes found and segment precision per frame, from the same edge image process_img uses
+    decisions, precisions = [], []
+    for i, frame in enumerate(frames):
+        segments = detect_lines(edge_image(frame, config), config)
+        # draw_lanes reports frames without two lanes on stdout, keep the table readable
+        with redirect_stdout(io.StringIO()):
+            lanes = find_lanes(segments, config)
+        decisions.append(decide(lanes[2], lanes[3]) if lanes else None)
+        if lane_masks is not None:
+            precisions.append(segment_precision(segments, lane_masks[i]))
+    return decisions, precisions
+
+
+def latency(config, frames, repeat):
+    # Filter stage and whole-frame times over repeat passes through the frames
+    arena = BufferArena()
+    filter_ms, frame_ms = [], []
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            for frame in frames:
+                capture = arena.next_capture(frame.shape)
+                np.copyto(capture, frame)
+                result = process_img(capture, draw=False, config=config, buffers=arena)
+                filter_ms.append(result.stage_ms.get("blur", 0.0))
+                frame_ms.append(sum(result.stage_ms.values()))
+    return np.array(filter_ms), np.array(frame_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", nargs="?", help="Folder of screenshots, .npy stack or .npz file "
+                        "(a synthetic frame is used when omitted)")
+    parser.add_argument("--masks", help="Ground-truth lane masks in the same format and order as the frames")
+    parser.add_argument("--filters", nargs="+", default=available_filters(), choices=available_filters())
+    parser.add_argument("--kernel", type=int, nargs=2, help="blur_kernel to use instead of the configured one")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes through the frames")
+    args = parser.parse_args()
+
+    frames = [np.array(frame) for frame in iter_frames(args.recording)] if args.recording else [synthetic_frame()]
+    lane_masks = None
+    if args.masks:
+        kernel = np.ones((2 * LANE_TOLERANCE + 1, 2 * LANE_TOLERANCE + 1), np.uint8)
+        lane_masks = [cv2.dilate((mask.reshape(mask.shape[0], mask.shape[1], -1) > 0).any(axis=2).view(np.uint8), kernel)
+                      for mask in iter_frames(args.masks)]
+    # Single-threaded, so the filter's own cost is measured
+    base = CONFIG.updated({"strips": {"threads": 0}})
+    if args.kernel:
+        base = base.updated({"edges": {"blur_kernel": args.kernel}})
+
+    print(f"{len(frames)} frames, blur_kernel {list(base.blur_kernel)}, OpenCV {cv2.__version__}")
+    print(f"{'filter':<10} {'position':<8} {'filter ms':>9} {'frame p50':>9} {'frame p95':>9} {'lanes found':>12} "
+          f"{'same as ' + base.edge_filter:>16}" + (f" {'on lane':>8}" if lane_masks else ""))
+
+    reference, _ = accuracy(base, frames, lane_masks)
+    for name in args.filters:
+        for position in ["after"] if name == "none" else POSITIONS:
+            config = base.updated({"edges": {"filter": name, "filter_position": position}})
+            filter_ms, frame_ms = latency(config, frames, args.repeat)
+            decisions, precisions = accuracy(config, frames, lane_masks)
+            stats = summarize(frame_ms)
+            found = np.mean([d is not None for d in decisions])
+            agreement = np.mean([d == r for d, r in zip(decisions, reference)])
+            row = (f"{name:<10} {position if name != 'none' else '-':<8} {np.median(filter_ms):9.3f} "
+                   f"{stats['p50']:9.2f} {stats['p95']:9.2f} {found:12.0%} {agreement:16.0%}")
+            if lane_masks:
+                scored = [p for p in precisions if p is not None]
+                row += f" {np.mean(scored):8.0%}" if scored else f" {'-':>8}"
+            print(row)
+            config.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Cost of lane grouping in draw_lanes on the lines of a recording, for both lane models
+(straight vs quadratic) and both kernel backends (NumPy vs numba, when installed).
+
+Every backend is checked to give the same lanes as the NumPy kernels before it is timed, and a
+flat segment added to every frame is checked to leave the lanes as they were.
+
+Run from the repository root:
+    python -m benchmarks.lanes recording/
+"""
+import io
+import argparse
+import itertools
+from contextlib import redirect_stdout
+import numpy as np
+import lane_kernels
+from main import edge_image, detect_lines, find_lanes, CONFIG
+from dataset import iter_frames, synthetic_frame
+from benchmarks.common import time_call, summarize
+
+
+def run(lines, config):
+    # draw_lanes reports frames without two lanes on stdout, keep the table readable
+    with redirect_stdout(io.StringIO()):
+        return [find_lanes(l, config) for l in lines]
+
+
+def with_flat_segment(lines):
+    # The lines plus a horizontal segment on their lowest row, clutter Hough often finds on the
+    # road. Being on that row it doesn't move the horizon either, so the lanes must stay the same.
+    if lines is None:
+        return None
+    x, y = int(lines[..., 0::2].min()), int(lines[..., 1::2].max())
+    return np.concatenate([lines, np.array([[[x, y, x + 50, y]]], lines.dtype)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", nargs="?", help="Folder of screenshots, .npy stack or .npz file "
+                        "(a synthetic frame is used when omitted)")
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    frames = list(iter_frames(args.recording)) if args.recording else [synthetic_frame()]
+    # Lane grouping only sees the detected lines, so detect them once up front
+    lines = [detect_lines(edge_image(frame)) for frame in frames]
+    print(f"{len(frames)} frames, {np.mean([0 if l is None else len(l) for l in lines]):.1f} lines per frame")
+    if "numba" not in lane_kernels.KERNELS:
+        print("numba is not installed, only the NumPy kernels are measured")
+    print(f"{'model':<10} {'kernels':<8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'speedup':>8}")
+
+    default_backend = lane_kernels.BACKEND
+    try:
+        for model in ("straight", "quadratic"):
+            config = CONFIG.updated({"lanes": {"model": model}})
+            if repr(run([with_flat_segment(l) for l in lines], config)) != repr(run(lines, config)):
+                raise AssertionError(f"A flat segment changes the {model} lanes")
+            baseline = reference = None
+            for backend in lane_kernels.KERNELS:
+                lane_kernels.set_backend(backend)
+                lane_kernels.precompile()
+                # With a flat segment too, the kernels must leave it out of the grouping alike
+                results = run(lines + [with_flat_segment(l) for l in lines], config)
+                if reference is None:
+                    reference = results
+                elif repr(results) != repr(reference):
+                    raise AssertionError(f"The {backend} kernels give different lanes than the NumPy ones")
+
+                cycle = itertools.cycle(lines)
+                with redirect_stdout(io.StringIO()):
+                    timings = time_call(lambda: find_lanes(next(cycle), config), args.repeat)
+                stats = summarize(timings)
+                baseline = baseline or stats["p50"]
+                print(f"{model:<10} {backend:<8} {stats['p50']:7.3f} {stats['p95']:7.3f} {stats['p99']:7.3f} "
+                      f"{baseline / stats['p50']:7.2f}x")
+    finally:
+        lane_kernels.set_backend(default_backend)
+    print("All backends give identical lanes, flat segments don't change them.")
+
+
+if __name__ == "__main__":
+    main()
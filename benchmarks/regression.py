@@ -0,0 +1,183 @@
+"""
+Performance regression gate: times process_img end to end and stage by stage over a recording,
+saves the timings as a baseline, and later compares a new run of the same tree against it.
+
+Baselines are stored per machine fingerprint (CPU, core count, OpenCV version, see autotune.py)
+and pipeline config, so a run is only ever compared with one from the same machine and settings.
+A stage counts as slower when the whole bootstrap confidence interval of its median time ratio
+lies above 1 + tolerance, so noise between two runs doesn't fail the gate but a 20% slowdown does.
+compare exits with status 1 when anything is slower, for use in scripts and CI.
+
+Run from the repository root:
+    python -m benchmarks.regression record recording/      # before the change
+    python -m benchmarks.regression compare recording/     # after it
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import itertools
+from contextlib import redirect_stdout
+import cv2
+import numpy as np
+import lane_kernels
+from main import process_img, CONFIG
+from config import PipelineConfig
+from autotune import machine_fingerprint
+from buffers import BufferArena
+from dataset import iter_frames, synthetic_frame
+from benchmarks.common import bootstrap_ratio
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+# End-to-end process_img time, listed with the stages
+TOTAL = "process_img"
+
+
+def config_digest(config):
+    # Identifies a pipeline config by its values, whatever file they came from
+    return hashlib.sha1(json.dumps(config.values, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def frames_digest(frames):
+    digest = hashlib.sha1()
+    for frame in frames:
+        digest.update(str(frame.shape).encode())
+        digest.update(np.ascontiguousarray(frame).data)
+    return digest.hexdigest()[:16]
+
+
+def baseline_path(config, directory=BASELINE_DIR):
+    fingerprint, _ = machine_fingerprint()
+    return os.path.join(directory, f"{fingerprint}-{config_digest(config)}.json")
+
+
+def measure(frames, config, samples=300, rounds=5, warmup=20):
+    """
+    Runs process_img (with its overlays and the preallocated buffers, like the bot) on the frames
+    in turn and returns the per-frame timings in ms, by stage plus TOTAL, as `rounds` lists of
+    samples / rounds timings each.
+    """
+    arena = BufferArena()
+    lane_kernels.precompile()
+    timings = {}
+    cycle = itertools.cycle(frames)
+    size = max(samples // rounds, 1)
+    # draw_lanes reports frames without two lanes on stdout, keep the output readable
+    with redirect_stdout(io.StringIO()):
+        for index in range(warmup + size * rounds):
+            frame = next(cycle)
+            capture = arena.next_capture(frame.shape)
+            np.copyto(capture, frame)
+            start = time.perf_counter()
+            result = process_img(capture, config=config, buffers=arena)
+            total = (time.perf_counter() - start) * 1000
+            if index < warmup:
+                continue
+            timings.setdefault(TOTAL, []).append(total)
+            for stage, ms in result.stage_ms.items():
+                timings.setdefault(stage, []).append(ms)
+    return {stage: [ms[i * size:(i + 1) * size] for i in range(rounds)] for stage, ms in timings.items()}
+
+
+def record(frames, config, samples, rounds, path):
+    timings = measure(frames, config, samples, rounds)
+    fingerprint, machine = machine_fingerprint()
+    baseline = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "fingerprint": fingerprint,
+        "machine": machine,
+        "config": config_digest(config),
+        "config_values": config.values,
+        "frames": frames_digest(frames),
+        "frame_count": len(frames),
+        "kernels": lane_kernels.BACKEND,
+        "numpy": np.__version__,
+        "timings": timings,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f)
+    print(f"Saved {samples} frames as the baseline {path}")
+    print(f"{'stage':<12} {'p50 ms':>8} {'p95 ms':>8}")
+    for stage, ms in timings.items():
+        print(f"{stage:<12} {np.percentile(ms, 50):8.3f} {np.percentile(ms, 95):8.3f}")
+
+
+def compare(frames, config, samples, rounds, path, tolerance=0.05, min_ms=0.05, resamples=2000):
+    """
+    Times the current tree and compares every stage with the baseline. A stage is slower when its
+    interval lies above 1 + tolerance and its median grew by more than min_ms, the timer jitter
+    of the sub-0.1 ms stages is no regression.
+    Returns the names of the stages that got significantly slower.
+    """
+    if not os.path.exists(path):
+        raise SystemExit(f"No baseline for this machine and config at {path}, run `record` first")
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline["frames"] != frames_digest(frames):
+        raise SystemExit("The baseline was recorded on other frames, compare on the same recording")
+    if baseline["kernels"] != lane_kernels.BACKEND:
+        print(f"Note: the baseline used the {baseline['kernels']} lane kernels, this run uses {lane_kernels.BACKEND}")
+
+    timings = measure(frames, config, samples, rounds)
+    print(f"Baseline {path} from {baseline['created']}, {tolerance:.0%} tolerance, 95% bootstrap intervals")
+    print(f"{'stage':<12} {'base ms':>8} {'now ms':>8} {'change':>8} {'interval':>19}  verdict")
+    slower = []
+    for stage, ms in timings.items():
+        if stage not in baseline["timings"]:
+            print(f"{stage:<12} {'-':>8} {np.median(ms):8.3f} {'':>8} {'':>19}  new stage")
+            continue
+        base = baseline["timings"][stage]
+        ratio, low, high = bootstrap_ratio(base, ms, resamples)
+        if low > 1 + tolerance and np.median(ms) - np.median(base) > min_ms:
+            verdict = "SLOWER"
+            slower.append(stage)
+        elif high < 1 - tolerance and np.median(base) - np.median(ms) > min_ms:
+            verdict = "faster"
+        else:
+            verdict = "same"
+        print(f"{stage:<12} {np.median(base):8.3f} {np.median(ms):8.3f} {ratio - 1:+8.1%} "
+              f"{f'[{low - 1:+.1%}, {high - 1:+.1%}]':>19}  {verdict}")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("record", "compare"))
+    parser.add_argument("recording", nargs="?", help="Folder of screenshots, .npy stack or .npz file "
+                        "(a synthetic frame is used when omitted)")
+    parser.add_argument("--config", help="Pipeline config to use instead of pipeline.toml")
+    parser.add_argument("--frames", type=int, default=100, help="Frames of the recording to use")
+    parser.add_argument("--samples", type=int, default=300, help="Timed process_img calls")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds the samples are split into, the "
+                        "confidence intervals include the drift between them")
+    parser.add_argument("--baseline", help="Baseline file (default: benchmarks/baselines/<machine>-<config>.json)")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Slowdown that is still accepted, 0.05 = 5%%")
+    parser.add_argument("--min-ms", type=float, default=0.05, help="Smallest slowdown of a stage's median that counts")
+    parser.add_argument("--resamples", type=int, default=2000, help="Bootstrap resamples")
+    args = parser.parse_args()
+
+    config = PipelineConfig.load(args.config) if args.config else CONFIG
+    if args.recording:
+        frames = [np.array(frame) for frame in itertools.islice(iter_frames(args.recording), args.frames)]
+    else:
+        frames = [synthetic_frame()]
+    path = args.baseline or baseline_path(config)
+    print(f"{len(frames)} frames, OpenCV {cv2.__version__}, {cv2.getNumThreads()} OpenCV threads")
+
+    if args.command == "record":
+        record(frames, config, args.samples, args.rounds, path)
+        return
+    slower = compare(frames, config, args.samples, args.rounds, path, args.tolerance, args.min_ms,
+                     args.resamples)
+    if slower:
+        print(f"Regression in {', '.join(slower)}")
+        sys.exit(1)
+    print("No significant regression.")
+
+
+if __name__ == "__main__":
+    main()
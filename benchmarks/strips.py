@@ -0,0 +1,67 @@
+"""
+Strip-parallel vs single-threaded edge detection across capture resolutions.
+
+Run from the repository root:
+    python -m benchmarks.strips --threads 2 4 8
+"""
+import os
+import argparse
+import cv2
+import numpy as np
+from main import roi, CONFIG
+from strips import StripEdgeDetector
+from dataset import synthetic_frame
+from benchmarks.common import time_call, scale_vertices
+
+RESOLUTIONS = [(800, 600), (1280, 720), (1600, 900), (1920, 1080), (2560, 1440), (3840, 2160)]
+
+
+def single_threaded_edges(frame, vertices):
+    # The same steps process_img runs before the Hough transform
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, threshold1=CONFIG.canny_thresholds[0], threshold2=CONFIG.canny_thresholds[1])
+    edges = cv2.GaussianBlur(edges, CONFIG.blur_kernel, 0)
+    return roi(edges, [vertices])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"OpenCV {cv2.__version__}, {cv2.getNumThreads()} OpenCV threads, {os.cpu_count()} CPUs")
+    header = f"{'resolution':>11} {'single':>8}" + "".join(f" {f'{n} strips':>9}" for n in args.threads) + "  speedup"
+    print(header)
+
+    crossover = None
+    for width, height in RESOLUTIONS:
+        frame = synthetic_frame(width, height)
+        vertices = scale_vertices(CONFIG.roi_vertices, width, height, CONFIG.base_resolution)
+        reference = single_threaded_edges(frame, vertices)
+        single = np.median(time_call(lambda: single_threaded_edges(frame, vertices), args.repeat))
+
+        row = f"{width:>5}x{height:<5} {single:8.2f}"
+        best = single
+        for threads in args.threads:
+            with StripEdgeDetector(frame.shape, vertices, CONFIG.canny_thresholds, CONFIG.blur_kernel,
+                                   strips=threads) as detector:
+                if not np.array_equal(detector(frame), reference):
+                    raise AssertionError(f"Strip output differs from the single-threaded path at {width}x{height}")
+                timing = np.median(time_call(lambda: detector(frame), args.repeat))
+            row += f" {timing:9.2f}"
+            best = min(best, timing)
+        print(f"{row}  {single / best:6.2f}x")
+
+        if crossover is None and best < single:
+            crossover = (width, height)
+
+    print("All outputs bit-identical to the single-threaded path (times are median ms).")
+    if crossover:
+        print(f"Strips start to pay off at {crossover[0]}x{crossover[1]}.")
+    else:
+        print("Strips never beat the single-threaded path on this machine.")
+
+
+if __name__ == "__main__":
+    main()
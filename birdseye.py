@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+from lane_model import fit_polynomial, curvature
+from lane_types import Lane
+
+# Points along each fitted lane that are mapped back to the camera view for drawing
+CURVE_POINTS = 20
+
+
+class BirdseyeLaneFinder:
+    """
+    Finds the lanes in a top-down view of the road instead of voting for straight lines.
+
+    The source trapezoid is warped to a small rectangle where the lanes run (nearly) vertically.
+    The warp uses cv2.remap with fixed-point maps built once per capture size, so each frame only
+    pays for the lookups. A column histogram of the lower half finds where each lane starts,
+    windows stacked up the image follow it, and the pixels they collect are fitted with a
+    quadratic x = f(y). Curves are followed instead of being flattened into one straight line.
+
+    Calling the finder on an edge image returns (left, right, curvature) or None if it can't see both lanes:
+    - left, right: Lane objects. Their slope is taken near the car in the camera view, same sign
+      convention as draw_lanes, their points are (CURVE_POINTS, 2) int32 polylines in the camera view,
+      and their confidence is the share of search windows that found the lane.
+    - curvature: Mean signed curvature of the two lanes at the bottom of the top-down view, in 1 / pixels.
+    """
+
+    def __init__(self, source, size, windows=10, margin=15, min_pixels=20):
+        """
+        Function Args:
+        - source: Trapezoid in the camera view, [top-left, top-right, bottom-right, bottom-left].
+        - size: (width, height) of the top-down view.
+        - windows: Number of search windows stacked up each lane.
+        - margin: Half width of a search window, in top-down pixels.
+        - min_pixels: Pixels a window needs before the next window is re-centred on them.
+        """
+        self.size = tuple(size)
+        self.windows = windows
+        self.margin = margin
+        self.min_pixels = min_pixels
+
+        width, height = self.size
+        target = np.float32([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+        source = np.float32(source)
+        self.to_camera = cv2.getPerspectiveTransform(target, source)
+
+        # remap looks up, for every top-down pixel, where it comes from in the camera view.
+        # Converting the float maps to CV_16SC2 makes remap use its fast fixed-point path.
+        grid = np.mgrid[0:height, 0:width][::-1].transpose(1, 2, 0).reshape(-1, 1, 2).astype(np.float32)
+        lookup = cv2.perspectiveTransform(grid, self.to_camera).reshape(height, width, 2)
+        self.map1, self.map2 = cv2.convertMaps(lookup[..., 0], lookup[..., 1], cv2.CV_16SC2)
+
+        # Row ranges of the search windows, from the bottom of the view up
+        edges = np.linspace(height, 0, windows + 1).round().astype(int)
+        self.window_rows = list(zip(edges[1:], edges[:-1]))
+        self.sample_ys = np.linspace(0, height - 1, CURVE_POINTS)
+
+    def warp(self, edges):
+        return cv2.remap(edges, self.map1, self.map2, cv2.INTER_LINEAR)
+
+    def _follow_lane(self, ys, xs, row_starts, x):
+        # Collects the pixels of one lane, window by window from the bottom up.
+        # Returns the fit and the number of windows that had enough pixels to follow the lane.
+        picked = []
+        found = 0
+        for top, bottom in self.window_rows:
+            # Pixels come back from findNonZero row by row, so a window's rows are one slice
+            start, stop = row_starts[top], row_starts[bottom]
+            window_xs = xs[start:stop]
+            inside = np.flatnonzero(np.abs(window_xs - x) <= self.margin) + start
+            if len(inside) >= self.min_pixels:
+                x = xs[inside].mean()
+                found += 1
+            picked.append(inside)
+        picked = np.concatenate(picked)
+        return fit_polynomial(ys[picked], xs[picked], 2), len(picked), found
+
+    def _to_camera(self, coefficients, ys):
+        points = np.stack([np.polyval(coefficients, ys), ys], axis=1).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(points.astype(np.float32), self.to_camera).reshape(-1, 2)
+
+    def __call__(self, edges):
+        warped = self.warp(edges)
+        width, height = self.size
+        points = cv2.findNonZero(warped)
+        if points is None:
+            return None
+        points = points.reshape(-1, 2)
+        xs, ys = points[:, 0].astype(np.float64), points[:, 1]
+        # Index of the first pixel on each row (and one past the last row)
+        row_starts = np.searchsorted(ys, np.arange(height + 1))
+
+        # Where the lanes start: the strongest column on each side of the lower half
+        histogram = cv2.reduce(warped[height // 2:], 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+        middle = width // 2
+        starts = [int(np.argmax(histogram[:middle])), middle + int(np.argmax(histogram[middle:]))]
+        if histogram[starts[0]] == 0 or histogram[starts[1]] == 0:
+            return None
+
+        fits = [self._follow_lane(ys, xs, row_starts, x) for x in starts]
+        if fits[0][0] is None or fits[1][0] is None:
+            return None
+
+        bottom = height - 1
+        lanes = []
+        for coefficients, support, found in fits:
+            points = np.round(self._to_camera(coefficients, self.sample_ys)).astype(np.int32)
+            # Direction of the lane over the near half of the view, as y = mx + c in the camera view
+            (x1, y1), (x2, y2) = self._to_camera(coefficients, np.array([bottom, bottom / 2]))
+            slope = float((y2 - y1) / (x2 - x1)) if x2 != x1 else np.inf
+            lanes.append(Lane(slope, points=points, support=support, confidence=found / self.windows))
+        mean_curvature = float(np.mean([curvature(coefficients, bottom) for coefficients, _, _ in fits]))
+        return lanes[0], lanes[1], mean_curvature
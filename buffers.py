@@ -0,0 +1,124 @@
+import tracemalloc
+import numpy as np
+
+# Allocations at least this big count as large, a full 800x600 gray frame is 480 KB
+LARGE_ALLOCATION = 64 * 1024
+
+
+class FrameBuffers:
+    """
+    Preallocated images for one capture size: two capture buffers and the gray, Canny, blur
+    and ROI-masked outputs of process_img, which OpenCV writes into through dst=.
+
+    Every processed frame overwrites the previous frame's images, so keep a FrameResult only
+    until the next frame is processed and use one set of buffers per thread.
+    """
+
+    def __init__(self, shape):
+        height, width = shape[:2]
+        self.shape = tuple(shape)
+        # Two capture buffers: the frame behind the last result keeps its overlays while the next
+        # capture lands in the other one, so frames skipped by frame_skip.py still show the lanes
+        self.captures = [np.zeros(shape, np.uint8), np.zeros(shape, np.uint8)]
+        self.held = 0
+        self.gray = np.empty((height, width), np.uint8)
+        self.edges = np.empty((height, width), np.uint8)
+        self.blurred = np.empty((height, width), np.uint8)
+        self.masked = np.empty((height, width), np.uint8)
+
+    def next_capture(self):
+        # The capture buffer that isn't behind the last processed frame
+        return self.captures[1 - self.held]
+
+    def hold(self, frame):
+        # Called by the frame loop once a frame is processed, it must survive the next capture
+        for index, capture in enumerate(self.captures):
+            if capture is frame:
+                self.held = index
+
+    @property
+    def nbytes(self):
+        return sum(image.nbytes for image in (*self.captures, self.gray, self.edges, self.blurred, self.masked))
+
+
+class BufferArena:
+    """
+    FrameBuffers by capture size, created the first time a size is seen and kept after that,
+    so a steady stream of frames of one size allocates no images at all.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, shape):
+        shape = tuple(shape)
+        buffers = self.buffers.get(shape)
+        if buffers is None:
+            buffers = self.buffers[shape] = FrameBuffers(shape)
+        return buffers
+
+    def next_capture(self, shape):
+        """
+        The buffer to capture (or copy) the next frame of this shape into, see FrameBuffers.next_capture.
+        """
+        return self.get(shape).next_capture()
+
+    def hold(self, frame):
+        """
+        Keeps a frame captured into next_capture() from being overwritten by the next capture,
+        call it after processing the frame (not for frames frame_skip.py skipped).
+        """
+        self.get(frame.shape).hold(frame)
+
+
+class AllocationTracker:
+    """
+    Diagnostic mode: watches the Python and NumPy allocations (images made by OpenCV included)
+    of every frame with tracemalloc and counts the frames where something large was allocated.
+
+    Call start() before the loop and frame_done() at the end of every frame. tracemalloc slows
+    everything down, so only use it to check the buffers, not to time the bot.
+    """
+
+    def __init__(self, threshold=LARGE_ALLOCATION, warm_up=5):
+        self.threshold = threshold
+        # The first frames create the buffers, numba's and OpenCV's caches and so on
+        self.warm_up = warm_up
+        self.frames = 0
+        self.large_frames = 0
+        self.worst = 0
+        self._baseline = 0
+
+    def start(self):
+        tracemalloc.start(10)
+        self._baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+    def frame_done(self):
+        # Peak memory above the start of the frame, anything freed again during the frame included
+        current, peak = tracemalloc.get_traced_memory()
+        growth = peak - self._baseline
+        self.frames += 1
+        if self.frames > self.warm_up:
+            self.worst = max(self.worst, growth)
+            if growth >= self.threshold:
+                self.large_frames += 1
+        self._baseline = current
+        tracemalloc.reset_peak()
+        return growth
+
+    def stop(self, top=10):
+        """
+        Stops tracing and returns a report: the steady-state frames with large allocations,
+        and the biggest blocks still alive, by line.
+        """
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        steady = max(self.frames - self.warm_up, 0)
+        lines = [f"Allocations: {self.large_frames} of {steady} steady-state frames allocated "
+                 f"{self.threshold // 1024} KB or more, worst frame peaked {self.worst / 1024:.1f} KB above its start"]
+        lines.append("Largest live allocations:")
+        for stat in snapshot.statistics("lineno")[:top]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size / 1024:10.1f} KB {stat.count:6d} blocks  {frame.filename}:{frame.lineno}")
+        return "\n".join(lines)
@@ -0,0 +1,262 @@
+import argparse
+import cv2
+import numpy as np
+from main import edge_image, detect_lines, group_lanes, CONFIG
+from dataset import iter_frames
+
+# Lanes found by group_lanes are rasterised this thick (at 800x600) to stand in for the painted markings
+DETECTED_LANE_THICKNESS = 12
+# Detected "lanes" flatter than this are horizon or kerb edges, real lane lines are steep in the camera view
+MIN_LANE_SLOPE = 0.3
+# Per-frame lane masks are kept at 1/THUMB_SCALE resolution for the per-frame coverage numbers
+THUMB_SCALE = 4
+
+
+class SessionStats:
+    """
+    Per-pixel counts accumulated over a recorded session.
+
+    - lane_count[y, x]: frames in which (y, x) was a lane pixel.
+    - clutter_count[y, x]: frames in which (y, x) was an edge pixel that was not part of a lane,
+      i.e. work Canny/Hough does for nothing when it falls inside the ROI.
+    - lane_thumbs: downscaled lane mask of every frame, (frames, H/THUMB_SCALE, W/THUMB_SCALE).
+    """
+
+    def __init__(self, lane_count, clutter_count, lane_thumbs):
+        self.lane_count = lane_count
+        self.clutter_count = clutter_count
+        self.lane_thumbs = lane_thumbs
+        self.frames = len(lane_thumbs)
+        self.shape = lane_count.shape
+
+
+def detected_lane_mask(frame, search_config):
+    """
+    Rasterises the two lanes group_lanes finds in a frame, searching inside search_config's ROI.
+    Works with both lane models, straight lanes are drawn from their coords and curves from their
+    polyline. Returns an all-False mask when no lane pair is found.
+    """
+    edges = edge_image(frame, search_config)
+    lanes = np.zeros(frame.shape[:2], np.uint8)
+    lines = detect_lines(edges, search_config)
+    if lines is None:
+        return lanes > 0
+    try:
+        found = group_lanes(frame, lines, search_config)
+    except Exception:
+        # Fewer than two line groups, or a curve that can't be fitted: the frame has no lane pair
+        return lanes > 0
+    height, width = frame.shape[:2]
+    thickness = max(int(DETECTED_LANE_THICKNESS * width / 800), 1)
+    for lane in found:
+        if abs(lane.slope) < MIN_LANE_SLOPE:
+            continue
+        if lane.points is not None:
+            points = lane.points.reshape(-1, 2)
+        else:
+            points = np.array(lane.coords).reshape(2, 2)
+        # Nearly flat lanes are extended far off-screen, keep them in a range cv2.polylines accepts
+        points = np.clip(points, -10 * width, 10 * width).astype(np.int32)
+        cv2.polylines(lanes, [points], False, 1, thickness)
+    return lanes > 0
+
+
+def accumulate(frames, masks=None, config=None, search_config=None):
+    """
+    Builds SessionStats from a recording.
+
+    Function Args:
+    - frames: Iterable of BGR/BGRA frames.
+    - masks: Optional iterable of ground-truth lane masks (nonzero = lane), in the same order.
+      Without it the lanes group_lanes finds inside search_config's ROI are used.
+    - config: PipelineConfig for the edge detection, defaults to CONFIG.
+    - search_config: Config used to detect lanes when there are no masks. Its ROI should be wider
+      than the one being calibrated, otherwise lanes outside the current ROI are never seen.
+    """
+    config = config or CONFIG
+    masks = iter(masks) if masks is not None else None
+    lane_count = clutter_count = None
+    lane_thumbs = []
+    dilate_kernel = np.ones((5, 5), np.uint8)
+
+    for frame in frames:
+        if masks is not None:
+            mask = next(masks)
+            lanes = (mask.reshape(mask.shape[0], mask.shape[1], -1) > 0).any(axis=2)
+        else:
+            lanes = detected_lane_mask(frame, search_config)
+        # The same edge image the pipeline feeds into the ROI mask
+        edges = edge_image(frame, config, masked=False) > 0
+        # Edges right next to a lane are the lane's own edges, not clutter
+        near_lane = cv2.dilate(lanes.view(np.uint8), dilate_kernel) > 0
+
+        if lane_count is None:
+            lane_count = np.zeros(lanes.shape, np.uint32)
+            clutter_count = np.zeros(lanes.shape, np.uint32)
+        lane_count += lanes
+        clutter_count += edges & ~near_lane
+        height, width = lanes.shape
+        thumb = cv2.resize(lanes.view(np.uint8), (width // THUMB_SCALE, height // THUMB_SCALE),
+                           interpolation=cv2.INTER_AREA)
+        lane_thumbs.append(thumb > 0)
+
+    if lane_count is None:
+        raise ValueError("The session has no frames")
+    return SessionStats(lane_count, clutter_count, np.array(lane_thumbs))
+
+
+def polygon_mask(shape, vertices):
+    mask = np.zeros(shape, np.uint8)
+    cv2.fillPoly(mask, [np.asarray(vertices, np.int32)], 1)
+    return mask.view(bool)
+
+
+def evaluate(stats, vertices, target=0.95):
+    """
+    Scores one ROI polygon against a session.
+
+    Returns a dict with:
+    - coverage: share of all lane pixels that fall inside the ROI.
+    - frames_below_target: share of frames whose own lane coverage is below target.
+    - clutter_per_frame: non-lane edge pixels inside the ROI per frame (Hough input that is pure noise).
+    - area: share of the frame the ROI covers.
+    """
+    inside = polygon_mask(stats.shape, vertices)
+    lane_total = stats.lane_count.sum()
+    coverage = stats.lane_count[inside].sum() / lane_total if lane_total else 1.0
+
+    # Per-frame coverage, vectorised over the whole stack of lane thumbnails
+    thumb_shape = stats.lane_thumbs.shape[1:]
+    thumb_inside = cv2.resize(inside.view(np.uint8), thumb_shape[::-1], interpolation=cv2.INTER_NEAREST) > 0
+    per_frame_lanes = stats.lane_thumbs.sum(axis=(1, 2))
+    per_frame_inside = (stats.lane_thumbs & thumb_inside).sum(axis=(1, 2))
+    has_lanes = per_frame_lanes > 0
+    per_frame_coverage = per_frame_inside[has_lanes] / per_frame_lanes[has_lanes]
+    below = float((per_frame_coverage < target).mean()) if has_lanes.any() else 0.0
+
+    return {
+        "coverage": float(coverage),
+        "frames_below_target": below,
+        "clutter_per_frame": float(stats.clutter_count[inside].sum() / stats.frames),
+        "area": float(inside.mean()),
+    }
+
+
+def weighted_quantile(values, weights, quantiles):
+    order = np.argsort(values)
+    values, weights = values[order], weights[order]
+    cumulative = np.cumsum(weights) - 0.5 * weights
+    cumulative /= weights.sum()
+    return np.interp(quantiles, cumulative, values)
+
+
+def candidate_polygon(stats, trim, margin, bands):
+    """
+    Builds a convex ROI around the lane pixels: the top and bottom rows and, for each horizontal
+    band, the left/right edges are weighted quantiles of the lane pixels, with `trim` cut off each
+    side and `margin` pixels added back around it.
+    """
+    height, width = stats.shape
+    ys, xs = np.nonzero(stats.lane_count)
+    weights = stats.lane_count[ys, xs].astype(float)
+    top, bottom = weighted_quantile(ys, weights, [trim, 1 - trim])
+
+    left_points, right_points = [], []
+    rows = np.linspace(top, bottom, bands + 1)
+    for band_top, band_bottom in zip(rows[:-1], rows[1:]):
+        in_band = (ys >= band_top) & (ys <= band_bottom)
+        if not in_band.any():
+            continue
+        left, right = weighted_quantile(xs[in_band], weights[in_band], [trim, 1 - trim])
+        left_points += [(left - margin, band_top), (left - margin, band_bottom)]
+        right_points += [(right + margin, band_top), (right + margin, band_bottom)]
+
+    points = np.array(left_points + right_points)
+    points[points[:, 1] == top, 1] -= margin
+    points[points[:, 1] == bottom, 1] += margin
+    points = np.clip(np.round(points), [0, 0], [width - 1, height - 1]).astype(np.int32)
+    hull = cv2.convexHull(points)
+    # Few vertices are enough for a road ROI and keep fillPoly cheap
+    return cv2.approxPolyDP(hull, 2, True).reshape(-1, 2)
+
+
+def suggest_roi(stats, target=0.95, bands=6):
+    """
+    Searches for the ROI with the least clutter whose lane coverage still meets the target.
+    Returns (vertices, score) or (None, None) if no candidate reaches the target.
+    """
+    best = None
+    for trim in np.linspace(0.2, 0.0, 21):
+        for margin in (0, 4, 8, 16, 32):
+            vertices = candidate_polygon(stats, trim, margin, bands)
+            score = evaluate(stats, vertices, target)
+            if score["coverage"] < target:
+                continue
+            key = (score["clutter_per_frame"], score["area"])
+            if best is None or key < best[0]:
+                best = (key, vertices, score)
+    if best is None:
+        return None, None
+    return best[1], best[2]
+
+
+def draw_overlay(stats, current, suggested, background=None):
+    """
+    Renders the lane (red) and clutter (blue) heatmaps with the current ROI (yellow) and the suggestion (green).
+    """
+    def normalise(counts):
+        return (255 * counts / max(counts.max(), 1)).astype(np.uint8)
+
+    overlay = np.zeros(stats.shape + (3,), np.uint8)
+    overlay[..., 2] = normalise(stats.lane_count)
+    overlay[..., 0] = normalise(stats.clutter_count)
+    if background is not None:
+        overlay = cv2.addWeighted(background[..., :3], 0.5, overlay, 1.0, 0)
+    cv2.polylines(overlay, [current], True, (0, 255, 255), 2)
+    if suggested is not None:
+        cv2.polylines(overlay, [suggested], True, (0, 255, 0), 2)
+    return overlay
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ROI candidates over a recorded session and suggest the tightest one.")
+    parser.add_argument("recording", help="Folder of screenshots, .npy stack or .npz file")
+    parser.add_argument("--masks", help="Ground-truth lane masks in the same format and order as the frames")
+    parser.add_argument("--target", type=float, default=0.95, help="Share of lane pixels the ROI must cover")
+    parser.add_argument("--bands", type=int, default=6, help="Horizontal bands used to shape the suggestion")
+    parser.add_argument("--overlay", help="Write a heatmap image with both ROIs to this path")
+    args = parser.parse_args()
+
+    # Look for lanes in the lower 3/4 of the frame, wide enough to see lanes the current ROI misses
+    width, height = CONFIG.base_resolution
+    search_config = CONFIG.updated({"roi": {"vertices": [[0, height // 4], [width, height // 4], [width, height], [0, height]]}})
+    masks = iter_frames(args.masks) if args.masks else None
+
+    first = next(iter_frames(args.recording))
+    stats = accumulate(iter_frames(args.recording), masks, CONFIG, search_config)
+    current = CONFIG.derived(stats.shape).vertices
+    suggested, suggested_score = suggest_roi(stats, args.target, args.bands)
+
+    print(f"{stats.frames} frames, {int(stats.lane_count.sum())} lane pixels")
+    print(f"{'ROI':<10} {'coverage':>9} {'frames<target':>14} {'clutter/frame':>14} {'area':>7}")
+    for name, score in (("current", evaluate(stats, current, args.target)), ("suggested", suggested_score)):
+        if score is None:
+            print(f"{name:<10} no polygon reaches {args.target:.0%} coverage")
+            continue
+        print(f"{name:<10} {score['coverage']:9.1%} {score['frames_below_target']:14.1%} "
+              f"{score['clutter_per_frame']:14.0f} {score['area']:7.1%}")
+
+    if suggested is not None:
+        # Back to the base resolution pipeline.toml is written in
+        scale = np.array(CONFIG.base_resolution) / np.array(stats.shape[::-1])
+        base_vertices = np.round(suggested * scale).astype(int)
+        print("\n[roi] for pipeline.toml:")
+        print("vertices = [" + ", ".join(f"[{x}, {y}]" for x, y in base_vertices) + "]")
+
+    if args.overlay:
+        cv2.imwrite(args.overlay, draw_overlay(stats, current, suggested, first))
+        print(f"Overlay written to {args.overlay}")
+
+
+if __name__ == "__main__":
+    main()
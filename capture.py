@@ -0,0 +1,105 @@
+import numpy as np
+from startup import lazy_import
+
+
+class Region:
+    """
+    A named part of the screen to watch.
+
+    Function Args:
+    - name: Key of the region's view in every grab.
+    - x, y, width, height: Screen rectangle, in the same terms as capture_screen_region.
+    - callback: Optional function called with (view, tick) for this region, its return value is
+      kept in MultiRegionCapture.results under the region's name. Runs on the capturing thread,
+      so keep it short or hand the work off.
+    - every: Only call the callback on every n-th grab, e.g. 10 for a minimap that rarely changes.
+    """
+
+    def __init__(self, name, x, y, width, height, callback=None, every=1):
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Region {name!r} needs a positive size, got {width}x{height}")
+        if every < 1:
+            raise ValueError(f"Region {name!r}: every must be at least 1, got {every}")
+        self.name = name
+        self.x, self.y, self.width, self.height = x, y, width, height
+        self.callback = callback
+        self.every = every
+
+    def __repr__(self):
+        return f"Region({self.name!r}, {self.x}, {self.y}, {self.width}, {self.height}, every={self.every})"
+
+
+def union_rect(regions):
+    # (x, y, width, height) of the smallest rectangle holding every region
+    left = min(region.x for region in regions)
+    top = min(region.y for region in regions)
+    right = max(region.x + region.width for region in regions)
+    bottom = max(region.y + region.height for region in regions)
+    return left, top, right - left, bottom - top
+
+
+class MultiRegionCapture:
+    """
+    Captures several screen regions with a single grab per tick.
+
+    The rectangle around all the regions is grabbed once through one mss instance that stays
+    open, and every region is handed out as a NumPy view into that screenshot (BGRA), so
+    watching a minimap or a speedometer next to the road costs no extra grab and no copy.
+    Every grab gets a fresh screenshot, so the views of earlier grabs stay valid (and can be
+    drawn on) for as long as they are kept.
+
+    mss is tied to the thread that opened it: create, grab and close from one thread.
+    """
+
+    def __init__(self, regions):
+        self.regions = list(regions)
+        if not self.regions:
+            raise ValueError("MultiRegionCapture needs at least one region")
+        names = [region.name for region in self.regions]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Region names must be unique, got {names}")
+
+        x, y, width, height = union_rect(self.regions)
+        self.monitor = {"top": y, "left": x, "width": width, "height": height}
+        # Where each region sits inside the union rectangle
+        self.slices = {region.name: (slice(region.y - y, region.y - y + region.height),
+                                     slice(region.x - x, region.x - x + region.width))
+                       for region in self.regions}
+        self.ticks = 0
+        self.results = {}
+        self._sct = None
+
+    def grab_union(self):
+        # One screenshot of the whole union rectangle as a (height, width, 4) array, without copying it
+        if self._sct is None:
+            self._sct = lazy_import("mss").mss()
+        return np.asarray(self._sct.grab(self.monitor))
+
+    def views(self, image):
+        """
+        Splits a union-sized image into the regions' views, by name.
+        """
+        return {name: image[rows, columns] for name, (rows, columns) in self.slices.items()}
+
+    def grab(self):
+        """
+        Grabs all regions at once, runs the callbacks that are due this tick and returns the
+        regions' views by name.
+        """
+        views = self.views(self.grab_union())
+        for region in self.regions:
+            if region.callback is not None and self.ticks % region.every == 0:
+                self.results[region.name] = region.callback(views[region.name], self.ticks)
+        self.ticks += 1
+        return views
+
+    def close(self):
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,306 @@
+import os
+import copy
+import threading
+import cv2
+import numpy as np
+from strips import StripEdgeDetector
+from line_detectors import ENGINES, create_line_detector
+from birdseye import BirdseyeLaneFinder
+from filters import FILTERS, POSITIONS, available_filters, smoothing
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline.toml")
+
+# Used for anything missing from the config file, these match the values the bot was tuned with
+DEFAULTS = {
+    "edges": {"canny_thresholds": [150, 300], "blur_kernel": [3, 3], "filter": "gaussian", "filter_position": "after",
+              "bilateral_sigma": 50.0},
+    "roi": {
+        "vertices": [[10, 500], [28, 360], [350, 320], [450, 320], [750, 360], [800, 500]],
+        "base_resolution": [800, 600],
+    },
+    "lines": {"engine": "hough"},
+    "hough": {"rho": 1, "theta_degrees": 1, "threshold": 180, "min_line_length": 15, "max_line_gap": 0},
+    "lanes": {"max_y": 600, "slope_tolerance": [0.2, 1.2], "intercept_tolerance": [0.2, 1.2], "model": "straight"},
+    "birdseye": {
+        "enabled": False,
+        "source": [[319, 330], [481, 330], [800, 500], [0, 500]],
+        "size": [200, 300],
+        "windows": 10,
+        "margin": 15,
+        "min_pixels": 20,
+    },
+    "strips": {"threads": 0},
+    "skip": {"enabled": True, "threshold": 1.0, "thumbnail": [32, 8]},
+    "governor": {
+        "enabled": False,
+        "deadline_ms": 25.0,
+        "down_after": 2,
+        "up_after": 60,
+        "slack": 0.6,
+        "roi_shrink": 0.8,
+        "scale": 0.5,
+        "hough_boost": 1.3,
+    },
+    "steering": {
+        "mode": "bang",
+        "rate_hz": 200,
+        "period_ms": 50.0,
+        "min_pulse_ms": 17.0,
+        "spin_ms": 1.0,
+        "timeout_ms": 250.0,
+        "full_scale_degrees": 20.0,
+        "deadband": 0.05,
+    },
+}
+
+
+def read_config_file(path):
+    """
+    Reads a TOML file, or a YAML file if PyYAML is installed, into a dict.
+    """
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        with open(path) as f:
+            return yaml.safe_load(f) or {}
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def merge_defaults(values):
+    merged = copy.deepcopy(DEFAULTS)
+    for section, settings in (values or {}).items():
+        if section not in merged:
+            raise ValueError(f"Unknown config section [{section}]")
+        merged[section].update(settings)
+    return merged
+
+
+class DerivedCache:
+    """
+    Everything the pipeline derives from the config for one capture size: the scaled ROI
+    vertices, the ROI mask, the line detector, the bird's-eye lane finder and the strip edge detector. Built once, outside the frame loop.
+    """
+
+    def __init__(self, config, shape):
+        height, width = shape
+        base_width, base_height = config.base_resolution
+        scale = np.array([width / base_width, height / base_height])
+        self.vertices = np.round(config.roi_vertices * scale).astype(np.int32)
+        self.max_y = int(round(config.lanes_max_y * height / base_height))
+        self.mask = np.zeros((height, width), np.uint8)
+        cv2.fillPoly(self.mask, [self.vertices], 255)
+        # Bounding box (x1, y1, x2, y2) of the ROI, clipped to the frame
+        x, y, w, h = cv2.boundingRect(self.vertices)
+        self.roi_box = (max(x, 0), max(y, 0), min(x + w, width), min(y + h, height))
+
+        self.line_detector = create_line_detector(config.line_engine)
+        self.birdseye = None
+        if config.birdseye_enabled:
+            source = config.birdseye_source * scale
+            self.birdseye = BirdseyeLaneFinder(source, config.birdseye_size, config.birdseye_windows,
+                                               config.birdseye_margin, config.birdseye_min_pixels)
+        self.edge_detector = None
+        if config.strip_threads:
+            self.edge_detector = StripEdgeDetector(shape, self.vertices, config.canny_thresholds, config.blur_kernel,
+                                                   strips=config.strip_threads, smooth=smoothing(config),
+                                                   filter_position=config.filter_position)
+
+    def close(self):
+        if self.edge_detector is not None:
+            self.edge_detector.close()
+
+
+class PipelineConfig:
+    """
+    The pipeline parameters (ROI, Canny, blur, line detection and lane grouping) from pipeline.toml.
+    A config is never modified once built, a reload creates a new one.
+    """
+
+    def __init__(self, values=None, source=None):
+        values = merge_defaults(values)
+        self.values = values
+        self.source = source
+
+        self.canny_thresholds = tuple(values["edges"]["canny_thresholds"])
+        self.blur_kernel = tuple(values["edges"]["blur_kernel"])
+        self.edge_filter = values["edges"]["filter"]
+        self.filter_position = values["edges"]["filter_position"]
+        self.bilateral_sigma = values["edges"]["bilateral_sigma"]
+        self.roi_vertices = np.array(values["roi"]["vertices"], np.int32)
+        self.base_resolution = tuple(values["roi"]["base_resolution"])
+
+        self.line_engine = values["lines"]["engine"]
+        hough = values["hough"]
+        self.hough_rho = hough["rho"]
+        self.hough_theta = np.deg2rad(hough["theta_degrees"])
+        self.hough_threshold = hough["threshold"]
+        self.hough_min_line_length = hough["min_line_length"]
+        self.hough_max_line_gap = hough["max_line_gap"]
+
+        self.lanes_max_y = values["lanes"]["max_y"]
+        self.slope_tolerance = tuple(values["lanes"]["slope_tolerance"])
+        self.intercept_tolerance = tuple(values["lanes"]["intercept_tolerance"])
+        self.lane_model = values["lanes"]["model"]
+        birdseye = values["birdseye"]
+        self.birdseye_enabled = birdseye["enabled"]
+        self.birdseye_source = np.array(birdseye["source"], np.float64)
+        self.birdseye_size = tuple(birdseye["size"])
+        self.birdseye_windows = birdseye["windows"]
+        self.birdseye_margin = birdseye["margin"]
+        self.birdseye_min_pixels = birdseye["min_pixels"]
+        self.strip_threads = values["strips"]["threads"]
+        self.skip_enabled = values["skip"]["enabled"]
+        self.skip_threshold = values["skip"]["threshold"]
+        self.skip_thumbnail = tuple(values["skip"]["thumbnail"])
+        governor = values["governor"]
+        self.governor_enabled = governor["enabled"]
+        self.governor_deadline_ms = governor["deadline_ms"]
+        self.governor_down_after = governor["down_after"]
+        self.governor_up_after = governor["up_after"]
+        self.governor_slack = governor["slack"]
+        self.governor_roi_shrink = governor["roi_shrink"]
+        self.governor_scale = governor["scale"]
+        self.governor_hough_boost = governor["hough_boost"]
+        steering = values["steering"]
+        self.steering_mode = steering["mode"]
+        self.steering_rate = steering["rate_hz"]
+        self.steering_period_ms = steering["period_ms"]
+        self.steering_min_pulse_ms = steering["min_pulse_ms"]
+        self.steering_spin_ms = steering["spin_ms"]
+        self.steering_timeout_ms = steering["timeout_ms"]
+        self.steering_full_scale = steering["full_scale_degrees"]
+        self.steering_deadband = steering["deadband"]
+
+        if len(self.canny_thresholds) != 2 or len(self.blur_kernel) != 2:
+            raise ValueError("canny_thresholds and blur_kernel need two values each")
+        if any(k <= 0 or k % 2 == 0 for k in self.blur_kernel):
+            raise ValueError(f"blur_kernel sides must be odd and positive, got {self.blur_kernel}")
+        if self.edge_filter not in FILTERS:
+            raise ValueError(f"Unknown edges filter {self.edge_filter!r}, choose from {', '.join(FILTERS)}")
+        if self.edge_filter not in available_filters():
+            raise ValueError(f"Edges filter {self.edge_filter!r} is not available in this OpenCV build")
+        if self.filter_position not in POSITIONS:
+            raise ValueError(f"edges filter_position must be 'before' or 'after', got {self.filter_position!r}")
+        if self.lane_model not in ("straight", "quadratic"):
+            raise ValueError(f"lanes model must be 'straight' or 'quadratic', got {self.lane_model!r}")
+        if self.birdseye_source.shape != (4, 2):
+            raise ValueError("birdseye source must be four [x, y] points")
+        if self.line_engine not in ENGINES:
+            raise ValueError(f"Unknown line engine {self.line_engine!r}, choose from {', '.join(ENGINES)}")
+        if self.governor_deadline_ms <= 0 or not 0 < self.governor_slack < 1:
+            raise ValueError("governor deadline_ms must be positive and slack between 0 and 1")
+        if not 0 < self.governor_roi_shrink <= 1 or not 0 < self.governor_scale <= 1 or self.governor_hough_boost < 1:
+            raise ValueError("governor roi_shrink and scale must be in (0, 1], hough_boost at least 1")
+        if self.steering_mode not in ("bang", "pwm"):
+            raise ValueError(f"steering mode must be 'bang' or 'pwm', got {self.steering_mode!r}")
+        if self.steering_rate <= 0 or self.steering_period_ms < max(self.steering_min_pulse_ms, 1000 / self.steering_rate):
+            raise ValueError("steering rate_hz must be positive and period_ms at least one tick and min_pulse_ms")
+        if self.steering_full_scale <= 0 or not 0 <= self.steering_deadband < 1:
+            raise ValueError("steering full_scale_degrees must be positive and deadband in [0, 1)")
+        if self.roi_vertices.ndim != 2 or self.roi_vertices.shape[0] < 3 or self.roi_vertices.shape[1] != 2:
+            raise ValueError("roi vertices must be a list of at least three [x, y] points")
+
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=CONFIG_PATH):
+        # A missing file just means the defaults
+        if not os.path.exists(path):
+            return cls(source=path)
+        return cls(read_config_file(path), source=path)
+
+    def updated(self, overrides):
+        """
+        Returns a new config with some settings replaced, e.g. updated({"strips": {"threads": 0}}).
+        """
+        values = copy.deepcopy(self.values)
+        for section, settings in overrides.items():
+            values[section].update(settings)
+        return PipelineConfig(values, self.source)
+
+    def derived(self, shape):
+        """
+        Returns the DerivedCache for a frame shape, building it on first use.
+        """
+        key = tuple(shape[:2])
+        cache = self._derived.get(key)
+        if cache is None:
+            with self._lock:
+                cache = self._derived.get(key)
+                if cache is None:
+                    cache = self._derived[key] = DerivedCache(self, key)
+        return cache
+
+    def close(self):
+        for cache in self._derived.values():
+            cache.close()
+
+
+class ConfigWatcher:
+    """
+    Watches the config file on a background thread and rebuilds the config, including the
+    derived caches for the capture sizes in use, whenever the file changes.
+
+    The new config is published by swapping a single reference, so the frame loop just reads
+    `watcher.current` once per frame and always sees either the old or the new config in full.
+    A file that fails to load is reported and the previous config stays in use.
+    """
+
+    def __init__(self, path=CONFIG_PATH, shapes=(), interval=0.5, watch=True):
+        self.path = path
+        self.shapes = [tuple(shape[:2]) for shape in shapes]
+        self.interval = interval
+        self.reloads = 0
+        self._mtime = self._stat()
+        self.current = self._build()
+        self._stop = threading.Event()
+        self._thread = None
+        # With watch=False there is no thread, call check() to look for changes (runtime.py does)
+        if watch:
+            self._thread = threading.Thread(target=self._watch, name="config-watcher", daemon=True)
+            self._thread.start()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _build(self):
+        config = PipelineConfig.load(self.path)
+        for shape in self.shapes:
+            config.derived(shape)
+        return config
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """
+        Reloads the config if the file changed since the last look. Returns True if a new config was published.
+        """
+        mtime = self._stat()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            config = self._build()
+        except Exception as e:
+            print(f"Config reload failed, keeping the previous config: {e}")
+            return False
+        self.current = config
+        self.reloads += 1
+        print(f"Reloaded {self.path}")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
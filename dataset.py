@@ -0,0 +1,58 @@
+import os
+import cv2
+import numpy as np
+
+# File extensions that are treated as frames when loading a folder of screenshots
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def list_frame_files(folder):
+    """
+    Returns the image files in a folder, sorted by name so frames come back in recording order.
+    """
+    names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return [os.path.join(folder, name) for name in names]
+
+
+def iter_frames(path):
+    """
+    Yields frames one at a time from a recording.
+
+    Function Args:
+    - path: A folder of screenshots, a .npy stack of shape (N, H, W, C) or a .npz file with a 'frames' array.
+    Returns:
+    - An iterator of BGR/BGRA images, in recording order.
+    """
+    if os.path.isdir(path):
+        for file_path in list_frame_files(path):
+            frame = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
+            if frame is None:
+                print(f"Skipping unreadable frame: {file_path}")
+                continue
+            yield frame
+    elif path.endswith(".npy"):
+        # Memory-map the stack so long recordings are not loaded into RAM all at once
+        yield from np.load(path, mmap_mode="r")
+    elif path.endswith(".npz"):
+        with np.load(path) as data:
+            yield from data["frames"]
+    else:
+        raise ValueError(f"Unsupported recording format: {path}")
+
+
+def synthetic_frame(width=800, height=600, seed=0):
+    """
+    Draws a fake road scene (sky, noisy asphalt and two converging lane markings) in the capture's BGRA format.
+    Handy for benchmarks and warm-up runs when no recording is at hand.
+    """
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 4), 60, np.uint8)
+    frame[:height // 2] = (200, 170, 120, 255)
+    # Asphalt texture, this is what the blur and Canny thresholds are there to suppress
+    noise = rng.integers(0, 25, (height, width, 1), dtype=np.uint8)
+    frame[..., :3] = cv2.add(frame[..., :3], np.repeat(noise, 3, axis=2))
+    sx, sy = width / 800, height / 600
+    thickness = max(int(8 * sx), 1)
+    cv2.line(frame, (int(150 * sx), int(560 * sy)), (int(370 * sx), int(320 * sy)), (255, 255, 255, 255), thickness)
+    cv2.line(frame, (int(650 * sx), int(560 * sy)), (int(430 * sx), int(320 * sy)), (255, 255, 255, 255), thickness)
+    return frame
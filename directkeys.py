@@ -6,7 +6,12 @@
 import ctypes
 import time
 
-SendInput = ctypes.windll.user32.SendInput
+# ctypes.windll only exists on Windows, so SendInput is looked up on the first key press
+# instead of at import time. That keeps this module importable on any OS.
+def SendInput(*args):
+    if not hasattr(ctypes, "windll"):
+        raise OSError("DirectInput key presses are only supported on Windows")
+    return ctypes.windll.user32.SendInput(*args)
 
 
 W = 0x11
@@ -57,14 +62,14 @@ def PressKey(hexKeyCode):
     ii_ = Input_I()
     ii_.ki = KeyBdInput( 0, hexKeyCode, 0x0008, 0, ctypes.pointer(extra) )
     x = Input( ctypes.c_ulong(1), ii_ )
-    ctypes.windll.user32.SendInput(1, ctypes.pointer(x), ctypes.sizeof(x))
+    SendInput(1, ctypes.pointer(x), ctypes.sizeof(x))
 
 def ReleaseKey(hexKeyCode):
     extra = ctypes.c_ulong(0)
     ii_ = Input_I()
     ii_.ki = KeyBdInput( 0, hexKeyCode, 0x0008 | 0x0002, 0, ctypes.pointer(extra) )
     x = Input( ctypes.c_ulong(1), ii_ )
-    ctypes.windll.user32.SendInput(1, ctypes.pointer(x), ctypes.sizeof(x))
+    SendInput(1, ctypes.pointer(x), ctypes.sizeof(x))
 
 if __name__ == '__main__':
     PressKey(0x11)
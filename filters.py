@@ -0,0 +1,57 @@
+import cv2
+
+# Smoothing filters for the filter stage of process_img, picked with [edges] filter. Every filter
+# is called as smooth(image, config, dst=None) on a single-channel uint8 image and returns an image
+# of the same size. The kernel size is [edges] blur_kernel. With filter_position = "after" the
+# filter runs on the Canny edges (the bot's original Gaussian blur), with "before" on the gray
+# image, so Canny sees a smoothed frame.
+
+
+def box_filter(image, config, dst=None):
+    return cv2.blur(image, config.blur_kernel, dst=dst)
+
+
+def gaussian_filter(image, config, dst=None):
+    return cv2.GaussianBlur(image, config.blur_kernel, 0, dst=dst)
+
+
+def stack_filter(image, config, dst=None):
+    # A Gaussian approximation whose cost doesn't grow with the kernel size (OpenCV 4.7+)
+    return cv2.stackBlur(image, config.blur_kernel, dst=dst)
+
+
+def median_filter(image, config, dst=None):
+    # Square aperture, the larger side of blur_kernel
+    return cv2.medianBlur(image, max(config.blur_kernel), dst=dst)
+
+
+def bilateral_filter(image, config, dst=None):
+    # Edge-preserving, the neighbourhood diameter is the larger side of blur_kernel
+    sigma = config.bilateral_sigma
+    return cv2.bilateralFilter(image, max(config.blur_kernel), sigma, sigma, dst=dst)
+
+
+# "none" skips the stage
+FILTERS = {
+    "none": None,
+    "box": box_filter,
+    "gaussian": gaussian_filter,
+    "stack": stack_filter,
+    "median": median_filter,
+    "bilateral": bilateral_filter,
+}
+POSITIONS = ("before", "after")
+
+
+def smoothing(config):
+    """
+    The config's filter as smooth(image, dst=None), passing the image through for "none".
+    """
+    smooth = FILTERS[config.edge_filter]
+    if smooth is None:
+        return lambda image, dst=None: image
+    return lambda image, dst=None: smooth(image, config, dst)
+
+
+def available_filters():
+    return [name for name in FILTERS if name != "stack" or hasattr(cv2, "stackBlur")]
@@ -0,0 +1,50 @@
+import cv2
+
+# Only every SAMPLE_STRIDE-th row and column is averaged into the thumbnail, a 4x cheaper
+# resize that still sees plenty of pixels per thumbnail cell
+SAMPLE_STRIDE = 4
+
+
+class FrameChangeDetector:
+    """
+    Spots frames that are practically identical to the last processed one (game paused, in a menu,
+    standing still, or mss grabbing faster than the game renders) so the previous lane result can be reused.
+
+    The ROI's bounding box is shrunk to a tiny thumbnail and compared with the thumbnail of the last
+    frame that went through the pipeline, using the mean absolute difference. Comparing against the
+    last processed frame rather than the previous capture means a slow drift still gets noticed.
+    """
+
+    def __init__(self):
+        self.previous = None
+        self.frames = 0
+        self.skipped = 0
+
+    def unchanged(self, frame, config):
+        """
+        Returns True if the frame can reuse the previous result, False if it needs processing.
+        """
+        self.frames += 1
+        if not config.skip_enabled:
+            return False
+
+        x1, y1, x2, y2 = config.derived(frame.shape).roi_box
+        sample = frame[y1:y2:SAMPLE_STRIDE, x1:x2:SAMPLE_STRIDE]
+        thumb = cv2.resize(sample, config.skip_thumbnail, interpolation=cv2.INTER_AREA)
+        previous = self.previous
+        if previous is not None and previous.shape == thumb.shape:
+            difference = cv2.norm(thumb, previous, cv2.NORM_L1) / thumb.size
+            if difference <= config.skip_threshold:
+                self.skipped += 1
+                return True
+        self.previous = thumb
+        return False
+
+    @property
+    def skip_rate(self):
+        # Share of frames that reused the previous result
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def reset_counters(self):
+        self.frames = 0
+        self.skipped = 0
@@ -0,0 +1,176 @@
+import cv2
+import numpy as np
+
+# Quality levels, each one gives up a little more than the one before it
+LEVELS = ("full", "no overlays", "small roi", "low scale", "high threshold")
+
+
+def level_config(config, level):
+    """
+    The config a quality level runs with, built from the base config's [governor] settings.
+    Returns (config, scale, draw): the processing scale and whether overlays may be drawn.
+    """
+    if level == 0:
+        return config, 1.0, True
+    overrides = {}
+    scale = 1.0
+    if level >= 2:
+        # Trim the ROI from the horizon down, the far road is where most clutter is
+        vertices = config.roi_vertices.astype(np.float64)
+        bottom = vertices[:, 1].max()
+        vertices[:, 1] = bottom - (bottom - vertices[:, 1]) * config.governor_roi_shrink
+        overrides["roi"] = {"vertices": np.round(vertices).astype(int).tolist()}
+    if level >= 3:
+        scale = config.governor_scale
+    boost = config.governor_hough_boost if level >= 4 else 1.0
+    if scale < 1 or boost > 1:
+        # Lines are shorter and get fewer votes in a scaled-down frame, keep the same lines passing
+        overrides["hough"] = {
+            "threshold": max(int(round(config.hough_threshold * scale * boost)), 1),
+            "min_line_length": max(int(round(config.hough_min_line_length * scale)), 1),
+        }
+    return config.updated(overrides), scale, False
+
+
+def scale_lanes(result, factor):
+    # Puts the lanes of a scaled-down frame back into full-frame pixels, the slopes don't change
+    curved = False
+    for lane in result.lanes:
+        if lane.coords is not None:
+            lane.coords = tuple(int(round(value * factor)) for value in lane.coords)
+        if lane.points is not None:
+            lane.points = np.round(lane.points * factor).astype(np.int32)
+        if lane.coefficients is not None:
+            # x = sum(c_p * y^p) with x and y both scaled by factor: c_p becomes c_p * factor^(1 - p)
+            powers = np.arange(len(lane.coefficients) - 1, -1, -1)
+            lane.coefficients = lane.coefficients * factor ** (1.0 - powers)
+            curved = True
+    # The quadratic model's curvature (1 / pixels) is in camera pixels, the bird's-eye one is in
+    # the top-down view's pixels, which don't depend on the processing scale
+    if curved and result.curvature is not None:
+        result.curvature = result.curvature / factor
+
+
+class QualityGovernor:
+    """
+    Keeps processed frames within a deadline by stepping down through quality levels (LEVELS)
+    when frames run over it, and back up when there is slack again.
+
+    The steps have hysteresis: down after `down_after` frames in a row over the deadline, up after
+    `up_after` frames in a row under slack x deadline, so a single slow frame doesn't change the
+    level and the governor doesn't flip between two levels. The deadline and thresholds come from
+    the [governor] section of the config the frames are processed with.
+
+    Call process() instead of process_img, then update() with the time the whole frame took.
+
+    Function Args:
+    - process: main.process_img. Passed in rather than imported, so main.py can use the governor
+      when it runs as a script.
+    """
+
+    def __init__(self, process):
+        self.process_img = process
+        self.level = 0
+        self.over = 0
+        self.under = 0
+        self.changes = 0
+        self._base = None
+        self._levels = {}
+        self._resized = {}
+        # Shape of the last frame processed, to build a new level's caches for before it is used
+        self._shape = None
+
+    def _level(self, config, level):
+        # The level's settings for this config, rebuilt when the config is reloaded
+        if config is not self._base:
+            self.close()
+            self._base = config
+        settings = self._levels.get(level)
+        if settings is None:
+            settings = self._levels[level] = level_config(config, level)
+        return settings
+
+    @staticmethod
+    def _scaled_size(shape, scale):
+        height, width = shape[:2]
+        return max(int(width * scale), 1), max(int(height * scale), 1)
+
+    def _prepare(self, config, level):
+        """
+        Builds a level's config, its derived caches (ROI mask, line detector and so on) and the
+        resized frame buffer for the frames' size, so the first frame at the new level doesn't
+        pay for them.
+        """
+        level_cfg, scale, _ = self._level(config, level)
+        if self._shape is None:
+            return
+        if scale < 1:
+            size = self._scaled_size(self._shape, scale)
+            key = (self._shape, size)
+            if key not in self._resized:
+                self._resized[key] = np.empty((size[1], size[0]) + self._shape[2:], np.uint8)
+            level_cfg.derived((size[1], size[0]))
+        else:
+            level_cfg.derived(self._shape)
+
+    def process(self, frame, config, draw=True, buffers=None):
+        """
+        Runs process_img at the current quality level, at full quality while [governor] is disabled.
+        The result's lanes are in full-frame pixels whatever the processing scale, and
+        result.quality holds the level.
+        """
+        level = self.level if config.governor_enabled else 0
+        self._shape = frame.shape
+        level_cfg, scale, level_draw = self._level(config, level)
+        if scale < 1:
+            size = self._scaled_size(frame.shape, scale)
+            resized = self._resized.get((frame.shape, size))
+            if resized is None:
+                resized = self._resized[(frame.shape, size)] = np.empty((size[1], size[0]) + frame.shape[2:], frame.dtype)
+            cv2.resize(frame, size, dst=resized, interpolation=cv2.INTER_AREA)
+            result = self.process_img(resized, draw=False, config=level_cfg, buffers=buffers)
+            scale_lanes(result, 1 / scale)
+            # Show the full frame, not the small one the lanes were found in
+            result.original = frame
+        else:
+            result = self.process_img(frame, draw=draw and level_draw, config=level_cfg, buffers=buffers)
+        result.quality = level
+        return result
+
+    def update(self, frame_ms, config):
+        """
+        Feeds the time a processed frame took (capture to steering) and moves the level if needed.
+        Returns the level for the next frame.
+        """
+        if not config.governor_enabled:
+            return self.level
+        deadline = config.governor_deadline_ms
+        if frame_ms > deadline:
+            self.over += 1
+            self.under = 0
+        elif frame_ms < deadline * config.governor_slack:
+            self.under += 1
+            self.over = 0
+        else:
+            # Within budget but without slack, stay where we are
+            self.over = self.under = 0
+
+        if self.over >= config.governor_down_after and self.level < len(LEVELS) - 1:
+            self._set_level(self.level + 1)
+            self._prepare(config, self.level)
+        elif self.under >= config.governor_up_after and self.level > 0:
+            self._set_level(self.level - 1)
+            self._prepare(config, self.level)
+        return self.level
+
+    def _set_level(self, level):
+        print(f"Quality level {self.level} ({LEVELS[self.level]}) -> {level} ({LEVELS[level]})")
+        self.level = level
+        self.over = self.under = 0
+        self.changes += 1
+
+    def close(self):
+        for level_cfg, _, _ in self._levels.values():
+            if level_cfg is not self._base:
+                level_cfg.close()
+        self._levels = {}
@@ -0,0 +1,176 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Use the numba kernels when numba is installed. Set to False to always run the NumPy ones,
+# e.g. to rule numba out while debugging. Both give identical results.
+USE_NUMBA = True
+
+
+# NumPy kernels, always available
+
+def _fit_segments_numpy(x1, y1, x2, y2):
+    # Slope (m) and y-intercept (c) of y = mx + c through the two endpoints of every segment,
+    # the least-squares line np.linalg.lstsq gives for two points. A flat segment, or a vertical
+    # one on x = 0, gets m = 0 exactly in both backends, which the grouping reads as "no lane".
+    dx = x2 - x1
+    vertical = dx == 0
+    safe_dx = np.where(vertical, 1.0, dx)
+    m = np.where(vertical, 0.0, (y2 - y1) / safe_dx)
+    c = np.where(vertical, 0.0, y1 - m * x1)
+    if vertical.any():
+        # Both rows of the lstsq system are [x, 1], the minimum-norm fit to the mean y
+        mean_y = (y1 + y2) / 2
+        m = np.where(vertical, x1 * mean_y / (x1 * x1 + 1), m)
+        c = np.where(vertical, mean_y / (x1 * x1 + 1), c)
+    return m, c
+
+
+def _group_segments_numpy(m, c, slope_low, slope_high, intercept_low, intercept_high):
+    # Group similar lines based on slope and y-intercept, in detection order.
+    # A line joins the first group whose first line it matches, otherwise it starts a new group.
+    # Groups are identified by the slope of their first line, and a new group with the same slope
+    # as an existing one takes that group's place (its lines are dropped), as draw_lanes always did.
+    # Lines with m = 0 can't be extended to the horizon, they stay out of every group (label -1).
+    slopes, intercepts = m.tolist(), c.tolist()
+    labels = [-1] * len(slopes)
+    key_slopes, key_intercepts = [], []
+    for idx, (line_m, line_c) in enumerate(zip(slopes, intercepts)):
+        if line_m == 0:
+            continue
+        for group, (key_m, key_c) in enumerate(zip(key_slopes, key_intercepts)):
+            # By default the slope should be between 0.2x and 1.2x of the group's first line's slope,
+            # and the y-intercept between 0.2x and 1.2x of its y-intercept.
+            if abs(key_m*slope_high) > abs(line_m) > abs(key_m*slope_low) and \
+               abs(key_c*intercept_high) > abs(line_c) > abs(key_c*intercept_low):
+                labels[idx] = group
+                break
+        else:
+            if line_m in key_slopes:
+                group = key_slopes.index(line_m)
+                labels = [-1 if label == group else label for label in labels]
+                key_intercepts[group] = line_c
+            else:
+                group = len(key_slopes)
+                key_slopes.append(line_m)
+                key_intercepts.append(line_c)
+            labels[idx] = group
+    return np.array(labels, np.int64), np.array(key_slopes, np.float64)
+
+
+def _average_groups_numpy(labels, values, groups):
+    # Number of lines in each group and the mean of every column of values over them
+    member = labels >= 0
+    counts = np.bincount(labels[member], minlength=groups)
+    means = np.empty((groups, values.shape[1]))
+    for column in range(values.shape[1]):
+        sums = np.bincount(labels[member], weights=values[member, column], minlength=groups)
+        means[:, column] = sums / np.maximum(counts, 1)
+    return counts, means
+
+
+# numba kernels, the same steps as plain loops. Compiled on first use and cached on disk
+# (cache=True), so only the very first launch pays for the compilation.
+
+def _fit_segments_loop(x1, y1, x2, y2):
+    n = len(x1)
+    m = np.empty(n)
+    c = np.empty(n)
+    for i in range(n):
+        if x2[i] == x1[i]:
+            mean_y = (y1[i] + y2[i]) / 2
+            m[i] = x1[i] * mean_y / (x1[i] * x1[i] + 1)
+            c[i] = mean_y / (x1[i] * x1[i] + 1)
+        else:
+            m[i] = (y2[i] - y1[i]) / (x2[i] - x1[i])
+            c[i] = y1[i] - m[i] * x1[i]
+    return m, c
+
+
+def _group_segments_loop(m, c, slope_low, slope_high, intercept_low, intercept_high):
+    n = len(m)
+    labels = np.full(n, -1, np.int64)
+    key_slopes = np.empty(n)
+    key_intercepts = np.empty(n)
+    groups = 0
+    for idx in range(n):
+        line_m, line_c = m[idx], c[idx]
+        if line_m == 0:
+            continue
+        grouped = False
+        for group in range(groups):
+            key_m, key_c = key_slopes[group], key_intercepts[group]
+            if abs(key_m*slope_high) > abs(line_m) > abs(key_m*slope_low) and \
+               abs(key_c*intercept_high) > abs(line_c) > abs(key_c*intercept_low):
+                labels[idx] = group
+                grouped = True
+                break
+        if grouped:
+            continue
+        replaced = -1
+        for group in range(groups):
+            if key_slopes[group] == line_m:
+                replaced = group
+                break
+        if replaced >= 0:
+            for other in range(idx):
+                if labels[other] == replaced:
+                    labels[other] = -1
+            key_intercepts[replaced] = line_c
+            labels[idx] = replaced
+        else:
+            key_slopes[groups] = line_m
+            key_intercepts[groups] = line_c
+            labels[idx] = groups
+            groups += 1
+    return labels, key_slopes[:groups].copy()
+
+
+def _average_groups_loop(labels, values, groups):
+    counts = np.zeros(groups, np.int64)
+    sums = np.zeros((groups, values.shape[1]))
+    for i in range(len(labels)):
+        group = labels[i]
+        if group >= 0:
+            counts[group] += 1
+            for column in range(values.shape[1]):
+                sums[group, column] += values[i, column]
+    means = np.empty((groups, values.shape[1]))
+    for group in range(groups):
+        for column in range(values.shape[1]):
+            means[group, column] = sums[group, column] / max(counts[group], 1)
+    return counts, means
+
+
+KERNELS = {"numpy": (_fit_segments_numpy, _group_segments_numpy, _average_groups_numpy)}
+if numba is not None:
+    KERNELS["numba"] = tuple(numba.njit(cache=True)(kernel) for kernel in
+                             (_fit_segments_loop, _group_segments_loop, _average_groups_loop))
+
+
+def set_backend(name):
+    """
+    Switches the kernels used by fit_segments, group_segments and average_groups ("numpy" or "numba").
+    """
+    global BACKEND, fit_segments, group_segments, average_groups
+    if name not in KERNELS:
+        raise ValueError(f"Lane kernel backend {name!r} is not available, choose from {', '.join(KERNELS)}")
+    BACKEND = name
+    fit_segments, group_segments, average_groups = KERNELS[name]
+
+
+def precompile():
+    """
+    Runs every kernel once on a tiny input so numba compiles them (or loads them from its cache)
+    before the first frame. Does nothing for the NumPy kernels.
+    """
+    xs = np.array([0.0, 10.0, 5.0])
+    m, c = fit_segments(xs, xs + 1, xs + 3, xs + 9)
+    labels, key_slopes = group_segments(m, c, 0.2, 1.2, 0.2, 1.2)
+    average_groups(labels, np.stack([xs, xs], axis=1), len(key_slopes))
+
+
+set_backend("numba" if USE_NUMBA and "numba" in KERNELS else "numpy")
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def fit_polynomial(ys, xs, degree=2):
+    """
+    Least-squares fit of x = f(y) through a set of lane points, in one vectorised solve.
+
+    Lanes are fitted as x over y because they run up the screen, where y = f(x) would be
+    close to vertical and badly conditioned.
+
+    Function Args:
+    - ys, xs: Coordinates of the lane points.
+    - degree: 1 for a straight lane, 2 for a curved one.
+    Returns:
+    - The coefficients, highest power first (np.polyval order), or None with too few points.
+    """
+    ys = np.asarray(ys, np.float64)
+    xs = np.asarray(xs, np.float64)
+    if len(ys) <= degree:
+        return None
+    return np.linalg.lstsq(np.vander(ys, degree + 1), xs, rcond=None)[0]
+
+
+def segment_points(segments, samples=5):
+    """
+    Evenly spaced points along line segments (x1, y1, x2, y2), returned as (ys, xs).
+
+    Fitting a curve to the endpoints alone is ill-posed: Hough segments of one lane tend to start
+    and end on the same rows, so the endpoints sit at two heights and any curve through them fits.
+    """
+    segments = np.asarray(segments, np.float64).reshape(-1, 4)
+    t = np.linspace(0, 1, samples)
+    xs = segments[:, [0]] + t * (segments[:, [2]] - segments[:, [0]])
+    ys = segments[:, [1]] + t * (segments[:, [3]] - segments[:, [1]])
+    return ys.ravel(), xs.ravel()
+
+
+def curvature(coefficients, y):
+    """
+    Signed curvature (1 / radius, in 1 / pixels) of x = f(y) at y, zero for a straight lane.
+    """
+    first = np.polyval(np.polyder(coefficients), y)
+    second = np.polyval(np.polyder(coefficients, 2), y) if len(coefficients) > 2 else 0.0
+    return second / (1 + first ** 2) ** 1.5
+
+
+def lane_polyline(coefficients, top, bottom, points=20):
+    """
+    Samples x = f(y) from y = top to y = bottom as an int32 polyline for cv2.polylines.
+    """
+    ys = np.linspace(top, bottom, points)
+    return np.round(np.stack([np.polyval(coefficients, ys), ys], axis=1)).astype(np.int32)
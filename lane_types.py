@@ -0,0 +1,100 @@
+import numpy as np
+import lane_kernels
+
+# One detected line segment: its endpoints, its line equation y = mx + c, and the x positions
+# where the line crosses the top (horizon) and bottom rows the lanes are extended to.
+SEGMENT_DTYPE = np.dtype([
+    ("x1", np.int32), ("y1", np.int32), ("x2", np.int32), ("y2", np.int32),
+    ("m", np.float64), ("c", np.float64),
+    ("top_x", np.int32), ("bottom_x", np.int32),
+])
+
+
+def segment_batch(lines, min_y, max_y):
+    """
+    Turns HoughLinesP-style lines (N, 1, 4) into a SEGMENT_DTYPE array in one vectorised pass.
+
+    m and c are the least-squares line through the two endpoints, the same numbers
+    np.linalg.lstsq gives for each segment (see lane_kernels.fit_segments). A flat segment
+    (m = 0) never crosses the horizon row, its top_x and bottom_x are left at 0.
+    """
+    xyxy = np.asarray(lines).reshape(-1, 4)
+    batch = np.empty(len(xyxy), SEGMENT_DTYPE)
+    batch["x1"], batch["y1"], batch["x2"], batch["y2"] = xyxy.T
+    m, c = lane_kernels.fit_segments(*xyxy.T.astype(np.float64))
+    batch["m"], batch["c"] = m, c
+
+    sloped = m != 0
+    batch["top_x"] = np.trunc(np.divide(min_y - c, m, out=np.zeros_like(m), where=sloped))
+    batch["bottom_x"] = np.trunc(np.divide(max_y - c, m, out=np.zeros_like(m), where=sloped))
+    return batch
+
+
+class Lane:
+    """
+    One lane found in a frame.
+
+    - slope: m of y = mx + c near the car, what steering looks at.
+    - coords: (x1, y1, x2, y2) of a straight lane, None for a curve.
+    - coefficients: x = f(y) polynomial of a curved lane (highest power first), None for a straight one.
+    - points: The lane as an int32 polyline in the camera view, for drawing curves.
+    - support: How many segments (or edge pixels) the lane was built from.
+    - confidence: 0..1, the share of the frame's evidence that backs this lane.
+    """
+    __slots__ = ("slope", "coords", "coefficients", "points", "support", "confidence")
+
+    def __init__(self, slope, coords=None, coefficients=None, points=None, support=0, confidence=0.0):
+        self.slope = slope
+        self.coords = coords
+        self.coefficients = coefficients
+        self.points = points
+        self.support = support
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"Lane(slope={self.slope:.3f}, support={self.support}, confidence={self.confidence:.2f})"
+
+
+class FrameResult:
+    """
+    Everything process_img produces for one frame.
+
+    - processed, original: The edge image and the captured frame (with the overlays if drawn).
+    - m1, m2: Slopes of the two lanes, 0 when no lane pair was found.
+    - lanes: The two Lane objects, empty when no lane pair was found.
+    - curvature: Mean curvature of the lanes in 1 / pixels, None when the lane model can't tell.
+    - confidence: The weaker lane's confidence, 0 without lanes.
+    - timestamp: time.time() when processing started.
+    - stage_ms: Milliseconds spent in each pipeline stage, by stage name.
+    - quality: The governor's quality level the frame was processed at, 0 is full quality (see governor.py).
+
+    Unpacks like the (processed, original, m1, m2) tuple process_img used to return.
+    """
+    __slots__ = ("processed", "original", "m1", "m2", "lanes", "curvature", "confidence", "timestamp", "stage_ms",
+                 "quality")
+
+    def __init__(self, processed, original, m1=0, m2=0, lanes=(), curvature=None, timestamp=0.0, stage_ms=None,
+                 quality=0):
+        self.processed = processed
+        self.original = original
+        self.m1 = m1
+        self.m2 = m2
+        self.lanes = lanes
+        self.curvature = curvature
+        self.confidence = min(lane.confidence for lane in lanes) if lanes else 0.0
+        self.timestamp = timestamp
+        self.stage_ms = stage_ms if stage_ms is not None else {}
+        self.quality = quality
+
+    def __iter__(self):
+        return iter((self.processed, self.original, self.m1, self.m2))
+
+    def __len__(self):
+        return 4
+
+    def __getitem__(self, index):
+        return (self.processed, self.original, self.m1, self.m2)[index]
+
+    def __repr__(self):
+        return (f"FrameResult(m1={self.m1:.3f}, m2={self.m2:.3f}, confidence={self.confidence:.2f}, "
+                f"stages={ {name: round(ms, 2) for name, ms in self.stage_ms.items()} })")
@@ -0,0 +1,128 @@
+import threading
+import cv2
+import numpy as np
+
+# Segments are returned the way cv2.HoughLinesP returns them, an int32 array of shape (N, 1, 4)
+# holding x1, y1, x2, y2, or None when nothing is found, so draw_lanes works with every engine.
+
+
+def hough_lines(edges, config):
+    # Use the Hough transform to detect lines in the image.
+    # These lines will represent the lane lines and other linear features.
+    return cv2.HoughLinesP(edges, config.hough_rho, config.hough_theta, config.hough_threshold,
+                           minLineLength=config.hough_min_line_length, maxLineGap=config.hough_max_line_gap)
+
+
+def as_segments(segments, min_length):
+    """
+    Rounds float segments of shape (N, 1, 4) or (N, 4) to the HoughLinesP format and drops the ones
+    shorter than min_length. Returns None when no segment is left, like HoughLinesP.
+    """
+    if segments is None or len(segments) == 0:
+        return None
+    segments = np.asarray(segments, np.float32).reshape(-1, 4)
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    segments = segments[lengths >= min_length]
+    if len(segments) == 0:
+        return None
+    return np.round(segments).astype(np.int32).reshape(-1, 1, 4)
+
+
+class HoughDetector:
+    """
+    The probabilistic Hough transform the bot has always used, driven by the [hough] settings.
+    """
+    available = True
+
+    def __call__(self, edges, config):
+        return hough_lines(edges, config)
+
+
+class LSDDetector:
+    """
+    OpenCV's Line Segment Detector. It works on intensity gradients and needs no vote threshold,
+    so it also picks up short or faint markings. Each edge stripe yields a segment on both of its
+    sides, which draw_lanes groups into the same lane.
+    """
+    available = hasattr(cv2, "createLineSegmentDetector")
+
+    def __init__(self):
+        # The detector keeps per-image state, so every thread (see batch.py) gets its own
+        self._local = threading.local()
+
+    def __call__(self, edges, config):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = self._local.detector = cv2.createLineSegmentDetector(cv2.LSD_REFINE_NONE)
+        return as_segments(detector.detect(edges)[0], config.hough_min_line_length)
+
+
+class FastLineDetector:
+    """
+    The Fast Line Detector from opencv-contrib (cv2.ximgproc), a faster LSD-style detector.
+    Only available when opencv-contrib-python is installed.
+    """
+    available = hasattr(cv2, "ximgproc") and hasattr(cv2.ximgproc, "createFastLineDetector")
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, edges, config):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            # The input is already an edge image, so FLD's own Canny step is switched off
+            detector = self._local.detector = cv2.ximgproc.createFastLineDetector(
+                length_threshold=int(config.hough_min_line_length), canny_aperture_size=0, do_merge=True)
+        return as_segments(detector.detect(edges), config.hough_min_line_length)
+
+
+class ContourDetector:
+    """
+    Traces the outline of every edge blob and splits it into straight pieces with approxPolyDP.
+    Costs one pass over the edge image instead of a vote per pixel and angle, so it stays fast
+    on busy scenes where the Hough accumulator fills up.
+    """
+    available = True
+    # Largest distance (pixels) an outline may stray from the straight piece that replaces it
+    EPSILON = 2.0
+
+    def __call__(self, edges, config):
+        contours, _ = cv2.findContours(cv2.threshold(edges, 0, 255, cv2.THRESH_BINARY)[1],
+                                       cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        pieces = []
+        for contour in contours:
+            if len(contour) < 2:
+                continue
+            points = cv2.approxPolyDP(contour, self.EPSILON, True).reshape(-1, 2)
+            # Consecutive corners of the closed outline are the segments
+            pieces.append(np.hstack([points, np.roll(points, -1, axis=0)]))
+        if not pieces:
+            return None
+        segments = np.vstack(pieces)
+        return as_segments(segments, config.hough_min_line_length)
+
+
+# Engine names as used in pipeline.toml ([lines] engine)
+ENGINES = {
+    "hough": HoughDetector,
+    "lsd": LSDDetector,
+    "fld": FastLineDetector,
+    "contours": ContourDetector,
+}
+
+
+def available_engines():
+    return [name for name, engine in ENGINES.items() if engine.available]
+
+
+def create_line_detector(name):
+    """
+    Returns the line detector for an engine name. Every detector is called as
+    detector(edges, config) and returns HoughLinesP-style segments.
+    """
+    if name not in ENGINES:
+        raise ValueError(f"Unknown line engine {name!r}, choose from {', '.join(ENGINES)}")
+    engine = ENGINES[name]
+    if not engine.available:
+        raise ValueError(f"Line engine {name!r} is not available in this OpenCV build")
+    return engine()
@@ -1,22 +1,63 @@
+from startup import STARTUP, lazy_import, warm_up
 import cv2
 import numpy as np
 import time
-from mss import mss
-from statistics import mean
-from numpy.linalg import lstsq
-from numpy import ones,vstack
-from directkeys import PressKey, ReleaseKey, W,A,D,S
+from functools import partial
+from autotune import load_or_tune
+from dataset import synthetic_frame
+from config import PipelineConfig, ConfigWatcher, CONFIG_PATH
+from frame_skip import FrameChangeDetector
+from buffers import BufferArena
+from governor import QualityGovernor
+from actuation import PwmSteering, steering_command
+from filters import FILTERS
+from capture import Region, MultiRegionCapture
+from lane_model import fit_polynomial, segment_points, lane_polyline, curvature as lane_curvature
+from lane_types import segment_batch, Lane, FrameResult
+import lane_kernels
+# mss and directkeys are loaded on first use through lazy_import, so this module
+# also imports on machines without them (directkeys only works on Windows)
+STARTUP.mark("imports")
+
+# ROI, Canny, blur, Hough and lane grouping settings live in pipeline.toml.
+# This is the config used when none is passed in, the bot itself follows the file as it changes.
+CONFIG = PipelineConfig.load(CONFIG_PATH)
+
+# Screen regions grabbed every frame, all with a single grab (see capture.py). "road" is what
+# the bot steers by. Watch more of the screen by adding regions, each with its own callback and rate,
+# e.g. Region("minimap", 20, 480, 180, 120, callback=read_minimap, every=5)
+CAPTURE_REGIONS = [Region("road", 0, 40, 800, 600)]
+
+# Pick the fastest OpenCV thread count for this machine at startup (cached in opencv_profile.json)
+AUTOTUNE = True
 
 # Function to capture a specific screen region using the mss library
-def capture_screen_region(x, y, width, height):
-    with mss() as sct:
+# Pass out (a (height, width, 4) uint8 array, see buffers.py) to copy the screenshot into it instead of a new array
+def capture_screen_region(x, y, width, height, out=None):
+    with lazy_import("mss").mss() as sct:
         # Define the region for screen capture
         monitor = {"top": y, "left": x, "width": width, "height": height}
         # Capture the screenshot for the defined region
         screenshot = sct.grab(monitor)
+        if out is not None:
+            np.copyto(out, np.asarray(screenshot))
+            return out
         # Convert the screenshot to a numpy array and return
         return np.array(screenshot)
 
+def capture_road(capture, buffers):
+    """
+    Grabs every region of a MultiRegionCapture and copies the road view into the arena's next
+    capture buffer. The overlays are then drawn on that copy instead of the screenshot the other
+    regions' views share, and the frame behind the last result survives the next grab (see
+    BufferArena.hold). mss hands out a new screenshot every grab, so this one copy is what keeps
+    the frame loop's images preallocated.
+    """
+    road = capture.grab()["road"]
+    frame = buffers.next_capture(road.shape)
+    np.copyto(frame, road)
+    return frame
+
 # Function to extract a region of interest from the image
 def roi(img, vertices):
     # Initialize a blank mask of zeros with the same shape as the image
@@ -34,112 +75,98 @@ def draw_lines(img, lines):
         # Draw the line on the image
         cv2.line(img, (coords[0], coords[1]), (coords[2], coords[3]), [255,255,255], 3)
 
-def draw_lanes(img, lines, color=[0, 255, 255], thickness=3):
+def group_lanes(img, lines, config=None):
+    """
+    Groups the detected lines into the two dominant lanes.
+
+    Function Args:
+    - img: The image the lines were found in, only its shape is used (None for the base resolution).
+    - lines: The lines detected in the image, in the HoughLinesP format.
+    - config: PipelineConfig with the grouping tolerances and lane model, defaults to CONFIG.
+    Returns:
+    - The two lanes as Lane objects. Raises if no pair of lanes can be formed.
+    """
+    config = config or CONFIG
+    slope_low, slope_high = config.slope_tolerance
+    intercept_low, intercept_high = config.intercept_tolerance
+    if lines is None:
+        raise ValueError("no lines were detected")
+
+    # Extract y-coordinates from the detected lines to determine the horizon level.
+    min_y = int(lines[..., 1::2].min())
+    # Bottom of the lane lines, the game resolution in Y coordinate scaled to this image
+    max_y = config.derived(img.shape).max_y if img is not None else config.lanes_max_y
+
+    # Calculate line equations for detected lines, all in one go.
+    # For each segment this holds its endpoints, its slope (m) and y-intercept (c) of y = mx + c,
+    # and the x positions where the line reaches the horizon (min_y) and the bottom (max_y).
+    # modified from http://stackoverflow.com/questions/21565994/method-to-return-the-equation-of-a-straight-line-given-two-points
+    segments = segment_batch(lines, min_y, max_y)
+
+    # Group similar lines based on slope and y-intercept (see lane_kernels.group_segments).
+    # Every line gets the index of its group, and each group is identified by the slope of its first line.
+    # A flat segment (road texture, a car's edge) can't be extended to the horizon and is no
+    # lane, the kernels leave it out of every group (label -1) instead of giving up on the frame.
+    labels, group_slopes = lane_kernels.group_segments(segments["m"], segments["c"], slope_low, slope_high,
+                                                       intercept_low, intercept_high)
+    # Count the lines of each group and average their extended coordinates in the same pass
+    extended = np.stack([segments["top_x"], segments["bottom_x"]], axis=1).astype(np.float64)
+    counts, means = lane_kernels.average_groups(labels, extended, len(group_slopes))
+
+    # From the groups, we want to determine the two most dominant lanes. These are often
+    # the left and right lanes in a typical road scenario.
+    # The idea is that a dominant lane will have more lines grouped under it, so the groups
+    # are ranked by their count of lines (ties keep the order the groups were found in).
+    top_lanes = np.argsort(-counts, kind="stable")[:2]
+
+    # Extract the two most dominant lanes.
+    lane1_group, lane2_group = top_lanes[0], top_lanes[1]
+
+    def straight_lane(group):
+        # The averaged extended line of the group is the single representative line of the lane.
+        coords = (int(means[group, 0]), min_y, int(means[group, 1]), max_y)
+        return Lane(float(group_slopes[group]), coords=coords, support=int(counts[group]),
+                    confidence=float(counts[group] / len(segments)))
+
+    def curved_lane(group):
+        # Fit a curve through points along every segment of the group, one vectorised
+        # least-squares solve per lane.
+        slope = group_slopes[group]
+        # The grouping compares absolute slopes, so a group can pick up a line leaning the
+        # other way. Averaging shrugs it off, a curve would bend towards it, so leave it out.
+        members = segments[(labels == group) & (np.sign(segments["m"]) == np.sign(slope))]
+        ys, xs = segment_points(np.stack([members["x1"], members["y1"], members["x2"], members["y2"]], axis=1))
+        coefficients = fit_polynomial(ys, xs, 2)
+        # Slope where the lane meets the bottom of the image, in the same y = mx + c terms
+        dx_dy = 2 * coefficients[0] * max_y + coefficients[1]
+        return Lane(1 / dx_dy if dx_dy else np.inf, coefficients=coefficients,
+                    points=lane_polyline(coefficients, min_y, max_y),
+                    support=len(members), confidence=len(members) / len(segments))
+
+    make_lane = curved_lane if config.lane_model == "quadratic" else straight_lane
+    return make_lane(lane1_group), make_lane(lane2_group)
+
+def draw_lanes(img, lines, color=[0, 255, 255], thickness=3, config=None):
     """
     Identifies and draws lanes on the given image based on detected lines.
 
     Function Args:
     - img: The input image on which lanes are to be drawn.
     - lines: The lines detected in the image.
+    - config: PipelineConfig with the grouping tolerances and lane model, defaults to CONFIG.
     Returns:
-    - Coordinates of the two main lanes detected.
+    - Coordinates of the two main lanes detected and their slopes. With the quadratic lane model
+      the lanes are coefficient arrays of x = ay^2 + by + c instead of coordinates, and the slopes
+      are taken where the curves reach the bottom of the image.
     """
+    config = config or CONFIG
     try:
-        # Extract y-coordinates from the detected lines to determine the horizon level.
-        ys = [coord for i in lines for coord in [i[0][1], i[0][3]]]
-        min_y = min(ys)
-        max_y = 600  # Assuming a fixed value for the maximum y-coordinate, as it is the game resoloution in Y coordinate
-
-        # Calculate line equations for detected lines and filter relevant ones.
-        # Create a dictionary to store the calculated line equations for each detected line
-        line_dict = {}
-        # Loop through each line detected by the Hough transform
-        # modified from http://stackoverflow.com/questions/21565994/method-to-return-the-equation-of-a-straight-line-given-two-points
-        for idx, line in enumerate(lines):
-            # For each detected line, it provides two sets of x,y coordinates representing 
-            # the start and end points of the line segment.
-            for xyxy in line:
-
-                # Extract the x and y coordinates of the start and end points of the line segment.
-                # x_coords contains the x-values of the start and end points of the line.
-                # y_coords contains the y-values of the start and end points of the line.
-                x_coords, y_coords = (xyxy[0], xyxy[2]), (xyxy[1], xyxy[3])
-                
-                # Construct the A matrix for the least squares method. 
-                # The A matrix is constructed such that each row corresponds to the x coordinate 
-                # of a point and a constant value of 1. This format is used to solve for the slope 
-                # (m) and y-intercept (c) of the line equation y = mx + c using the least squares method.                
-                A = vstack([x_coords, ones(len(x_coords))]).T
-
-                # Use the least squares method to compute the slope (m) and y-intercept (c) 
-                # of the best-fit line for the provided points. The lstsq function returns 
-                # multiple values, but we're primarily interested in the first value which contains m and c.
-                m, c = lstsq(A, y_coords, rcond=None)[0]  # Line equation: y = mx + c
-
-                # Compute new endpoints for the line based on the detected horizon.
-                x1, x2 = int((min_y-c) / m), int((max_y-c) / m)
-
-                # Store the calculated slope (m), y-intercept (c), and line segment coordinates 
-                # in the line_dict dictionary for further processing or filtering.
-                line_dict[idx] = [m, c, [x1, min_y, x2, max_y]]
-
-        # Group similar lines based on slope and y-intercept.
-        final_lanes = {}
-        for idx, (m, c, line) in line_dict.items():
-             # If 'final_lanes' is empty, add the first line.
-            if not final_lanes:
-                final_lanes[m] = [[m, c, line]]
-            else:
-                # Assume the line is not grouped initially
-                grouped = False
-
-                # Iterate over the existing lines in 'final_lanes'.
-                for key_m, group in final_lanes.items():
-                    # Check if the current line's slope and y-intercept are similar to an existing group's.
-                    # The slope should be within 20% (1.2x and 0.8x) of an existing line's slope.
-                    # The y-intercept should also be within 20% of an existing line's y-intercept.
-                    if abs(key_m*1.2) > abs(m) > abs(key_m*0.2) and \
-                       abs(group[0][1]*1.2) > abs(c) > abs(group[0][1]*0.2):
-                        
-                        # If conditions are met, append the current line to the existing group.
-                        final_lanes[key_m].append([m, c, line])
-                        # Indicate that the line has been grouped.
-                        grouped = True
-                        break
-                
-                # If the line was not grouped with any existing groups, create a new group for it.   
-                if not grouped:
-                    final_lanes[m] = [[m, c, line]]
-
-        # From the previously grouped lines in 'final_lanes', we want to determine 
-        # the two most dominant lanes. These are often the left and right lanes 
-        # in a typical road scenario.
-
-        # Create a list of tuples containing each lane's slope (as an identifier) 
-        # and the count of lines grouped under that slope. 
-        # The idea is that a dominant lane will have more lines grouped under it.
-        top_lanes = sorted([(k, len(v)) for k, v in final_lanes.items()], key=lambda x: x[1], reverse=True)[:2]
-        
-        # Extract the slope identifiers for the two most dominant lanes.
-        lane1_id, lane2_id = top_lanes[0][0], top_lanes[1][0]
-
-        # Define a function to average out the coordinates of the lines 
-        # within a given lane group. This will provide a single representative 
-        # line for that lane.
-        def average_lane(lane_data):
-            # Extract the start and end coordinates for all the lines in the lane group.
-            x1s, y1s, x2s, y2s = zip(*[data[2] for data in lane_data])
-            
-            # Calculate the mean of the start and end coordinates 
-            # to get the average line for the lane group.
-            return int(mean(x1s)), int(mean(y1s)), int(mean(x2s)), int(mean(y2s))
-
-        # Get the averaged coordinates for the two dominant lanes.
-        lane1_coords, lane2_coords = average_lane(final_lanes[lane1_id]), average_lane(final_lanes[lane2_id])
-
-        # Return the averaged coordinates, which will be used to draw 
+        lane1, lane2 = group_lanes(img, lines, config)
+        if config.lane_model == "quadratic":
+            return lane1.coefficients, lane2.coefficients, lane1.slope, lane2.slope
+        # Return the averaged coordinates, which will be used to draw
         # the representative lines for the two dominant lanes.
-        return lane1_coords, lane2_coords,lane1_id, lane2_id
+        return lane1.coords, lane2.coords, lane1.slope, lane2.slope
 
     # Handle any exceptions that may arise during the lane detection process.
     except Exception as e:
@@ -147,48 +174,176 @@ def draw_lanes(img, lines, color=[0, 255, 255], thickness=3):
 
 
 
-# Main image processing function
-def process_img(original_image):
+# The stages of process_img, each one takes the output of the previous stage.
+# Kept as separate functions so they can be timed one by one (see autotune.py).
+# The image stages take an optional dst, a preallocated image OpenCV writes the result into.
+def to_gray(image, config=None, dst=None):
     # Convert the RGB image to a grayscale image to simplify analysis.
-    processed_img = cv2.cvtColor(original_image, cv2.COLOR_BGR2GRAY)
-    
+    # Frames that arrive gray already (remote.py sends gray crops) go through as they are.
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
+
+def detect_edges(gray, config=None, dst=None):
     # Use Canny edge detection to detect edges in the image.
     # This will highlight the structural features, such as lanes.
-    # original th1 = 200 th2 = 300
-    processed_img = cv2.Canny(processed_img, threshold1=150, threshold2=300)
-    
+    config = config or CONFIG
+    return cv2.Canny(gray, threshold1=config.canny_thresholds[0], threshold2=config.canny_thresholds[1], edges=dst)
+
+def blur_edges(edges, config=None, dst=None):
     # Apply a Gaussian blur to the image to reduce noise and make edges smoother.
     # This helps in achieving better results in edge detection.
-    processed_img = cv2.GaussianBlur(processed_img, (3,3), 0)
-    
-    # Define a polygonal region of interest (ROI) to focus on the main road area.
+    # [edges] filter picks another smoothing filter (see filters.py), "none" passes the image through.
+    config = config or CONFIG
+    smooth = FILTERS[config.edge_filter]
+    if smooth is None:
+        return edges
+    return smooth(edges, config, dst=dst)
+
+def mask_roi(edges, config=None, dst=None):
+    # Apply the ROI on the processed image to retain only the polygonal region of the road.
     # This helps to ignore other unnecessary details from the image.
-    #vertices = np.array([[10,500],[10,300],[300,200],[500,200],[800,300],[800,500]], np.int32) #Original
-    #vertices = np.array([[10, 500], [300, 250],  [500, 200], [790, 400]], np.int32) #no2
-    #vertices = np.array([[10, 500], [300, 250],  [500, 200], [790, 400]], np.int32)
-    vertices = np.array([[10,500],[28,360],[350,320],[450,320],[750,360],[800,500]], np.int32) 
-    #vertices = np.array([[10,500],[10,360],[300,220],[500,220],[800,360],[800,500]], np.int32) 
-    
-    # Apply the ROI on the processed image to retain only the defined polygonal region.
-    processed_img = roi(processed_img, [vertices])
-    
-    # Use the Hough transform to detect lines in the image.
-    # These lines will represent the lane lines and other linear features.
-    lines = cv2.HoughLinesP(processed_img, 1, np.pi/180, 180, 20, 15)
+    # The mask is drawn once per config and capture size, same result as roi().
+    config = config or CONFIG
+    return cv2.bitwise_and(edges, config.derived(edges.shape).mask, dst=dst)
+
+def detect_lines(edges, config=None):
+    # Find the line segments with the engine chosen in [lines] (HoughLinesP by default).
+    # Every engine returns the segments in the HoughLinesP format.
+    config = config or CONFIG
+    return config.derived(edges.shape).line_detector(edges, config)
+
+def edge_image(image, config=None, masked=True):
+    # The edge image process_img finds the lines in, with the filter where [edges] filter_position puts it.
+    config = config or CONFIG
+    gray = to_gray(image, config)
+    if config.filter_position == "before":
+        edges = detect_edges(blur_edges(gray, config), config)
+    else:
+        edges = blur_edges(detect_edges(gray, config), config)
+    return mask_roi(edges, config) if masked else edges
+
+def find_lanes(lines, config=None):
+    # Group the detected lines into the two main lanes, without drawing anything.
+    return draw_lanes(None, lines, config=config)
+
+def find_lanes_birdseye(edges, config=None):
+    # Search the lanes in a top-down view of the edges, replaces the lines and lanes stages.
+    config = config or CONFIG
+    return config.derived(edges.shape).birdseye(edges)
+
+def pipeline_stages(config=None):
+    """
+    Returns the stages of process_img as (name, function) pairs bound to a config.
+    """
+    config = config or CONFIG
+    stages = [("gray", to_gray), ("canny", detect_edges), ("roi", mask_roi)]
+    if config.edge_filter != "none":
+        # Smooths the gray image before Canny, or the edges after it
+        stages.insert(1 if config.filter_position == "before" else 2, ("blur", blur_edges))
+    if config.birdseye_enabled:
+        stages.append(("birdseye", find_lanes_birdseye))
+    else:
+        stages += [("lines", detect_lines), ("lanes", find_lanes)]
+    return [(name, partial(stage, config=config)) for name, stage in stages]
+
+
+# Records how long a stage of process_img took and returns the start time of the next one
+def _lap(stage_ms, name, start):
+    now = time.perf_counter()
+    stage_ms[name] = (now - start) * 1000
+    return now
+
+
+# Main image processing function
+# Returns a FrameResult, which still unpacks as processed_img, original_image, m1, m2
+# Set draw=False to skip the overlays so neither image gets drawn on (used by batch.py)
+# Pass a PipelineConfig to use other settings than pipeline.toml had when the module was imported
+# Pass a StripEdgeDetector as edge_detector to split the edge detection across threads,
+# by default one is used when the config sets [strips] threads
+# With [birdseye] enabled the lanes come from the top-down sliding-window search instead of line detection
+# Pass a buffers.BufferArena as buffers to write every stage into preallocated images instead of new ones,
+# the returned images are then overwritten by the next frame of the same size
+def process_img(original_image, draw=True, edge_detector=None, config=None, buffers=None):
+    config = config or CONFIG
+    timestamp = time.time()
+    stage_ms = {}
+    start = time.perf_counter()
+    if edge_detector is None:
+        edge_detector = config.derived(original_image.shape).edge_detector
+    frame_buffers = None
+    if buffers is not None:
+        frame_buffers = buffers.get(original_image.shape)
+
+    if edge_detector is not None:
+        # Same gray -> Canny -> blur -> ROI steps as below, run in horizontal strips on a thread pool.
+        # The result is bit-identical and lives in a buffer the detector reuses for the next frame.
+        processed_img = edge_detector(original_image)
+        start = _lap(stage_ms, "edges", start)
+    else:
+        # Each stage writes into its own preallocated image when there are buffers (dst=None otherwise)
+        fb = frame_buffers
+        smooth = config.edge_filter != "none"
+        processed_img = to_gray(original_image, config, dst=fb and fb.gray)
+        start = _lap(stage_ms, "gray", start)
+        if smooth and config.filter_position == "before":
+            processed_img = blur_edges(processed_img, config, dst=fb and fb.blurred)
+            start = _lap(stage_ms, "blur", start)
+        processed_img = detect_edges(processed_img, config, dst=fb and fb.edges)
+        start = _lap(stage_ms, "canny", start)
+        if smooth and config.filter_position == "after":
+            processed_img = blur_edges(processed_img, config, dst=fb and fb.blurred)
+            start = _lap(stage_ms, "blur", start)
+        processed_img = mask_roi(processed_img, config, dst=fb and fb.masked)
+        start = _lap(stage_ms, "roi", start)
+
     m1 = 0
     m2 = 0
+    lanes = ()
+    curvature = None
+    birdseye = config.derived(original_image.shape).birdseye
+    if birdseye is not None:
+        # Sliding-window search in a top-down view, the lanes are fitted as curves (see birdseye.py)
+        found = birdseye(processed_img)
+        _lap(stage_ms, "birdseye", start)
+        if found is not None:
+            lane1, lane2, curvature = found
+            lanes = (lane1, lane2)
+            m1, m2 = lane1.slope, lane2.slope
+            if draw:
+                cv2.polylines(original_image, [lane1.points, lane2.points], False, [0,0,255], 30)
+                cv2.polylines(processed_img, [lane1.points, lane2.points], False, [255,0,0], 3)
+        return FrameResult(processed_img, original_image, m1, m2, lanes, curvature, timestamp, stage_ms)
+
+    lines = detect_lines(processed_img, config)
+    start = _lap(stage_ms, "lines", start)
     try:
         # Get the two main lanes from the detected lines.
-        l1, l2,m1,m2= draw_lanes(original_image, lines)
-        
-        # Draw these main lanes on the original image for visualization.
-        cv2.line(original_image, (l1[0], l1[1]), (l1[2], l1[3]), [0,0,255], 30)  # Drawing in red color
-        cv2.line(original_image, (l2[0], l2[1]), (l2[2], l2[3]), [0,0,255], 30)
+        lanes = group_lanes(original_image, lines, config)
+        lane1, lane2 = lanes
+        m1, m2 = lane1.slope, lane2.slope
+        if config.lane_model == "quadratic":
+            # Mean curvature of the two curves where they meet the bottom of the image
+            max_y = config.derived(original_image.shape).max_y
+            curvature = float(np.mean([lane_curvature(lane.coefficients, max_y) for lane in lanes]))
+
+        if draw and config.lane_model == "quadratic":
+            # The lanes are curves, draw them from the highest detected line down to the bottom
+            cv2.polylines(original_image, [lane1.points, lane2.points], False, [0,0,255], 30)
+        elif draw:
+            # Draw these main lanes on the original image for visualization.
+            l1, l2 = lane1.coords, lane2.coords
+            cv2.line(original_image, (l1[0], l1[1]), (l1[2], l1[3]), [0,0,255], 30)  # Drawing in red color
+            cv2.line(original_image, (l2[0], l2[1]), (l2[2], l2[3]), [0,0,255], 30)
     except Exception as e:
-        # If there's any error in drawing main lanes, log the error.
-        print(str(e))
+        # If there's any error in finding or drawing the main lanes, log the error.
+        print(f"Error in draw_lanes: {e}")
         pass
-    
+    _lap(stage_ms, "lanes", start)
+
+    if not draw:
+        return FrameResult(processed_img, original_image, m1, m2, lanes, curvature, timestamp, stage_ms)
+
     try:
         # Draw all detected lines on the processed image for visualization.
         for coords in lines:
@@ -203,35 +358,131 @@ def process_img(original_image):
     
     # Return the processed image with all detected lines 
     # and the original image with the two main lanes drawn on it.
-    return processed_img, original_image,m1,m2
+    return FrameResult(processed_img, original_image, m1, m2, lanes, curvature, timestamp, stage_ms)
+
+def decide(m1, m2):
+    # The steering decision main() takes from the two lane slopes, as a word
+    if m1 < 0 and m2 < 0:
+        return "right"
+    elif m1 > 0  and m2 > 0:
+        return "left"
+    return "straight"
 
 def straight():
-    PressKey(W)
-    ReleaseKey(A)
-    ReleaseKey(D)
+    keys = lazy_import("directkeys")
+    keys.PressKey(keys.W)
+    keys.ReleaseKey(keys.A)
+    keys.ReleaseKey(keys.D)
 
 def left():
-    PressKey(A)
-    ReleaseKey(W)
-    ReleaseKey(D)
-    ReleaseKey(A)
+    keys = lazy_import("directkeys")
+    keys.PressKey(keys.A)
+    keys.ReleaseKey(keys.W)
+    keys.ReleaseKey(keys.D)
+    keys.ReleaseKey(keys.A)
 
 def right():
-    PressKey(D)
-    ReleaseKey(A)
-    ReleaseKey(W)
-    ReleaseKey(D)
+    keys = lazy_import("directkeys")
+    keys.PressKey(keys.D)
+    keys.ReleaseKey(keys.A)
+    keys.ReleaseKey(keys.W)
+    keys.ReleaseKey(keys.D)
 
 
-def main():
+def start_up(keys=True, frame=None, watch=True, windows=True):
+    """
+    Loads the backends, calibrates OpenCV and warms the pipeline up so the first live frame
+    is as fast as the ones after it.
+
+    Function Args:
+    - keys: Also load the DirectInput backend (debugdrive.py doesn't press keys).
+    - frame: A frame to calibrate on instead of a screen capture, e.g. from a recording.
+    - watch: Let the ConfigWatcher follow the file on its own thread (see ConfigWatcher.check).
+    - windows: Open the display windows.
+    Returns:
+    - A ConfigWatcher following pipeline.toml, read `watcher.current` once per frame.
+    """
+    if keys:
+        lazy_import("directkeys")
+    if frame is None:
+        lazy_import("mss")
+        with STARTUP.phase("first capture"):
+            frame = capture_screen_region(0, 40, 800, 600)
+
+    # Loads the config and builds its ROI mask/vertices for the capture size up front
+    with STARTUP.phase("config"):
+        watcher = ConfigWatcher(CONFIG_PATH, shapes=[frame.shape], watch=watch)
+    config = watcher.current
+
+    if AUTOTUNE:
+        # Calibrate on a real capture, later launches reuse the cached result
+        with STARTUP.phase("autotune"):
+            profile = load_or_tune(frame, pipeline_stages(config))
+        print(f"OpenCV threads: {profile['threads']}, optimized: {profile['optimized']}")
+
+    # Compile the numba lane kernels, or load them from numba's cache (no-op without numba)
+    with STARTUP.phase(f"lane kernels ({lane_kernels.BACKEND})"):
+        lane_kernels.precompile()
+
+    with STARTUP.phase("warm-up"):
+        # Run every stage, then the whole process_img with its overlays, on a dummy frame
+        dummy = synthetic_frame(frame.shape[1], frame.shape[0])
+        warm_up(pipeline_stages(config), dummy)
+        processed, original, _, _ = process_img(dummy, config=config)
+        if windows:
+            # Creating the display windows is slow too, so open them before the loop
+            cv2.imshow("Processed", processed)
+            cv2.imshow("Original", original)
+            cv2.waitKey(1)
+
+    STARTUP.report()
+    return watcher
+
+
+def main(profiler=None, telemetry=None, metrics=None):
+    """
+    Runs the bot until ESC is pressed.
+
+    Function Args:
+    - profiler: A profiling.FrameProfiler, profiles its number of frames and then stops the bot.
+    - telemetry: A telemetry.TelemetryPublisher to send a record of every frame to.
+    - metrics: A metrics.BotMetrics to record every frame's latencies and counters in.
+    """
+    watcher = start_up()
+    config = watcher.current
+    change_detector = FrameChangeDetector()
+    # All regions come from one grab per frame
+    capture = MultiRegionCapture(CAPTURE_REGIONS)
+    # Every frame is captured and processed into the same preallocated images
+    buffers = BufferArena()
+    # Steps the quality down when frames run over [governor] deadline_ms (no-op unless enabled)
+    governor = QualityGovernor(process_img)
+    # With [steering] mode = "pwm" the keys are pulsed by a thread at a fixed rate, the loop only sets the command
+    steering = None
+    if config.steering_mode == "pwm":
+        steering = PwmSteering(config, registry=metrics and metrics.registry).start()
+    if profiler is not None:
+        # After start_up, so the profile only covers live frames
+        profiler.start()
     start_time = time.time()
     frame_count = 0
 
     while True:
+        frame_start = time.perf_counter()
+        # Pick up a reloaded pipeline.toml between frames, its caches are already built
+        if watcher.current is not config:
+            config.close()
+            config = watcher.current
         # Capture a portion of the screen
-        frame = capture_screen_region(0, 40, 800, 600)
-        # Process the captured frame (edge detection, ROI, line detection)
-        processed_frame, original_frame,m1,m2 = process_img(frame)
+        frame = capture_road(capture, buffers)
+        capture_ms = (time.perf_counter() - frame_start) * 1000
+        # Process the captured frame (edge detection, ROI, line detection),
+        # unless it is practically the same as the last one, then the previous result still holds
+        skipped = change_detector.unchanged(frame, config)
+        if not skipped:
+            result = governor.process(frame, config, buffers=buffers)
+            buffers.hold(frame)
+        processed_frame, original_frame,m1,m2 = result
         # Display the processed image
         cv2.imshow("Processed", processed_frame)
         cv2.imshow("Original", original_frame)
@@ -242,26 +493,68 @@ def main():
         
         # Calculate and display FPS every second
         if elapsed_time > 1:
-            print(f"FPS: {frame_count/elapsed_time:.2f}")
+            print(f"FPS: {frame_count/elapsed_time:.2f}, unchanged frames skipped: {change_detector.skip_rate:.0%}"
+                  + (f", {metrics.summary()}" if metrics is not None else "")
+                  + (f", {steering.summary()}" if steering is not None else ""))
+            change_detector.reset_counters()
             start_time = time.time()
             frame_count = 0
         
-        if m1 < 0 and m2 < 0:
+        steer_start = time.perf_counter()
+        if steering is not None:
+            steering.set(steering_command(m1, m2, config))
+        elif m1 < 0 and m2 < 0:
             right()
         elif m1 > 0  and m2 > 0:
             left()
         else:
             straight()
+        steer_end = time.perf_counter()
+        frame_ms = (steer_end - frame_start) * 1000
+        STARTUP.record_frame(frame_ms)
+        if not skipped:
+            governor.update(frame_ms, config)
         
         
+        if telemetry is not None:
+            telemetry.publish(result, decide(m1, m2), skipped)
+        if metrics is not None:
+            # No SendInput calls in the loop with PWM steering, the actuation thread reports its own timing
+            metrics.frame(result, decide(m1, m2), skipped, frame_ms, capture_ms,
+                          (steer_end - steer_start) * 1000 if steering is None else None, telemetry)
+
         # Exit loop and release the key if 'ESC' key is pressed
         if cv2.waitKey(1) == 27:
             break
+        # Stop once the profiled frames are done
+        if profiler is not None and profiler.frame_done():
+            break
         
     # Close all OpenCV windows after exiting the loop
     cv2.destroyAllWindows()
+    if steering is not None:
+        steering.close()
+    capture.close()
+    watcher.stop()
+    config.close()
+    governor.close()
+    if profiler is not None:
+        profiler.stop()
+    if telemetry is not None:
+        telemetry.close()
+    if metrics is not None:
+        metrics.close()
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    from profiling import add_profile_arguments, profiler_from_args
+    from telemetry import add_telemetry_argument, publisher_from_args
+    from metrics import add_metrics_argument, metrics_from_args
+    parser = argparse.ArgumentParser(description="GTA5 lane detection self-driving bot.")
+    add_profile_arguments(parser)
+    add_telemetry_argument(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+    main(profiler_from_args(args, "main"), publisher_from_args(args), metrics_from_args(args))
     
\ No newline at end of file
@@ -0,0 +1,312 @@
+import bisect
+import threading
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+DEFAULT_PORT = 9872
+PREFIX = "lanebot_"
+
+# HDR-style histogram layout: values are counted in whole microseconds, exactly up to 2**PRECISION_BITS
+# and then in buckets of 2**(PRECISION_BITS - 1) per power of two, so every bucket is within
+# 1/64 (1.6%) of its values whatever their size. Values above MAX_US go into the last bucket.
+PRECISION_BITS = 7
+SUB_BUCKETS = 1 << PRECISION_BITS
+HALF_BUCKETS = SUB_BUCKETS >> 1
+MAX_US = 60_000_000
+# Bucket bounds (ms) exported to Prometheus, the HDR buckets are summed into these
+EXPORT_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2, 3, 4, 5, 6, 8, 10, 12, 14, 16, 20, 25, 33, 40, 50, 67, 100, 250, 500, 1000)
+
+
+def bucket_index(us):
+    # HDR bucket of a value in microseconds
+    if us < SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - PRECISION_BITS
+    return shift * HALF_BUCKETS + (us >> shift)
+
+
+def bucket_high(index):
+    # First value (microseconds) past a bucket
+    if index < SUB_BUCKETS:
+        return index + 1
+    shift = index // HALF_BUCKETS - 1
+    return (index - shift * HALF_BUCKETS + 1) << shift
+
+
+BUCKET_COUNT = bucket_index(MAX_US) + 1
+# For each exported bound, how many HDR buckets lie entirely below it
+_BUCKET_HIGHS = [bucket_high(index) for index in range(BUCKET_COUNT)]
+_EXPORT_LIMITS = [bisect.bisect_right(_BUCKET_HIGHS, round(bound * 1000)) for bound in EXPORT_BUCKETS_MS]
+
+
+def _labels(labels, extra=None):
+    # {name="value",...} for the exposition format, empty without labels
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A value that only goes up, e.g. frames processed.
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        return [(self.name, _labels(self.labels), self.value)]
+
+
+class Gauge:
+    """
+    A value that goes up and down, e.g. the quality level.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [(self.name, _labels(self.labels), self.value)]
+
+
+class Histogram:
+    """
+    A latency histogram in milliseconds with HDR-style buckets (see PRECISION_BITS), so tail
+    percentiles are as precise as the median. Exported to Prometheus in seconds, with the
+    EXPORT_BUCKETS_MS bounds.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms):
+        us = int(ms * 1000)
+        self.counts[bucket_index(us) if us < MAX_US else BUCKET_COUNT - 1] += 1
+        self.count += 1
+        self.sum_ms += ms
+
+    def snapshot(self):
+        # The bucket counts so far, for quantile(since=...)
+        return np.array(self.counts, np.int64)
+
+    def quantile(self, q, since=None):
+        """
+        The value (ms) below which a share q of the observations fall, of all of them or only of
+        those since an earlier snapshot(). NaN without observations.
+        """
+        counts = self.snapshot()
+        if since is not None:
+            counts -= since
+        total = counts.sum()
+        if total == 0:
+            return float("nan")
+        index = int(np.searchsorted(np.cumsum(counts), max(q * total, 1)))
+        # The highest value the bucket stands for
+        return (bucket_high(index) - 1) / 1000
+
+    def samples(self):
+        counts = list(self.counts)
+        count = sum(counts)
+        cumulative = list(itertools.accumulate(counts))
+        samples = []
+        for bound, limit in zip(EXPORT_BUCKETS_MS, _EXPORT_LIMITS):
+            below = cumulative[limit - 1] if limit else 0
+            samples.append((self.name + "_bucket", _labels(self.labels, ("le", _number(bound / 1000))), below))
+        samples.append((self.name + "_bucket", _labels(self.labels, ("le", "+Inf")), count))
+        samples.append((self.name + "_sum", _labels(self.labels), self.sum_ms / 1000))
+        samples.append((self.name + "_count", _labels(self.labels), count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics and renders them as Prometheus text.
+
+    Recording takes no lock: every metric is written by one thread (the frame loop) with plain
+    attribute and list updates, and render() only reads, copying a histogram's buckets in one
+    go. A scrape can see a frame's metrics half recorded, which is off by one observation at most.
+    Only creating a metric takes the lock, so create them before the loop.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels):
+        key = (PREFIX + name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = self.metrics[key] = cls(key[0], help, key[1])
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is a {metric.kind}, not a {cls.kind}")
+        return metric
+
+    def counter(self, name, help, **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, **labels):
+        return self._get(Histogram, name, help, labels)
+
+    def render(self):
+        lines = []
+        families = {}
+        for metric in list(self.metrics.values()):
+            families.setdefault(metric.name, []).append(metric)
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].help}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                lines.extend(f"{sample}{labels} {_number(value)}" for sample, labels, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves a registry as Prometheus text at http://host:port/metrics from a background thread.
+    Binds to localhost by default, the metrics are for tools on the same machine.
+    """
+
+    def __init__(self, registry, port=DEFAULT_PORT, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = f"http://{host}:{self.server.server_address[1]}/metrics"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BotMetrics:
+    """
+    The frame loop's metrics: frame, capture, per-stage and SendInput latency histograms,
+    frame/skip/decision/drop counters and the quality level. Call frame() once per frame.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        self.server = None
+        r = self.registry
+        self.frames = r.counter("frames_total", "Frames through the loop")
+        self.skipped = r.counter("frames_skipped_total", "Frames that reused the previous result (frame skip)")
+        self.lanes_missing = r.counter("lanes_missing_total", "Processed frames without two lanes")
+        self.telemetry_dropped = r.counter("telemetry_dropped_total", "Telemetry records dropped by the publisher")
+        self.quality = r.gauge("quality_level", "Quality governor level, 0 is full quality")
+        self.frame_ms = r.histogram("frame_seconds", "Capture to steering decision")
+        self.capture_ms = r.histogram("capture_seconds", "Screen capture")
+        self.sendinput_ms = r.histogram("sendinput_seconds", "Key presses for the steering decision (SendInput)")
+        self.stages = {}
+        self.decisions = {}
+        self._since = self.frame_ms.snapshot()
+
+    def serve(self, port=DEFAULT_PORT):
+        self.server = MetricsServer(self.registry, port)
+        print(f"Metrics on {self.server.address}")
+        return self
+
+    def frame(self, result, decision, skipped, frame_ms, capture_ms=None, sendinput_ms=None, telemetry=None):
+        """
+        Records one frame.
+
+        Function Args:
+        - result: The frame's FrameResult (the previous one for a skipped frame).
+        - decision: The steering decision taken.
+        - skipped: The frame reused the previous result, its stage timings aren't counted again.
+        - frame_ms, capture_ms, sendinput_ms: Times of the whole frame, the capture and the key presses.
+        - telemetry: The TelemetryPublisher, for its drop counter.
+        """
+        self.frames.inc()
+        self.frame_ms.observe(frame_ms)
+        if capture_ms is not None:
+            self.capture_ms.observe(capture_ms)
+        if sendinput_ms is not None:
+            self.sendinput_ms.observe(sendinput_ms)
+        counter = self.decisions.get(decision)
+        if counter is None:
+            counter = self.decisions[decision] = self.registry.counter("decisions_total", "Steering decisions", decision=decision)
+        counter.inc()
+        self.quality.set(result.quality)
+        if telemetry is not None:
+            self.telemetry_dropped.inc(telemetry.dropped - self.telemetry_dropped.value)
+        if skipped:
+            self.skipped.inc()
+            return
+        if len(result.lanes) != 2:
+            self.lanes_missing.inc()
+        for stage, ms in result.stage_ms.items():
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = self.registry.histogram("stage_seconds", "process_img stage", stage=stage)
+            histogram.observe(ms)
+
+    def summary(self):
+        # p50/p99/max frame time since the last summary, for the once-a-second console line
+        p50 = self.frame_ms.quantile(0.5, self._since)
+        p99 = self.frame_ms.quantile(0.99, self._since)
+        slowest = self.frame_ms.quantile(1.0, self._since)
+        self._since = self.frame_ms.snapshot()
+        return f"frame p50 {p50:.1f} ms, p99 {p99:.1f} ms, max {slowest:.1f} ms"
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+def add_metrics_argument(parser):
+    # --metrics [PORT] for an entry point's argument parser
+    parser.add_argument("--metrics", nargs="?", type=int, const=DEFAULT_PORT, metavar="PORT",
+                        help=f"Serve Prometheus metrics at http://127.0.0.1:PORT/metrics (default port {DEFAULT_PORT})")
+
+
+def metrics_from_args(args):
+    # Serving BotMetrics for the parsed arguments, None when --metrics wasn't given
+    return BotMetrics().serve(args.metrics) if args.metrics is not None else None
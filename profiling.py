@@ -0,0 +1,248 @@
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+import threading
+import linecache
+from collections import Counter
+import cv2
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# Profiles are written here unless another path is given
+PROFILE_DIR = os.path.join(REPO_DIR, "profiles")
+PROFILERS = ("cprofile", "sample")
+# How often the sampling profiler looks at the frame loop's stack
+SAMPLE_INTERVAL = 0.001
+
+_CV2_CALL = re.compile(r"\bcv2\.(\w+)\s*\(")
+
+
+def add_profile_arguments(parser):
+    """
+    Adds --profile N, --profiler and --profile-out to an entry point's argument parser.
+    """
+    parser.add_argument("--profile", type=int, metavar="N", help="Profile N frames, write the results and exit")
+    parser.add_argument("--profiler", choices=PROFILERS, default="cprofile",
+                        help="cprofile traces every call, sample looks at the stack every millisecond "
+                             "and barely slows the bot down")
+    parser.add_argument("--profile-out", help="Output path without extension (default: profiles/<entry>-<time>)")
+
+
+def profiler_from_args(args, entry):
+    # FrameProfiler for the parsed arguments, None when --profile wasn't given
+    if not args.profile:
+        return None
+    prefix = args.profile_out or os.path.join(PROFILE_DIR, f"{entry}-{time.strftime('%Y%m%d-%H%M%S')}")
+    return FrameProfiler(args.profile, args.profiler, prefix)
+
+
+def classify(filename, name):
+    """
+    Tells our code ("ours") from OpenCV ("opencv") and everything else ("other") for a function.
+    """
+    if name.startswith("cv2.") or "method cv2." in name or "function cv2." in name:
+        return "opencv"
+    if filename.startswith(REPO_DIR):
+        return "ours"
+    if "cv2" in filename.split(os.sep):
+        return "opencv"
+    return "other"
+
+
+class FrameProfiler:
+    """
+    Profiles a fixed number of frames of a frame loop.
+
+    Call start() right before the loop and frame_done() at the end of every frame. It returns True
+    once N frames are done, then call stop() to write the results:
+    - <prefix>.pstats: cProfile statistics (cprofile mode), open with `python -m pstats` or snakeviz.
+    - <prefix>.collapsed: One "frame;frame;frame count" line per stack, the input of flamegraph.pl,
+      speedscope or inferno. Time inside OpenCV shows up as cv2.<function> leaves.
+    - <prefix>.txt: The hottest functions split into ours, OpenCV and other.
+    """
+
+    def __init__(self, frames, mode="cprofile", prefix=None):
+        if mode not in PROFILERS:
+            raise ValueError(f"Unknown profiler {mode!r}, choose from {', '.join(PROFILERS)}")
+        self.frames = frames
+        self.mode = mode
+        self.prefix = prefix or os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+        self.done = 0
+        self.samples = Counter()
+        self._profile = None
+        self._sampler = None
+        self._stop = threading.Event()
+        self._thread_id = None
+        self._files = {}
+        self.elapsed = 0.0
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._thread_id = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+            self._sampler.start()
+
+    def frame_done(self):
+        self.done += 1
+        return self.done >= self.frames
+
+    def stop(self):
+        """
+        Stops profiling and writes the output files. Returns the list of files written.
+        """
+        self.elapsed = time.perf_counter() - self._start_time
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.prefix)), exist_ok=True)
+        written = []
+        if self._profile is not None:
+            stats = pstats.Stats(self._profile)
+            stats.dump_stats(self.prefix + ".pstats")
+            written.append(self.prefix + ".pstats")
+            stacks, totals = self._cprofile_stacks(stats), self._cprofile_totals(stats)
+        else:
+            stacks, totals = self.samples, self._sample_totals()
+
+        with open(self.prefix + ".collapsed", "w") as f:
+            for stack, weight in sorted(stacks.items()):
+                if weight > 0:
+                    f.write(f"{';'.join(stack)} {weight}\n")
+        written.append(self.prefix + ".collapsed")
+
+        with open(self.prefix + ".txt", "w") as f:
+            f.write(self.summary(totals))
+        written.append(self.prefix + ".txt")
+
+        print(f"Profiled {self.done} frames in {self.elapsed:.2f} s ({self.mode}), "
+              f"{self.elapsed / max(self.done, 1) * 1000:.2f} ms per frame")
+        for path in written:
+            print(f"  {path}")
+        return written
+
+    # Sampling profiler
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            leaf = frame
+            while frame is not None:
+                code = frame.f_code
+                label = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                self._files[label] = code.co_filename
+                stack.append(label)
+                frame = frame.f_back
+            stack.reverse()
+            # The C functions the loop is waiting on don't show up on the Python stack, but while
+            # OpenCV runs the innermost Python frame sits on the line that called it
+            call = _CV2_CALL.search(linecache.getline(leaf.f_code.co_filename, leaf.f_lineno))
+            if call:
+                stack.append(f"cv2.{call.group(1)}")
+            self.samples[tuple(stack)] += 1
+
+    def _sample_totals(self):
+        # (self samples, total samples, file, label) per function
+        totals = {}
+        for stack, count in self.samples.items():
+            # A function that recurses is counted once per sample
+            for label in set(stack):
+                totals.setdefault(label, [0, 0])[1] += count
+            totals[stack[-1]][0] += count
+        return {label: (own, total, self._files.get(label, ""), label) for label, (own, total) in totals.items()}
+
+    # cProfile
+
+    @staticmethod
+    def _label(func):
+        filename, line, name = func
+        if filename == "~":
+            # Built-ins, cProfile names OpenCV's functions without their module, e.g. "<Canny>"
+            name = name.strip("<>").replace("built-in method ", "")
+            if name.isidentifier() and callable(getattr(cv2, name, None)):
+                return f"cv2.{name}"
+            return name
+        return f"{os.path.basename(filename)}:{name}"
+
+    def _cprofile_totals(self, stats):
+        # (self seconds, total seconds, file, label) per function
+        return {func: (tt, ct, func[0], self._label(func)) for func, (cc, nc, tt, ct, callers) in stats.stats.items()}
+
+    def _cprofile_stacks(self, stats):
+        """
+        Rebuilds approximate stacks from cProfile's caller -> callee graph, the way flameprof does:
+        a function's time under each caller is split over its callees in proportion to their time.
+        Weights are in microseconds.
+        """
+        callees = {}
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            for caller, caller_stats in callers.items():
+                callees.setdefault(caller, []).append((func, caller_stats[3]))
+        roots = [func for func, (cc, nc, tt, ct, callers) in stats.stats.items() if not callers]
+
+        stacks = Counter()
+
+        def walk(func, budget, path, labels):
+            cc, nc, tt, ct, callers = stats.stats[func]
+            # Below a microsecond nothing would show up in a flame graph anyway
+            if ct <= 0 or budget < 1e-6:
+                return
+            share = budget / ct
+            stacks[labels] += int(round(tt * share * 1e6))
+            for callee, callee_ct in callees.get(func, ()):
+                # Recursion is folded into the first occurrence
+                if callee in path:
+                    continue
+                walk(callee, callee_ct * share, path | {callee}, labels + (self._label(callee),))
+
+        for root in roots:
+            walk(root, stats.stats[root][3], {root}, (self._label(root),))
+        return stacks
+
+    def summary(self, totals, top=15):
+        """
+        The hottest functions (by self time) of ours, OpenCV's and the rest, as text.
+        """
+        unit = "samples" if self.mode == "sample" else "ms"
+        scale = 1 if self.mode == "sample" else 1000
+        groups = {"ours": [], "opencv": [], "other": []}
+        for own, total, filename, label in totals.values():
+            groups[classify(filename, label)].append((own * scale, total * scale, label))
+
+        lines = [f"{self.done} frames, {self.elapsed:.2f} s, {self.mode} profiler" if self.done else
+                 f"{self.elapsed:.2f} s, {self.mode} profiler", ""]
+        titles = {"ours": "Our code", "opencv": "OpenCV", "other": "Other (Python, NumPy, ...)"}
+        for group, rows in groups.items():
+            lines.append(f"{titles[group]}: {sum(row[0] for row in rows):.1f} {unit} self")
+            lines.append(f"  {'self ' + unit:>14} {'total ' + unit:>14}  function")
+            for own, total, label in sorted(rows, reverse=True)[:top]:
+                lines.append(f"  {own:14.1f} {total:14.1f}  {label}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+def main():
+    # Print the summary of a saved .pstats file
+    parser = argparse.ArgumentParser(description="Summarise a saved profile by ours / OpenCV / other.")
+    parser.add_argument("pstats", help="A .pstats file written by --profile")
+    args = parser.parse_args()
+    profiler = FrameProfiler(0)
+    stats = pstats.Stats(args.pstats)
+    profiler.elapsed = stats.total_tt
+    print(profiler.summary(profiler._cprofile_totals(stats)))
+
+
+if __name__ == "__main__":
+    main()
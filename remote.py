@@ -0,0 +1,325 @@
+import time
+import socket
+import struct
+import argparse
+import itertools
+from collections import deque
+import cv2
+import numpy as np
+from main import process_img, decide, straight, left, right, CONFIG
+from dataset import iter_frames
+from buffers import BufferArena
+from capture import Region, MultiRegionCapture
+from strips import CANNY_HALO
+
+DEFAULT_PORT = 9871
+VERSION = 1
+MAGIC = b"LANE"
+ENCODINGS = ("raw", "png", "jpeg")
+# Fastest PNG compression, the point is to keep the client's cores free
+PNG_COMPRESSION = 1
+# Frames sent ahead of the oldest unanswered one, hides the round trip
+DEFAULT_WINDOW = 2
+
+# Client -> server, one per frame, followed by the encoded gray crop:
+#   magic, version, encoding index, sequence number, capture time.time(),
+#   full frame width/height, crop x/y/width/height, payload bytes
+FRAME_HEADER = struct.Struct("<4sBBId6HI")
+# Server -> client, one per frame: magic, version, decision index, sequence number, m1, m2,
+# confidence, server processing time in ms
+REPLY = struct.Struct("<4sBBI4f")
+DECISIONS = ("straight", "left", "right")
+
+# The server gets gray frames, the strip edge detector only takes colour ones
+SERVER_CONFIG = CONFIG.updated({"strips": {"threads": 0}})
+
+
+def recv_exact(sock, buffer):
+    # Fills a memoryview from the socket, False if the peer closed the connection
+    received = 0
+    while received < len(buffer):
+        count = sock.recv_into(buffer[received:])
+        if count == 0:
+            return False
+        received += count
+    return True
+
+
+def parse_address(text, default_host):
+    host, _, port = text.rpartition(":")
+    return host or default_host, int(port) if port else DEFAULT_PORT
+
+
+class FrameEncoder:
+    """
+    Turns captured frames into the gray crop of the ROI (plus a halo) the server needs, encoded as
+    raw bytes, PNG or JPEG. Everything outside the crop is never looked at by the pipeline.
+    """
+
+    def __init__(self, encoding="jpeg", quality=90, config=None):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding!r}, choose from {', '.join(ENCODINGS)}")
+        self.encoding = encoding
+        self.quality = quality
+        self.config = config or CONFIG
+        self.gray = None
+
+    def crop_box(self, shape):
+        # The ROI box plus a halo, so Canny and the blur see the same neighbourhood as on the full frame
+        height, width = shape[:2]
+        x1, y1, x2, y2 = self.config.derived(shape).roi_box
+        halo = CANNY_HALO + max(self.config.blur_kernel) // 2
+        return max(x1 - halo, 0), max(y1 - halo, 0), min(x2 + halo, width), min(y2 + halo, height)
+
+    def encode(self, frame, seq, timestamp):
+        """
+        Returns the header and payload of one frame.
+        """
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = self.crop_box(frame.shape)
+        crop = frame[y1:y2, x1:x2]
+        if self.gray is None or self.gray.shape != crop.shape[:2]:
+            self.gray = np.empty(crop.shape[:2], np.uint8)
+        cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+        if self.encoding == "raw":
+            payload = memoryview(self.gray).cast("B")
+        elif self.encoding == "png":
+            payload = cv2.imencode(".png", self.gray, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])[1]
+        else:
+            payload = cv2.imencode(".jpg", self.gray, [cv2.IMWRITE_JPEG_QUALITY, self.quality])[1]
+        header = FRAME_HEADER.pack(MAGIC, VERSION, ENCODINGS.index(self.encoding), seq, timestamp,
+                                   width, height, x1, y1, x2 - x1, y2 - y1, len(payload))
+        return header, payload
+
+
+class FrameDecoder:
+    """
+    Puts received crops back at their place in a full-size gray frame, one reused canvas per frame size.
+
+    The rest of the canvas repeats the crop's border pixels outwards. A constant fill would put an
+    intensity step along the crop border, which Canny picks up and its hysteresis can chain into
+    the ROI. The server still never sees the real pixels outside the crop, so an edge that runs
+    out of the crop and back in can come out differently: remote results are close to local
+    processing, not guaranteed identical.
+    """
+
+    def __init__(self):
+        self.canvases = {}
+
+    def decode(self, header, payload):
+        _, _, encoding, _, _, width, height, x, y, crop_width, crop_height, _ = header
+        canvas = self.canvases.get((height, width))
+        if canvas is None:
+            canvas = self.canvases[(height, width)] = np.zeros((height, width), np.uint8)
+        if ENCODINGS[encoding] == "raw":
+            crop = np.frombuffer(payload, np.uint8).reshape(crop_height, crop_width)
+        else:
+            crop = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_GRAYSCALE)
+        # Writes the crop and its replicated border into the canvas in one pass
+        cv2.copyMakeBorder(crop, y, height - y - crop_height, x, width - x - crop_width,
+                           cv2.BORDER_REPLICATE, dst=canvas)
+        return canvas
+
+
+def serve(host="0.0.0.0", port=DEFAULT_PORT, config=None):
+    """
+    Processing server: runs process_img on the frames of one client at a time and answers every
+    frame with the steering decision. Frames are handled in the order they arrive, the client
+    keeps a few in flight so the next one is already waiting when a reply goes out.
+    """
+    config = config or SERVER_CONFIG
+    listener = socket.create_server((host, port))
+    print(f"Serving on {host}:{port}")
+    try:
+        while True:
+            connection, peer = listener.accept()
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            print(f"Client {peer[0]}:{peer[1]} connected")
+            with connection:
+                frames = _serve_client(connection, config)
+            print(f"Client {peer[0]}:{peer[1]} disconnected after {frames} frames")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+
+
+def _serve_client(connection, config):
+    decoder = FrameDecoder()
+    buffers = BufferArena()
+    header_buffer = bytearray(FRAME_HEADER.size)
+    payload_buffer = bytearray(1 << 20)
+    reply = bytearray(REPLY.size)
+    frames = 0
+    while recv_exact(connection, memoryview(header_buffer)):
+        header = FRAME_HEADER.unpack(header_buffer)
+        if header[0] != MAGIC or header[1] != VERSION:
+            print(f"Unknown frame header {header[:2]}, closing the connection")
+            break
+        size = header[-1]
+        if size > len(payload_buffer):
+            payload_buffer = bytearray(size)
+        payload = memoryview(payload_buffer)[:size]
+        if not recv_exact(connection, payload):
+            break
+
+        start = time.perf_counter()
+        frame = decoder.decode(header, payload)
+        result = process_img(frame, draw=False, config=config, buffers=buffers)
+        decision = decide(result.m1, result.m2)
+        process_ms = (time.perf_counter() - start) * 1000
+        REPLY.pack_into(reply, 0, MAGIC, VERSION, DECISIONS.index(decision), header[3],
+                        result.m1, result.m2, result.confidence, process_ms)
+        connection.sendall(reply)
+        frames += 1
+    return frames
+
+
+class RemoteClient:
+    """
+    Thin client: sends frames to a processing server and hands back its decisions.
+
+    send() never waits for the server unless `window` frames are already unanswered, so with a
+    window of 2 the next frame is captured and on its way while the server works on the last.
+    """
+
+    def __init__(self, address, encoding="jpeg", quality=90, window=DEFAULT_WINDOW):
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.encoder = FrameEncoder(encoding, quality)
+        self.window = window
+        self.in_flight = deque()
+        self.reply = bytearray(REPLY.size)
+        self.seq = 0
+        self.bytes_sent = 0
+        self.round_trips = deque(maxlen=200)
+        self.server_ms = deque(maxlen=200)
+
+    def send(self, frame):
+        """
+        Sends a frame, then returns the replies that have arrived (oldest first) as
+        (decision, m1, m2) tuples, waiting for one only if the window is full.
+        """
+        self.seq += 1
+        header, payload = self.encoder.encode(frame, self.seq, time.time())
+        self.sock.sendall(header)
+        self.sock.sendall(payload)
+        self.bytes_sent += len(header) + len(payload)
+        self.in_flight.append((self.seq, time.perf_counter()))
+
+        replies = []
+        while self.in_flight:
+            block = len(self.in_flight) >= self.window
+            reply = self._receive(block)
+            if reply is None:
+                break
+            replies.append(reply)
+        return replies
+
+    def drain(self):
+        # Waits for the replies of every frame still in flight
+        replies = []
+        while self.in_flight:
+            replies.append(self._receive(True))
+        return replies
+
+    def _receive(self, block):
+        if not block:
+            self.sock.setblocking(False)
+            try:
+                # Only start reading once a whole reply is there, the rest is read blocking below
+                if len(self.sock.recv(REPLY.size, socket.MSG_PEEK)) < REPLY.size:
+                    return None
+            except BlockingIOError:
+                return None
+            finally:
+                self.sock.setblocking(True)
+        if not recv_exact(self.sock, memoryview(self.reply)):
+            raise ConnectionError("The processing server closed the connection")
+        _, _, decision, seq, m1, m2, confidence, server_ms = REPLY.unpack(self.reply)
+        sent_seq, sent_at = self.in_flight.popleft()
+        if seq != sent_seq:
+            raise ConnectionError(f"Reply for frame {seq} while waiting for frame {sent_seq}")
+        self.round_trips.append((time.perf_counter() - sent_at) * 1000)
+        self.server_ms.append(server_ms)
+        return DECISIONS[decision], m1, m2
+
+    def close(self):
+        self.sock.close()
+
+
+def run_client(address, frames, encoding="jpeg", quality=90, window=DEFAULT_WINDOW, keys=True):
+    """
+    Captures (or replays) frames, streams them to the server and steers with the decisions that
+    come back. Prints the frame rate, round trip and bandwidth every second.
+    """
+    steer = {"straight": straight, "left": left, "right": right}
+    client = RemoteClient(address, encoding, quality, window)
+    start_time = time.time()
+    frame_count = 0
+    bytes_sent = 0
+    try:
+        for frame in frames:
+            for decision, m1, m2 in client.send(frame):
+                if keys:
+                    steer[decision]()
+                else:
+                    print(m1, m2, decision)
+            frame_count += 1
+            elapsed_time = time.time() - start_time
+            if elapsed_time > 1:
+                round_trip = np.percentile(client.round_trips, 50) if client.round_trips else 0.0
+                server_ms = np.percentile(client.server_ms, 50) if client.server_ms else 0.0
+                print(f"FPS: {frame_count/elapsed_time:.2f}, round trip p50: {round_trip:.1f} ms "
+                      f"(server {server_ms:.1f} ms), {(client.bytes_sent - bytes_sent) / elapsed_time / 1024:.0f} KB/s")
+                bytes_sent = client.bytes_sent
+                start_time = time.time()
+                frame_count = 0
+        for decision, m1, m2 in client.drain():
+            if keys:
+                steer[decision]()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+def screen_frames(x=0, y=40, width=800, height=600):
+    # Live captures of the game window, the same region main.py uses
+    with MultiRegionCapture([Region("road", x, y, width, height)]) as capture:
+        while True:
+            yield capture.grab()["road"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split mode: a thin capture client on the game machine "
+                                                 "and a processing server running the lane pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server = commands.add_parser("server", help="Process frames sent by a client")
+    server.add_argument("--listen", default=f"0.0.0.0:{DEFAULT_PORT}", help="host:port to listen on")
+    client = commands.add_parser("client", help="Capture frames, send them to the server and steer")
+    client.add_argument("--server", default=f"127.0.0.1:{DEFAULT_PORT}", help="host:port of the server")
+    client.add_argument("--encoding", choices=ENCODINGS, default="jpeg")
+    client.add_argument("--quality", type=int, default=90, help="JPEG quality (0-100)")
+    client.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Frames in flight before waiting for a reply")
+    client.add_argument("--recording", help="Send a recording instead of capturing the screen")
+    client.add_argument("--loop", action="store_true", help="Send the recording over and over")
+    client.add_argument("--no-keys", action="store_true", help="Print the decisions instead of pressing keys")
+    args = parser.parse_args()
+
+    if args.command == "server":
+        serve(*parse_address(args.listen, "0.0.0.0"))
+        return
+    if args.recording:
+        frames = iter_frames(args.recording)
+        if args.loop:
+            frames = itertools.chain.from_iterable(iter_frames(args.recording) for _ in itertools.count())
+    else:
+        frames = screen_frames()
+    run_client(parse_address(args.server, "127.0.0.1"), frames, args.encoding, args.quality, args.window,
+               keys=not args.no_keys)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import time
+import argparse
+import itertools
+from collections import Counter
+import cv2
+import numpy as np
+import lane_kernels
+from main import process_img, decide, CONFIG
+from config import PipelineConfig
+from dataset import iter_frames
+from frame_skip import FrameChangeDetector
+from buffers import BufferArena, AllocationTracker
+from governor import QualityGovernor
+from profiling import add_profile_arguments, profiler_from_args
+from telemetry import add_telemetry_argument, publisher_from_args
+from metrics import add_metrics_argument, metrics_from_args
+
+
+def replay(frames, config=None, show=False, profiler=None, buffers=True, tracker=None, telemetry=None,
+           metrics=None):
+    """
+    Plays recorded frames through the same per-frame loop as main.py, one frame at a time,
+    without capturing the screen or pressing keys. Handy for reproducible timings and profiles.
+
+    Function Args:
+    - frames: Iterable of BGRA frames.
+    - config: PipelineConfig to run with, defaults to CONFIG.
+    - show: Show the Processed/Original windows like the bot does.
+    - profiler: A profiling.FrameProfiler, replay stops once its frames are done.
+    - buffers: Copy and process the frames into preallocated images like the bot (see buffers.py).
+    - tracker: A buffers.AllocationTracker to check the frames' allocations with.
+    - telemetry: A telemetry.TelemetryPublisher to send a record of every frame to.
+    - metrics: A metrics.BotMetrics to record every frame in (no capture or SendInput times).
+    Returns:
+    - (frame count, Counter of steering decisions, seconds spent).
+    """
+    config = config or CONFIG
+    change_detector = FrameChangeDetector()
+    decisions = Counter()
+    frame_count = 0
+    arena = BufferArena() if buffers else None
+    governor = QualityGovernor(process_img)
+    # Load the numba kernels before the clock starts, like main.py's start_up does
+    lane_kernels.precompile()
+    if profiler is not None:
+        profiler.start()
+    if tracker is not None:
+        tracker.start()
+    start_time = time.perf_counter()
+
+    for frame in frames:
+        frame_start = time.perf_counter()
+        # Frames from a memory-mapped recording are read-only, the overlays need a copy
+        if arena is not None:
+            capture = arena.next_capture(frame.shape)
+            np.copyto(capture, frame)
+            frame = capture
+        else:
+            frame = frame.copy()
+        skipped = change_detector.unchanged(frame, config)
+        if not skipped:
+            result = governor.process(frame, config, draw=show, buffers=arena)
+            if arena is not None:
+                arena.hold(frame)
+        processed_frame, original_frame, m1, m2 = result
+        decision = decide(m1, m2)
+        decisions[decision] += 1
+        if telemetry is not None:
+            telemetry.publish(result, decision, skipped)
+        frame_count += 1
+
+        if show:
+            cv2.imshow("Processed", processed_frame)
+            cv2.imshow("Original", original_frame)
+            if cv2.waitKey(1) == 27:
+                break
+        frame_ms = (time.perf_counter() - frame_start) * 1000
+        if not skipped:
+            governor.update(frame_ms, config)
+        if metrics is not None:
+            metrics.frame(result, decision, skipped, frame_ms, telemetry=telemetry)
+        if tracker is not None:
+            tracker.frame_done()
+        if profiler is not None and profiler.frame_done():
+            break
+
+    elapsed_time = time.perf_counter() - start_time
+    if tracker is not None:
+        print(tracker.stop())
+    if profiler is not None:
+        profiler.stop()
+    if show:
+        cv2.destroyAllWindows()
+    return frame_count, decisions, elapsed_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a recording through the bot's frame loop (no capture, no keys).")
+    parser.add_argument("recording", help="Folder of screenshots, .npy stack or .npz file")
+    parser.add_argument("--config", help="Pipeline config to use instead of pipeline.toml")
+    parser.add_argument("--show", action="store_true", help="Show the display windows")
+    parser.add_argument("--loop", action="store_true", help="Start over at the end of the recording, "
+                        "e.g. to profile more frames than it has")
+    parser.add_argument("--no-buffers", action="store_true", help="Allocate new images every frame "
+                        "instead of reusing preallocated ones")
+    parser.add_argument("--trace-allocations", action="store_true", help="Check with tracemalloc that "
+                        "steady-state frames allocate nothing large (slow)")
+    add_profile_arguments(parser)
+    add_telemetry_argument(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+
+    config = PipelineConfig.load(args.config) if args.config else CONFIG
+    frames = iter_frames(args.recording)
+    if args.loop:
+        frames = itertools.chain.from_iterable(iter_frames(args.recording) for _ in itertools.count())
+    profiler = profiler_from_args(args, "replay")
+
+    tracker = AllocationTracker() if args.trace_allocations else None
+    telemetry = publisher_from_args(args)
+    metrics = metrics_from_args(args)
+    frame_count, decisions, elapsed_time = replay(frames, config, args.show, profiler,
+                                                  buffers=not args.no_buffers, tracker=tracker, telemetry=telemetry,
+                                                  metrics=metrics)
+    if telemetry is not None:
+        telemetry.close()
+    if metrics is not None:
+        print(metrics.summary())
+        metrics.close()
+    print(f"Replayed {frame_count} frames in {elapsed_time:.2f}s ({frame_count / elapsed_time:.2f} FPS)")
+    print(", ".join(f"{decision}: {count}" for decision, count in decisions.most_common()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import os
+import signal
+import asyncio
+import argparse
+import itertools
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from main import process_img, decide, start_up, straight, left, right, CAPTURE_REGIONS
+from startup import lazy_import
+from actuation import PwmSteering, steering_command
+from capture import MultiRegionCapture
+from dataset import iter_frames
+from frame_skip import FrameChangeDetector
+from telemetry import add_telemetry_argument, publisher_from_args
+
+# How often the config task looks at pipeline.toml
+CONFIG_INTERVAL = 0.5
+# Seconds between status lines
+STATUS_INTERVAL = 1.0
+# Frames waiting to be written by the recording task before new ones are dropped
+RECORD_QUEUE = 64
+# Sent down the frames and results channels when a recording is over
+END = None
+
+
+class Channel:
+    """
+    A bounded queue between two tasks. put() never waits: when the channel is full the oldest
+    item is dropped (and counted), so a slow consumer only ever sees fresher data and can't
+    hold up the task feeding it.
+    """
+
+    def __init__(self, name, size=1):
+        self.name = name
+        self.queue = asyncio.Queue(size)
+        self.sent = 0
+        self.dropped = 0
+        self._taken = asyncio.Event()
+
+    def put(self, item):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+        self.sent += 1
+
+    async def send(self, item):
+        # Waits for room instead of dropping, for items that must arrive (the end of a recording)
+        await self.queue.put(item)
+        self.sent += 1
+
+    async def room(self):
+        # Waits until the consumer has taken enough that put() wouldn't drop anything
+        while self.queue.full():
+            self._taken.clear()
+            await self._taken.wait()
+
+    async def get(self):
+        item = await self.queue.get()
+        self._taken.set()
+        return item
+
+
+class BotRuntime:
+    """
+    The bot as asyncio tasks connected by bounded channels, instead of main.main's single loop:
+
+        capture -> frames -> vision -> results -> control (keys)
+                                           \\-> display, telemetry
+        capture -> recording (--record)
+        config (reloads pipeline.toml), status (FPS and drops)
+
+    Capture, vision and display each run in their own thread (mss and the HighGUI windows are
+    tied to the thread that opened them), so the event loop only moves data between them. Capture
+    grabs the next frame when vision has taken the last one, so it never outruns vision. Every
+    other channel keeps the newest items and drops the rest, so a slow display, recorder or
+    telemetry consumer never adds latency to the capture -> vision -> control path.
+
+    ESC in a display window or Ctrl+C stops every task, releases the keys and closes the windows.
+    At the end of a recording vision and control finish the frames already captured first.
+    """
+
+    def __init__(self, keys=True, show=True, recording=None, loop=False, record_dir=None, telemetry=None):
+        self.keys = keys
+        self.show = show
+        self.recording = recording
+        self.loop_recording = loop
+        self.record_dir = record_dir
+        self.telemetry = telemetry
+
+        self.frames = Channel("frames")
+        self.results = Channel("results")
+        self.display = Channel("display")
+        self.published = Channel("telemetry", 8)
+        self.recorded = Channel("recording", RECORD_QUEUE)
+        self.channels = [self.frames, self.results, self.display, self.published, self.recorded]
+
+        self.capture_pool = ThreadPoolExecutor(1, "capture")
+        self.vision_pool = ThreadPoolExecutor(1, "vision")
+        self.display_pool = ThreadPoolExecutor(1, "display")
+        self.record_pool = ThreadPoolExecutor(1, "record")
+        self.config_pool = ThreadPoolExecutor(1, "config")
+        self.stopping = None
+        self.watcher = None
+        self.capture = None
+        self.steering = None
+        self.change_detector = FrameChangeDetector()
+        self.counts = {"captured": 0, "processed": 0, "skipped": 0, "steered": 0}
+
+    # Tasks
+
+    async def capture_task(self):
+        # Grabs the next frame once the vision task has taken the last one, so no grab is thrown
+        # away and every frame of a recording is processed
+        loop = asyncio.get_running_loop()
+        grab = self._recording_frames() if self.recording else self._screen_frame
+        while True:
+            await self.frames.room()
+            frame = await loop.run_in_executor(self.capture_pool, grab)
+            if frame is None:
+                # Vision and control finish the frames already sent, then stop the runtime
+                await self.frames.send(END)
+                return
+            self.counts["captured"] += 1
+            if self.record_dir is not None:
+                # The vision task draws on the frame, the recording gets it as captured
+                self.recorded.put(frame.copy())
+            self.frames.put(frame)
+
+    def _screen_frame(self):
+        # On the capture thread, which owns the mss instance
+        if self.capture is None:
+            self.capture = MultiRegionCapture(CAPTURE_REGIONS)
+        return self.capture.grab()["road"]
+
+    def _recording_frames(self):
+        frames = iter_frames(self.recording)
+        if self.loop_recording:
+            frames = itertools.chain.from_iterable(iter_frames(self.recording) for _ in itertools.count())
+
+        def grab():
+            frame = next(frames, None)
+            return None if frame is None else frame.copy()
+        return grab
+
+    async def vision_task(self):
+        loop = asyncio.get_running_loop()
+        config = self.watcher.current
+        result = None
+        while True:
+            frame = await self.frames.get()
+            if frame is END:
+                await self.results.send(END)
+                return
+            # Pick up a reloaded config between frames, nothing else uses the old one
+            if self.watcher.current is not config:
+                config.close()
+                config = self.watcher.current
+            skipped = self.change_detector.unchanged(frame, config)
+            if not skipped:
+                # Every result gets its own images (no BufferArena), other tasks may still be showing the last one
+                process = partial(process_img, frame, draw=self.show, config=config)
+                result = await loop.run_in_executor(self.vision_pool, process)
+                self.counts["processed"] += 1
+            else:
+                self.counts["skipped"] += 1
+            self.results.put(result)
+            if self.show:
+                self.display.put(result)
+            if self.telemetry is not None:
+                self.published.put((result, decide(result.m1, result.m2), skipped))
+
+    async def control_task(self):
+        steer = {"straight": straight, "left": left, "right": right}
+        if self.keys and self.watcher.current.steering_mode == "pwm":
+            # The keys are pulsed on the actuation thread, this task only updates its command
+            self.steering = PwmSteering(self.watcher.current).start()
+        while True:
+            result = await self.results.get()
+            if result is END:
+                return
+            decision = decide(result.m1, result.m2)
+            if self.steering is not None:
+                self.steering.set(steering_command(result.m1, result.m2, self.watcher.current))
+            elif self.keys:
+                # DirectInput calls take microseconds, no need to leave the event loop
+                steer[decision]()
+            self.counts["steered"] += 1
+
+    async def display_task(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            result = await self.display.get()
+            key = await loop.run_in_executor(self.display_pool, self._show, result)
+            if key == 27:
+                self.stopping.set()
+                return
+
+    @staticmethod
+    def _show(result):
+        cv2.imshow("Processed", result.processed)
+        cv2.imshow("Original", result.original)
+        return cv2.waitKey(1)
+
+    async def telemetry_task(self):
+        while True:
+            result, decision, skipped = await self.published.get()
+            # Never blocks, the publisher drops records it can't send right away
+            self.telemetry.publish(result, decision, skipped)
+
+    async def recording_task(self):
+        loop = asyncio.get_running_loop()
+        os.makedirs(self.record_dir, exist_ok=True)
+        for index in itertools.count():
+            frame = await self.recorded.get()
+            path = os.path.join(self.record_dir, f"frame_{index:06d}.png")
+            await loop.run_in_executor(self.record_pool, cv2.imwrite, path, frame)
+
+    async def config_task(self):
+        # Looks for pipeline.toml changes on its own thread, building the new config's caches there too
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CONFIG_INTERVAL)
+            await loop.run_in_executor(self.config_pool, self.watcher.check)
+
+    async def status_task(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            counts = ", ".join(f"{name} {count / STATUS_INTERVAL:.1f}/s" for name, count in self.counts.items())
+            drops = ", ".join(f"{channel.name} {channel.dropped}" for channel in self.channels if channel.dropped)
+            print(f"{counts}" + (f" | dropped: {drops}" if drops else "")
+                  + (f" | {self.steering.summary()}" if self.steering is not None else ""))
+            for name in self.counts:
+                self.counts[name] = 0
+
+    # Running
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        try:
+            loop.add_signal_handler(signal.SIGINT, self.stopping.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows event loops have no signal handlers, Ctrl+C then cancels run() and the finally below cleans up
+            pass
+
+        first_frame = None
+        if self.recording:
+            first_frame = next(iter_frames(self.recording))
+        # Calibration and warm-up on the display thread, which then owns the windows
+        self.watcher = await loop.run_in_executor(self.display_pool, start_up, self.keys, first_frame, False, self.show)
+
+        tasks = [self.capture_task(), self.vision_task(), self.control_task(), self.config_task(), self.status_task()]
+        if self.show:
+            tasks.append(self.display_task())
+        if self.telemetry is not None:
+            tasks.append(self.telemetry_task())
+        if self.record_dir is not None:
+            tasks.append(self.recording_task())
+        tasks = [asyncio.create_task(task) for task in tasks]
+        stop = asyncio.create_task(self.stopping.wait())
+        # Control only returns once the last frame of a recording has been steered
+        control = tasks[2]
+        try:
+            # Runs until ESC/Ctrl+C, the recording is done or a task fails. Capture and vision
+            # return before control at the end of a recording, keep waiting for it then
+            pending = set(tasks) | {stop}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is not stop and not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+                if stop in done or control in done:
+                    break
+        finally:
+            for task in tasks + [stop]:
+                task.cancel()
+            await asyncio.gather(*tasks, stop, return_exceptions=True)
+            await self.close()
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        if self.steering is not None:
+            self.steering.close()
+        if self.keys:
+            keys = lazy_import("directkeys")
+            for key in (keys.W, keys.A, keys.D):
+                keys.ReleaseKey(key)
+        if self.capture is not None:
+            await loop.run_in_executor(self.capture_pool, self.capture.close)
+        if self.show:
+            await loop.run_in_executor(self.display_pool, cv2.destroyAllWindows)
+        for pool in (self.capture_pool, self.vision_pool, self.display_pool, self.record_pool, self.config_pool):
+            pool.shutdown(wait=True)
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher.current.close()
+        if self.telemetry is not None:
+            self.telemetry.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as asyncio tasks (capture, vision, control, "
+                                                 "display, telemetry, recording, config reload).")
+    parser.add_argument("--no-keys", action="store_true", help="Don't press keys (like debugdrive.py)")
+    parser.add_argument("--no-display", action="store_true", help="Don't open the display windows")
+    parser.add_argument("--recording", help="Play a recording instead of capturing the screen")
+    parser.add_argument("--loop", action="store_true", help="Play the recording over and over")
+    parser.add_argument("--record", metavar="DIR", help="Save every captured frame to DIR as PNG (dropped if the disk can't keep up)")
+    add_telemetry_argument(parser)
+    args = parser.parse_args()
+
+    runtime = BotRuntime(keys=not args.no_keys, show=not args.no_display, recording=args.recording,
+                         loop=args.loop, record_dir=args.record, telemetry=publisher_from_args(args))
+    try:
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import time
+import importlib
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    """
+    Records how long each part of the startup takes (imports, calibration, warm-up, ...)
+    and how the first live frames compare to the steady state.
+    """
+
+    def __init__(self, steady_frame=100):
+        self.start = time.perf_counter()
+        self.last_mark = self.start
+        self.phases = []
+        self.steady_frame = steady_frame
+        self.frame_times = []
+
+    def mark(self, name):
+        # Time since the previous mark (or since this module was imported)
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last_mark) * 1000))
+        self.last_mark = now
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - start) * 1000))
+            self.last_mark = time.perf_counter()
+
+    def report(self):
+        print("Startup:")
+        for name, ms in self.phases:
+            print(f"  {name:<20} {ms:8.1f} ms")
+        print(f"  {'total':<20} {(time.perf_counter() - self.start) * 1000:8.1f} ms")
+
+    def record_frame(self, ms):
+        """
+        Collects the first frame times and prints the first frame next to the steady state one.
+        """
+        if len(self.frame_times) >= self.steady_frame:
+            return
+        self.frame_times.append(ms)
+        if len(self.frame_times) == self.steady_frame:
+            print(f"Frame 1: {self.frame_times[0]:.1f} ms, frame {self.steady_frame}: {ms:.1f} ms")
+
+
+# Profiler for this run, created when main.py starts importing
+STARTUP = StartupProfiler()
+
+
+def lazy_import(name):
+    """
+    Imports a backend module on first use and records the import time in the startup profile.
+    Lets main.py import on machines without the Windows-only or capture backends.
+    """
+    module = _loaded.get(name)
+    if module is None:
+        with STARTUP.phase(f"import {name}"):
+            module = _loaded[name] = importlib.import_module(name)
+    return module
+
+_loaded = {}
+
+
+def warm_up(stages, frame, rounds=3):
+    """
+    Runs every pipeline stage on a dummy frame a few times so OpenCV's one-off costs (thread pool
+    start-up, lazy allocations, code paths being paged in) are paid before the control loop starts.
+
+    Function Args:
+    - stages: (name, function) pairs where each function takes the previous stage's output.
+    - frame: A dummy frame of the same shape as the live captures.
+    - rounds: How many times to run the whole chain.
+    """
+    for _ in range(rounds):
+        data = frame
+        for _, stage in stages:
+            data = stage(data)
@@ -0,0 +1,124 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# Rows of context each strip needs around it for Canny: one for the 3x3 Sobel and one
+# for the non-maximum suppression, which compares each pixel with its neighbours.
+CANNY_HALO = 2
+
+
+def split_rows(top, bottom, count):
+    """
+    Splits the rows [top, bottom) into at most `count` contiguous (top, bottom) strips of near-equal height.
+    """
+    bounds = np.linspace(top, bottom, min(count, bottom - top) + 1).astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class StripEdgeDetector:
+    """
+    Runs the gray -> Canny -> blur -> ROI steps of process_img in horizontal strips on a thread pool.
+    Pass smooth (see filters.smoothing) to use another filter than the Gaussian blur, and
+    filter_position="before" to smooth the gray image before Canny instead of the edges.
+
+    Each strip is processed with a halo of extra rows around it so the local filters see the same
+    neighbourhood as on the full image. Canny's hysteresis is not local though, a weak edge can be
+    kept because of a strong edge anywhere along the same chain. So every strip produces two maps,
+    the edge candidates (Canny with both thresholds at the low one) and the strong edges (both at the
+    high one), and the chains are resolved in one pass over the whole frame with connected components.
+    The blur and ROI mask are then applied strip by strip over the rows the ROI covers, so the output
+    is bit-identical to the single-threaded path.
+
+    One detector owns its buffers, so use one per thread and expect the returned image to be
+    overwritten by the next call.
+    """
+
+    def __init__(self, shape, vertices, thresholds, blur_kernel, strips=None, smooth=None, filter_position="after"):
+        height, width = shape[:2]
+        self.shape = (height, width)
+        self.thresholds = thresholds
+        self.blur_kernel = blur_kernel
+        self.smooth = smooth or (lambda image, dst=None: cv2.GaussianBlur(image, blur_kernel, 0, dst=dst))
+        self.smooth_before = filter_position == "before"
+        # Rows of context the filter needs on top of Canny's
+        self.radius = max(blur_kernel) // 2
+        strips = strips or os.cpu_count() or 1
+
+        # The ROI mask never changes, so it is drawn once instead of every frame
+        self.mask = np.zeros((height, width), np.uint8)
+        cv2.fillPoly(self.mask, [vertices], 255)
+        rows = np.flatnonzero(self.mask.any(axis=1))
+        self.band = (int(rows[0]), int(rows[-1]) + 1) if len(rows) else (0, 0)
+
+        # Preallocated buffers the strips write into
+        self.candidates = np.empty((height, width), np.uint8)
+        self.strong = np.empty((height, width), np.uint8)
+        self.labels = np.empty((height, width), np.int32)
+        self.keep = np.zeros(1, np.uint8)
+        self.output = np.zeros((height, width), np.uint8)
+
+        # Canny has to see the whole frame because of the hysteresis, the blur only the ROI rows
+        self.edge_strips = split_rows(0, height, strips)
+        self.blur_strips = split_rows(self.band[0], self.band[1], strips) if self.band[1] else []
+        self.pool = ThreadPoolExecutor(max_workers=strips)
+
+    def _edge_strip(self, image, top, bottom):
+        halo = CANNY_HALO + (self.radius if self.smooth_before else 0)
+        halo_top, halo_bottom = max(top - halo, 0), min(bottom + halo, self.shape[0])
+        inner = slice(top - halo_top, bottom - halo_top)
+        gray = cv2.cvtColor(image[halo_top:halo_bottom], cv2.COLOR_BGR2GRAY)
+        if self.smooth_before:
+            gray = self.smooth(gray)
+        low, high = self.thresholds
+        # With both thresholds equal Canny has nothing to trace, leaving just the thresholded maxima
+        self.candidates[top:bottom] = cv2.Canny(gray, low, low)[inner]
+        self.strong[top:bottom] = cv2.Canny(gray, high, high)[inner]
+
+    def _mark_strong(self, top, bottom):
+        # Every chain holding a strong edge survives the hysteresis
+        self.keep[self.labels[top:bottom][self.strong[top:bottom] > 0]] = 255
+
+    def _blur_strip(self, top, bottom):
+        radius = 0 if self.smooth_before else self.radius
+        halo_top, halo_bottom = max(top - radius, 0), min(bottom + radius, self.shape[0])
+        inner = slice(top - halo_top, bottom - halo_top)
+        # Turn the chain labels back into the final Canny edges, only for the rows this strip needs
+        edges = np.take(self.keep, self.labels[halo_top:halo_bottom], mode="clip")
+        blurred = edges if self.smooth_before else self.smooth(edges)
+        cv2.bitwise_and(blurred[inner], self.mask[top:bottom], dst=self.output[top:bottom])
+
+    def __call__(self, image):
+        """
+        Returns the blurred, ROI-masked edge image for a BGR/BGRA frame of the detector's shape.
+        """
+        if image.shape[:2] != self.shape:
+            raise ValueError(f"Frame shape {image.shape[:2]} does not match detector shape {self.shape}")
+
+        # Stage 1: gray + Canny candidates/strong edges per strip
+        list(self.pool.map(lambda rows: self._edge_strip(image, *rows), self.edge_strips))
+
+        # Stage 2: hysteresis, label the candidate chains across the whole frame and keep
+        # the ones that contain at least one strong edge
+        count, _ = cv2.connectedComponents(self.candidates, self.labels, 8, cv2.CV_32S)
+        if len(self.keep) < count:
+            self.keep = np.zeros(count, np.uint8)
+        else:
+            self.keep[:count] = 0
+        list(self.pool.map(lambda rows: self._mark_strong(*rows), self.edge_strips))
+        self.keep[0] = 0
+
+        # Stage 3: edges + blur + ROI mask per strip, rows outside the ROI are always zero
+        list(self.pool.map(lambda rows: self._blur_strip(*rows), self.blur_strips))
+        self.output[:self.band[0]] = 0
+        self.output[self.band[1]:] = 0
+        return self.output
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
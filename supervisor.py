@@ -0,0 +1,334 @@
+import os
+import sys
+import time
+import argparse
+import itertools
+import threading
+from collections import Counter, deque
+import cv2
+import numpy as np
+from main import process_img, decide, CONFIG
+from dataset import iter_frames
+from buffers import BufferArena
+from frame_skip import FrameChangeDetector
+from capture import Region, MultiRegionCapture
+
+# Workers run instances side by side, so the strip edge detector (one set of buffers shared
+# by everything using the config) is off, like in batch.py
+SUPERVISOR_CONFIG = CONFIG.updated({"strips": {"threads": 0}})
+# Latencies kept per instance for the p50/p95 in the report
+LATENCY_WINDOW = 200
+
+
+class ScreenSource:
+    """
+    Frame source for an instance that drives a game client: captures the screen region every frame
+    into the instance's capture buffers.
+
+    The capture (one open mss instance) is kept between frames. mss is tied to the thread that
+    opened it, so every worker thread that runs the instance opens its own the first time and
+    closes it when it stops (close_thread). With pinned workers that is one per instance.
+    """
+
+    def __init__(self, x, y, width, height):
+        self.region = Region("screen", x, y, width, height)
+        self.local = threading.local()
+
+    def __call__(self, buffers):
+        capture = getattr(self.local, "capture", None)
+        if capture is None:
+            capture = self.local.capture = MultiRegionCapture([self.region])
+        view = capture.grab()["screen"]
+        frame = buffers.next_capture(view.shape)
+        np.copyto(frame, view)
+        return frame
+
+    def close_thread(self):
+        # Called by a worker thread as it stops, closes the capture it opened
+        capture = getattr(self.local, "capture", None)
+        if capture is not None:
+            capture.close()
+            self.local.capture = None
+
+
+def recording_source(path, loop=False):
+    """
+    Frame source that plays a recording (see dataset.iter_frames), None once it is over.
+    """
+    frames = iter_frames(path)
+    if loop:
+        frames = itertools.chain.from_iterable(iter_frames(path) for _ in itertools.count())
+    lock = threading.Lock()
+
+    def grab(buffers):
+        with lock:
+            frame = next(frames, None)
+        if frame is None:
+            return None
+        capture = buffers.next_capture(frame.shape)
+        np.copyto(capture, frame)
+        return capture
+    return grab
+
+
+class Instance:
+    """
+    One bot driven by the supervisor: where its frames come from and how fast it has to run.
+
+    Function Args:
+    - name: Shown in the report.
+    - source: Called with the instance's BufferArena, returns the next frame or None when there are no more.
+    - fps: Target frame rate, the instance is due for a new frame every 1/fps seconds (0: as often as possible).
+    - deadline_ms: Capture-to-decision budget, frames that take longer count as missed (default: one frame period).
+    - cores: CPU cores the instance may run on, None for any. Needs pinned workers.
+    - on_result: Called with (instance, FrameResult, decision) after every frame, e.g. to press the keys.
+    - config: PipelineConfig to process the frames with.
+    """
+
+    def __init__(self, name, source, fps=30, deadline_ms=None, cores=None, on_result=None, config=None):
+        self.name = name
+        self.source = source
+        self.period = 1 / fps if fps else 0.0
+        self.deadline = (deadline_ms / 1000 if deadline_ms else self.period) or None
+        self.cores = set(cores) if cores else None
+        self.on_result = on_result
+        self.config = config or SUPERVISOR_CONFIG
+
+        # Every instance has its own buffers and frame skip state, it only ever runs on one worker at a time
+        self.buffers = BufferArena()
+        self.change_detector = FrameChangeDetector()
+        self.result = None
+        self.busy = False
+        self.finished = False
+        self.next_due = 0.0
+
+        self.frames = 0
+        self.missed = 0
+        self.decisions = Counter()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def run_frame(self):
+        # Capture, process and decide one frame. Returns False once the source has no more frames
+        start = time.perf_counter()
+        frame = self.source(self.buffers)
+        if frame is None:
+            return False
+        if self.result is None or not self.change_detector.unchanged(frame, self.config):
+            self.result = process_img(frame, draw=False, config=self.config, buffers=self.buffers)
+            self.buffers.hold(frame)
+        decision = decide(self.result.m1, self.result.m2)
+        if self.on_result is not None:
+            self.on_result(self, self.result, decision)
+
+        latency = time.perf_counter() - start
+        self.frames += 1
+        self.decisions[decision] += 1
+        self.latencies.append(latency * 1000)
+        if self.deadline is not None and latency > self.deadline:
+            self.missed += 1
+        return True
+
+
+def available_cores():
+    # The cores this process may run on
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_thread(core):
+    # Pins the calling thread to one core where the OS lets Python do that (Linux), returns whether it worked
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(0, {core})
+    except OSError:
+        return False
+    return True
+
+
+class Supervisor:
+    """
+    Runs several bot instances on one shared pool of worker threads.
+
+    Whenever a worker is free it takes the instance whose next frame is due first (earliest
+    deadline first). An instance is due again one frame period after its last frame was due, or
+    straight away if it has fallen behind, so an overloaded machine serves the instances in turn
+    instead of letting the fastest one take every worker. An instance never has more than one
+    frame in flight, so a slow frame delays that instance only.
+
+    With pin=True worker i is pinned to core i (Linux only), and an instance that lists cores
+    only runs on the workers pinned to them.
+    """
+
+    def __init__(self, instances, workers=None, pin=False):
+        self.instances = list(instances)
+        self.workers = workers or min(len(self.instances), os.cpu_count() or 1)
+        self.pin = pin
+        self.cores = available_cores()
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self.started = None
+        self._last_report = None
+        names = [instance.name for instance in self.instances]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Instance names must be unique, got {names}")
+
+    def _pick(self, core):
+        # The due instance with the earliest deadline this worker may run, or how long until the next one is due
+        now = time.perf_counter()
+        best = None
+        for instance in self.instances:
+            if instance.busy or instance.finished:
+                continue
+            # Unpinned workers (pin=False, or pinning failed) run any instance
+            if core is not None and instance.cores is not None and core not in instance.cores:
+                continue
+            if best is None or instance.next_due < best.next_due:
+                best = instance
+        if best is None:
+            return None, None
+        if best.next_due > now:
+            return None, best.next_due - now
+        return best, 0.0
+
+    def _worker(self, index):
+        core = self.cores[index % len(self.cores)] if self.pin else None
+        if core is not None and not pin_thread(core):
+            core = None
+        try:
+            self._work(core)
+        finally:
+            # Sources that keep per-thread state (ScreenSource's mss instance) release it on this thread
+            for instance in self.instances:
+                close = getattr(instance.source, "close_thread", None)
+                if close is not None:
+                    close()
+
+    def _work(self, core):
+        while not self._stop.is_set():
+            with self._condition:
+                instance, wait = self._pick(core)
+                if instance is None:
+                    if all(other.finished for other in self.instances):
+                        self._stop.set()
+                        self._condition.notify_all()
+                        return
+                    self._condition.wait(wait)
+                    continue
+                instance.busy = True
+
+            try:
+                more = instance.run_frame()
+            except Exception as e:
+                print(f"{instance.name}: {e}")
+                more = True
+
+            with self._condition:
+                instance.busy = False
+                instance.finished = not more
+                # Due one period after the last due time, but never in the past: no burst to catch up
+                instance.next_due = max(instance.next_due + instance.period, time.perf_counter())
+                self._condition.notify_all()
+
+    def start(self):
+        # Every worker runs whole frames, OpenCV's own thread pool would only oversubscribe the cores
+        cv2.setNumThreads(1)
+        self.started = self._last_report = time.perf_counter()
+        for instance in self.instances:
+            instance.next_due = self.started
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, args=(index,), name=f"supervisor-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def running(self):
+        return not self._stop.is_set()
+
+    def report(self):
+        """
+        Per-instance FPS, latency percentiles, missed deadlines and decisions since the last report.
+        """
+        now = time.perf_counter()
+        elapsed = max(now - self._last_report, 1e-9)
+        self._last_report = now
+        lines = [f"{'instance':<12} {'fps':>6} {'p50 ms':>7} {'p95 ms':>7} {'missed':>7}  decisions"]
+        for instance in self.instances:
+            with self._condition:
+                frames, missed, instance.frames, instance.missed = instance.frames, instance.missed, 0, 0
+                latencies = list(instance.latencies)
+                decisions = ", ".join(f"{decision} {count}" for decision, count in instance.decisions.most_common())
+                instance.decisions.clear()
+            p50, p95 = np.percentile(latencies, [50, 95]) if latencies else (0.0, 0.0)
+            lines.append(f"{instance.name:<12} {frames / elapsed:6.1f} {p50:7.2f} {p95:7.2f} "
+                         f"{missed / max(frames, 1):6.0%}  {decisions}")
+        return "\n".join(lines)
+
+    def run(self, duration=None, interval=1.0):
+        """
+        Starts the workers and prints the report every `interval` seconds until every instance's
+        source is done, `duration` seconds have passed or Ctrl+C is pressed.
+        """
+        self.start()
+        try:
+            while self.running():
+                self._stop.wait(interval)
+                print(self.report())
+                if duration is not None and time.perf_counter() - self.started >= duration:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def parse_region(text):
+    # "x,y,width,height" -> (x, y, width, height)
+    values = [int(value) for value in text.split(",")]
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError(f"A region is x,y,width,height, got {text!r}")
+    return tuple(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several bot instances (screen regions or recordings) "
+                                                 "on one shared worker pool. Prints decisions, presses no keys.")
+    parser.add_argument("--region", action="append", type=parse_region, default=[],
+                        help="Screen region x,y,width,height of one game client, repeat for more")
+    parser.add_argument("--recording", action="append", default=[], help="Recording to play as one instance, repeat for more")
+    parser.add_argument("--loop", action="store_true", help="Play the recordings over and over")
+    parser.add_argument("--fps", type=float, default=30, help="Target frame rate of every instance (0: as fast as possible)")
+    parser.add_argument("--deadline-ms", type=float, help="Capture-to-decision budget per frame (default: one frame period)")
+    parser.add_argument("--workers", type=int, help="Worker threads shared by all instances (default: one per instance, up to the cores)")
+    parser.add_argument("--pin", action="store_true", help="Pin worker i to core i and spread the instances over those cores (Linux)")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    args = parser.parse_args()
+
+    sources = [(f"screen{i}", ScreenSource(*region)) for i, region in enumerate(args.region)]
+    sources += [(f"rec{i}", recording_source(path, args.loop)) for i, path in enumerate(args.recording)]
+    if not sources:
+        parser.error("give at least one --region or --recording")
+
+    cores = available_cores()
+    workers = args.workers or min(len(sources), len(cores))
+    instances = []
+    for i, (name, source) in enumerate(sources):
+        # Worker i is pinned to cores[i], spread the instances over the pinned workers' cores
+        instance_cores = [cores[(i % workers) % len(cores)]] if args.pin else None
+        instances.append(Instance(name, source, args.fps, args.deadline_ms, instance_cores))
+    if args.pin and not hasattr(os, "sched_setaffinity"):
+        print("Core pinning is not supported on this platform, running unpinned", file=sys.stderr)
+    Supervisor(instances, workers, pin=args.pin).run(args.duration)
+
+
+if __name__ == "__main__":
+    main()
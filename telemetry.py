@@ -0,0 +1,279 @@
+import os
+import math
+import time
+import socket
+import struct
+import argparse
+from collections import Counter, deque
+import cv2
+import numpy as np
+
+# Bumped whenever the record layout changes, consumers skip records of other versions
+VERSION = 2
+DEFAULT_ADDRESS = "udp://127.0.0.1:9870"
+DECISIONS = ("straight", "left", "right")
+# Stage timings carried by every record, in this order. Stages that didn't run are NaN.
+STAGES = ("gray", "canny", "blur", "roi", "edges", "lines", "lanes", "birdseye")
+
+# One record per frame, little-endian, 88 bytes:
+#   version, decision index, flags (bit 0: lanes found, bit 1: result reused by frame skip),
+#   quality level (see governor.py),
+#   frame number, time.time() the result was computed at,
+#   m1, m2, curvature (NaN if unknown), confidence,
+#   both lanes' endpoints (x1, y1, x2, y2, top to bottom), stage timings in ms,
+#   records dropped by the publisher so far, frames skipped by frame_skip.py so far
+RECORD = struct.Struct(f"<BBBBId4f8h{len(STAGES)}fII")
+FLAG_LANES = 1
+FLAG_REUSED = 2
+# Range of the int16 endpoint fields. Lanes extended to the horizon can end far outside the frame
+# (a nearly flat one at x in the millions), their endpoints are clipped to it.
+ENDPOINT_MIN, ENDPOINT_MAX = -32768, 32767
+
+
+def open_socket(address):
+    """
+    A datagram socket and its destination for "udp://host:port" or "unix:///path/to.sock".
+    """
+    if address.startswith("udp://"):
+        host, port = address[len("udp://"):].rsplit(":", 1)
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM), (host, int(port))
+    if address.startswith("unix://"):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix sockets are not available on this platform, use udp://")
+        return socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM), address[len("unix://"):]
+    raise ValueError(f"Telemetry address must start with udp:// or unix://, got {address!r}")
+
+
+def add_telemetry_argument(parser):
+    # --telemetry [ADDRESS] for an entry point's argument parser
+    parser.add_argument("--telemetry", nargs="?", const=DEFAULT_ADDRESS, metavar="ADDRESS",
+                        help=f"Publish a binary record per frame to udp://host:port or unix:///path "
+                             f"(default {DEFAULT_ADDRESS}), read it with telemetry.py")
+
+
+def publisher_from_args(args):
+    # TelemetryPublisher for the parsed arguments, None when --telemetry wasn't given
+    return TelemetryPublisher(args.telemetry) if args.telemetry else None
+
+
+def lane_endpoints(lane):
+    # (x1, y1, x2, y2) of a lane, the ends of the polyline for a curve
+    if lane.coords is not None:
+        return lane.coords
+    (x1, y1), (x2, y2) = lane.points[0], lane.points[-1]
+    return x1, y1, x2, y2
+
+
+class TelemetryPublisher:
+    """
+    Sends one fixed-size binary record (see RECORD) per frame to a local socket.
+
+    The socket is non-blocking and a record that can't be sent right away (buffer full, nobody
+    listening) is dropped and counted, so publishing never holds up the control loop. Records
+    are packed into one preallocated buffer.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self.address = address
+        self.sock, self.destination = open_socket(address)
+        self.sock.setblocking(False)
+        self.buffer = bytearray(RECORD.size)
+        self.frames = 0
+        self.sent = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    def publish(self, result, decision, skipped=False):
+        """
+        Sends the record of one frame.
+
+        Function Args:
+        - result: The frame's FrameResult (the previous one for a skipped frame).
+        - decision: The steering decision taken, one of DECISIONS.
+        - skipped: The frame was skipped by frame_skip.py and reused the previous result.
+        """
+        self.frames += 1
+        self.skipped += skipped
+        endpoints = [0] * 8
+        flags = 0
+        if len(result.lanes) == 2:
+            flags |= FLAG_LANES
+            endpoints = [min(max(int(value), ENDPOINT_MIN), ENDPOINT_MAX)
+                         for lane in result.lanes for value in lane_endpoints(lane)]
+        if skipped:
+            flags |= FLAG_REUSED
+        stage_ms = result.stage_ms
+        timings = [stage_ms.get(stage, math.nan) for stage in STAGES]
+        curvature = math.nan if result.curvature is None else result.curvature
+        try:
+            RECORD.pack_into(self.buffer, 0, VERSION, DECISIONS.index(decision), flags, result.quality,
+                             self.frames & 0xFFFFFFFF,
+                             result.timestamp, result.m1, result.m2, curvature, result.confidence,
+                             *endpoints, *timings, self.dropped & 0xFFFFFFFF, self.skipped & 0xFFFFFFFF)
+        except struct.error:
+            # A value that doesn't fit its field, losing the record mustn't stop the control loop
+            self.dropped += 1
+            return
+        try:
+            self.sock.sendto(self.buffer, self.destination)
+            self.sent += 1
+        except OSError:
+            # BlockingIOError when the socket buffer is full, refused/missing for a Unix socket nobody listens on
+            self.dropped += 1
+
+    def close(self):
+        self.sock.close()
+
+
+def unpack(data):
+    """
+    The fields of one record as a dict, None for records of another version or size.
+    """
+    if len(data) != RECORD.size or data[0] != VERSION:
+        return None
+    values = RECORD.unpack(data)
+    _, decision, flags, quality, frame, timestamp, m1, m2, curvature, confidence = values[:10]
+    endpoints = values[10:18]
+    timings = values[18:18 + len(STAGES)]
+    dropped, skipped = values[18 + len(STAGES):]
+    return {
+        "frame": frame, "timestamp": timestamp, "decision": DECISIONS[decision], "lanes": bool(flags & FLAG_LANES),
+        "reused": bool(flags & FLAG_REUSED), "quality": quality,
+        "m1": m1, "m2": m2, "curvature": curvature, "confidence": confidence,
+        "lane1": endpoints[:4], "lane2": endpoints[4:],
+        "stage_ms": {stage: ms for stage, ms in zip(STAGES, timings) if not math.isnan(ms)},
+        "dropped": dropped, "skipped": skipped,
+    }
+
+
+def listen(address):
+    # Binds to the publishers' address and yields the records as dicts, a None every 0.1 s without data
+    sock, destination = open_socket(address)
+    if isinstance(destination, str) and os.path.exists(destination):
+        os.remove(destination)
+    sock.bind(destination)
+    sock.settimeout(0.1)
+    try:
+        while True:
+            try:
+                data = sock.recv(RECORD.size + 1)
+            except socket.timeout:
+                yield None
+                continue
+            record = unpack(data)
+            if record is not None:
+                yield record
+    finally:
+        sock.close()
+        if isinstance(destination, str) and os.path.exists(destination):
+            os.remove(destination)
+
+
+class Aggregate:
+    """
+    Sums the records received over an interval: frame rate, lanes found, decisions, latency
+    per stage, frames lost between publisher and consumer and the publisher's own drops.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.records = []
+        self.decisions = Counter()
+
+    def add(self, record):
+        self.records.append(record)
+        self.decisions[record["decision"]] += 1
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        records = self.records
+        if not records:
+            return "no telemetry"
+        frames = [record["frame"] for record in records]
+        # Frame numbers the publisher sent that never arrived here
+        lost = max(frames[-1] - frames[0] + 1 - len(records), 0)
+        lanes = sum(record["lanes"] for record in records) / len(records)
+        stages = {}
+        for record in records:
+            for stage, ms in record["stage_ms"].items():
+                stages.setdefault(stage, []).append(ms)
+        timings = ", ".join(f"{stage} {np.percentile(ms, 50):.2f}/{np.percentile(ms, 95):.2f}"
+                            for stage, ms in stages.items())
+        decisions = ", ".join(f"{decision} {count}" for decision, count in self.decisions.most_common())
+        last = records[-1]
+        return (f"{len(records) / elapsed:6.1f} fps, lanes {lanes:.0%}, {decisions} | p50/p95 ms: {timings} | "
+                f"lost {lost}, dropped {last['dropped']}, skipped {last['skipped']}, quality level {last['quality']}")
+
+
+class LivePlot:
+    """
+    A scrolling OpenCV window with m1/m2 (top) and the total stage time of each frame (bottom).
+    """
+
+    def __init__(self, length=300, height=300, max_ms=30.0, fps=30):
+        self.interval = 1 / fps
+        self.last_draw = 0.0
+        self.slopes = deque(maxlen=length)
+        self.times = deque(maxlen=length)
+        self.length = length
+        self.height = height
+        self.max_ms = max_ms
+
+    def add(self, record):
+        self.slopes.append((record["m1"], record["m2"]))
+        self.times.append(sum(record["stage_ms"].values()))
+
+    def draw(self):
+        # Redraws at most fps times a second, returns False once ESC is pressed in the window
+        if time.perf_counter() - self.last_draw < self.interval:
+            return True
+        self.last_draw = time.perf_counter()
+        half = self.height // 2
+        image = np.zeros((self.height, self.length, 3), np.uint8)
+        cv2.line(image, (0, half // 2), (self.length, half // 2), (80, 80, 80), 1)
+        cv2.line(image, (0, half), (self.length, half), (255, 255, 255), 1)
+        if self.slopes:
+            xs = np.arange(len(self.slopes))
+            slopes = np.clip(np.array(self.slopes), -2, 2)
+            for column, color in ((0, (0, 255, 255)), (1, (255, 0, 255))):
+                ys = (half // 2 - slopes[:, column] * half / 4).astype(np.int32)
+                cv2.polylines(image, [np.stack([xs, ys], axis=1).astype(np.int32)], False, color, 1)
+            ys = (self.height - 1 - np.clip(np.array(self.times) / self.max_ms, 0, 1) * (half - 2)).astype(np.int32)
+            cv2.polylines(image, [np.stack([xs, ys], axis=1).astype(np.int32)], False, (0, 255, 0), 1)
+        cv2.putText(image, "m1 / m2", (4, 14), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+        cv2.putText(image, f"frame ms (0-{self.max_ms:.0f})", (4, half + 14), cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                    (255, 255, 255), 1)
+        cv2.imshow("Telemetry", image)
+        return cv2.waitKey(1) != 27
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive the bot's telemetry (--telemetry) and summarise it every second.")
+    parser.add_argument("address", nargs="?", default=DEFAULT_ADDRESS, help=f"udp://host:port or unix:///path (default {DEFAULT_ADDRESS})")
+    parser.add_argument("--plot", action="store_true", help="Also plot the slopes and frame times live in a window")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between summaries")
+    args = parser.parse_args()
+
+    aggregate = Aggregate()
+    plot = LivePlot() if args.plot else None
+    print(f"Listening on {args.address}")
+    try:
+        for record in listen(args.address):
+            if record is not None:
+                aggregate.add(record)
+                if plot is not None:
+                    plot.add(record)
+            if plot is not None and not plot.draw():
+                break
+            if time.perf_counter() - aggregate.start >= args.interval:
+                print(aggregate.report())
+                aggregate.reset()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()